@@ -0,0 +1,91 @@
+import asyncio
+import importlib.util
+import threading
+
+from flask import current_app, g
+from sqlalchemy.engine import make_url
+
+import pools
+from models import db
+
+# What ASYNC_VIEWS=1 buys, and what it does not. The independent SELECTs of
+# one request run concurrently, which shortens it when each query waits on
+# the network (Postgres, replicas); on SQLite it is slower than the sync
+# views. The queries of every request in the process share one event loop,
+# run by a thread of its own, and pooled connections sized like DB_POOL_*.
+# The worker thread still waits for its view, so how many requests a worker
+# serves at once is set by the server's threads, as with the sync views.
+#
+# Like the Redis cache, the packages are only needed when used; see
+# requirements-optional.txt. check_requirements() refuses to start without
+# them rather than failing the first request.
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+ASYNC_PACKAGES = ['asgiref', 'greenlet']
+
+_engines = {}
+_loop = None
+_lock = threading.Lock()
+
+
+def check_requirements(app):
+    """ Raises RuntimeError naming the packages ASYNC_VIEWS is missing for
+    the configured databases."""
+    urls = [app.config['SQLALCHEMY_DATABASE_URI']] + [
+        bind['url'] for bind in app.config['SQLALCHEMY_BINDS'].values()]
+    needed = ASYNC_PACKAGES + sorted({ASYNC_DRIVERS[make_url(url).get_backend_name()]
+                                      for url in urls})
+    missing = [name for name in needed if importlib.util.find_spec(name) is None]
+    if missing:
+        raise RuntimeError('ASYNC_VIEWS=1 needs {} installed; see requirements-optional.txt'
+                           .format(', '.join(missing)))
+
+
+def _run(coroutine):
+    """ Runs `coroutine` on the process's query loop, started on first use,
+    and returns an awaitable for its result. Flask runs every async view on
+    a new event loop, which pooled connections could not outlive."""
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='aio-queries',
+                             daemon=True).start()
+    return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, _loop))
+
+
+def _engine(key):
+    """ An async engine on the same database as the sync bind `key`, with
+    its DB_POOL_* and DB_PGBOUNCER settings. Its pool is reported on
+    /metrics as async_<bind>."""
+    with _lock:
+        engine = _engines.get(key)
+        if engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+            url = db.engines[key].url
+            url = url.set(drivername='{}+{}'.format(
+                url.get_backend_name(), ASYNC_DRIVERS[url.get_backend_name()]))
+            options = pools.engine_options(url, current_app.config)
+            if options.get('poolclass') is pools.TimedQueuePool:
+                options['poolclass'] = pools.TimedAsyncQueuePool
+            engine = _engines[key] = create_async_engine(url, **options)
+            pools.register(current_app._get_current_object(),
+                           'async_' + (key or 'primary'), engine.sync_engine)
+    return engine
+
+
+async def fetch_all(*queries):
+    """ Runs independent SELECTs concurrently, each on its own pooled
+    connection to the request's replica or the primary, and returns their
+    rows in order."""
+    engine = _engine(g.get('_replica'))
+    statements = [getattr(query, 'statement', query) for query in queries]
+
+    async def fetch(statement):
+        async with engine.connect() as connection:
+            result = await connection.execute(statement)
+            return result.all()
+
+    async def fetch_each():
+        return await asyncio.gather(*[fetch(statement) for statement in statements])
+
+    return await _run(fetch_each())
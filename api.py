@@ -0,0 +1,166 @@
+import hashlib
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, request, \
+    stream_with_context
+from sqlalchemy import func
+
+import geo
+import queries
+from models import db, Venue, Artist, performances
+from pagination import export, paginate
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+
+def etag_for(*parts):
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def json_response(etag, build):
+    """ Answers 304 when the client already holds `etag`; only otherwise is
+    the payload built and serialized."""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(json.dumps(build(), separators=(',', ':'),
+                                       default=_default),
+                            mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+
+def _page_response(kind, page, version_of):
+    etag = etag_for(kind, [version_of(row) for row in page.items],
+                    page.next_cursor, page.prev_cursor)
+    return json_response(etag, lambda: {
+        'data': [dict(row._mapping) for row in page.items],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+#  Lists
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+def venues():
+    query = queries.venue_list_query(request.args.get('state'),
+                                     request.args.get('genre'))
+    page = paginate(query, queries.VENUE_LIST_ORDER, request.args.get('cursor'),
+                    current_app.config['LIST_PAGE_SIZE'])
+    return _page_response('venues', page,
+                          lambda row: (row.id, row.version, row.upcoming_shows))
+
+
+@api.route('/artists')
+def artists():
+    query = queries.artist_list_query(request.args.get('state'),
+                                      request.args.get('genre'))
+    page = paginate(query, queries.ARTIST_LIST_ORDER, request.args.get('cursor'),
+                    current_app.config['LIST_PAGE_SIZE'])
+    return _page_response('artists', page, lambda row: (row.id, row.version))
+
+
+@api.route('/shows')
+def shows():
+    page = paginate(queries.show_list_query(), queries.SHOW_LIST_ORDER,
+                    request.args.get('cursor'), current_app.config['LIST_PAGE_SIZE'])
+    return _page_response('shows', page, lambda row: (
+        row.id, row.venue_version, row.artist_version))
+
+
+@api.route('/venues/nearby')
+def nearby_venues():
+    try:
+        latitude, longitude, radius, limit = geo.search_params(
+            request.args, current_app.config['NEARBY_LIMIT'],
+            current_app.config['LIST_PAGE_SIZE'])
+    except (KeyError, ValueError):
+        return Response(json.dumps({'error': 'lat and lon are required; radius (km) and k are optional'}),
+                        status=400, mimetype='application/json')
+    return Response(json.dumps({'data': queries.nearby_venues(
+        latitude, longitude, radius, limit)}), mimetype='application/json')
+
+
+@api.route('/shows/export')
+def export_shows():
+    """ Every show as newline-delimited JSON, streamed in chunks."""
+    def lines():
+        for rows in export(queries.show_list_query(), queries.SHOW_LIST_ORDER,
+                           current_app.config['EXPORT_CHUNK_SIZE']):
+            yield ''.join(json.dumps(dict(row._mapping), separators=(',', ':'),
+                                     default=_default) + '\n' for row in rows)
+    return Response(stream_with_context(lines()), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': 'attachment; filename=shows.ndjson'})
+
+
+#  Details
+#  ----------------------------------------------------------------
+
+def _fingerprint(model, other, own_column, other_column, entity_id):
+    """ One aggregate over the entity's shows that changes whenever its
+    detail payload would: its own version, its show set, the upcoming/past
+    split and the versions of everyone it shares a show with."""
+    row = db.session.query(
+        model.version,
+        func.count(performances.c.id),
+        func.max(performances.c.id),
+        func.count(performances.c.id).filter(
+            performances.c.start_time > datetime.now()),
+        func.sum(other.version))\
+        .outerjoin(performances, own_column == model.id)\
+        .outerjoin(other, other_column == other.id)\
+        .filter(model.id == entity_id).group_by(model.id).first()
+    if row is None:
+        abort(404)
+    return tuple(row)
+
+
+@api.route('/venues/<int:venue_id>')
+def show_venue(venue_id):
+    etag = etag_for('venue', venue_id, _fingerprint(
+        Venue, Artist, performances.c.venue_id, performances.c.artist_id, venue_id))
+    return json_response(etag, lambda: queries.venue_details(venue_id))
+
+
+@api.route('/artists/<int:artist_id>')
+def show_artist(artist_id):
+    etag = etag_for('artist', artist_id, _fingerprint(
+        Artist, Venue, performances.c.artist_id, performances.c.venue_id, artist_id))
+    return json_response(etag, lambda: queries.artist_details(artist_id))
+
+
+def _past_shows_response(kind, entity_id, page):
+    if page is None:
+        abort(404)
+    shows, next_cursor = page
+    payload = {'data': shows, 'next_cursor': next_cursor}
+    return json_response(etag_for(kind, entity_id, shows, next_cursor),
+                         lambda: payload)
+
+
+@api.route('/venues/<int:venue_id>/past_shows')
+def venue_past_shows(venue_id):
+    return _past_shows_response('venue_past_shows', venue_id, queries.venue_past_shows(
+        venue_id, request.args.get('cursor')))
+
+
+@api.route('/artists/<int:artist_id>/past_shows')
+def artist_past_shows(artist_id):
+    return _past_shows_response('artist_past_shows', artist_id, queries.artist_past_shows(
+        artist_id, request.args.get('cursor')))
+
+
+@api.errorhandler(404)
+def not_found_error(error):
+    return Response(json.dumps({'error': 'not found'}), status=404,
+                    mimetype='application/json')
@@ -1,24 +1,48 @@
 # ----------------------------------------------------------------------------#
 # Imports
 # ----------------------------------------------------------------------------#
-import dateutil.parser
-import babel
-import babel.dates
+import click
 from flask import Flask, \
     render_template, \
+    stream_template, \
     request, \
     flash, \
     redirect, \
-    url_for
+    url_for, \
+    abort, \
+    jsonify, \
+    after_this_request, \
+    Response
 from flask_migrate import Migrate
+from werkzeug.datastructures import MultiDict
+from markupsafe import Markup
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
-import logging
-from logging import Formatter, FileHandler
-from sqlalchemy import String, cast, func, or_
+from functools import partial
+from itertools import groupby
+from sqlalchemy.orm.exc import StaleDataError
 from datetime import datetime
 from models import createApp, Venue, Artist, performances
-from forms import ArtistForm, ShowForm, VenueForm
+from enums import State
+from forms import ArtistForm, ShowBatchForm, ShowForm, VenueForm
+from filters import format_datetime
+import search
+from pagination import page_query, paginate, stream, to_page
+from cache import createCache, fragment_ttl, venue_key, artist_key
+import bookings
+import bulk_import
+import query_plans
+import aio
+import facets
+import geo
+import partitions
+import queries
+import recommendations
+import rollups
+from api import api
+import metrics
+from logs import createLogging
+from replicas import createReplicas
 # ----------------------------------------------------------------------------#
 # App Config.
 # ----------------------------------------------------------------------------#
@@ -26,18 +50,74 @@ from forms import ArtistForm, ShowForm, VenueForm
 app = Flask(__name__)
 moment = Moment(app)
 db = createApp(app)
+createLogging(app)
+cache = createCache(app)
+metrics.createMetrics(app)
+createReplicas(app)
+app.register_blueprint(api)
+app.jinja_env.filters['datetime'] = format_datetime
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+def fragment_versions(model, entity_ids):
+    if not entity_ids:
+        return []
+    return db.session.query(model.id, model.version)\
+        .filter(model.id.in_(entity_ids)).all()
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+def invalidate_venues(*venue_ids):
+    # Edits retire fragments by bumping the version; this is for the
+    # changes that do not, such as new shows.
+    cache.delete(*[venue_key(row.id, app.config['CACHE_VERSION'], row.version)
+                   for row in fragment_versions(Venue, set(venue_ids))])
+
+
+def invalidate_artists(*artist_ids):
+    cache.delete(*[artist_key(row.id, app.config['CACHE_VERSION'], row.version)
+                   for row in fragment_versions(Artist, set(artist_ids))])
+
+
+def refresh_similar(artist_ids):
+    """ Refreshes the similar artists of `artist_ids`, whose change has
+    committed, once the response has been sent: the recompute takes longer
+    than the write itself. A failure is logged, as the change stands; the
+    lists catch up at the next refresh or `flask rebuild-recommendations`."""
+    artist_ids = set(artist_ids)
+
+    @after_this_request
+    def schedule_refresh(response):
+        response.call_on_close(partial(_refresh_similar, artist_ids))
+        return response
+
+
+def _refresh_similar(artist_ids):
+    with app.app_context():
+        try:
+            similar = recommendations.refresh(artist_ids)
+        except Exception:
+            app.logger.exception('Similar artists of %s could not be refreshed',
+                                 sorted(artist_ids))
+            return
+        invalidate_artists(*similar)
+
+
+def fragment_key(model, key, entity_id):
+    """ The cache key of the entity's detail fragment; 404 if there is no
+    such entity."""
+    version = db.session.query(model.version).filter(model.id == entity_id).scalar()
+    if version is None:
+        abort(404)
+    return key(entity_id, app.config['CACHE_VERSION'], version)
+
+
+def venues_of_artist(artist_id):
+    return [row.venue_id for row in db.session.query(performances.c.venue_id)
+            .filter(performances.c.artist_id == artist_id).distinct()]
+
+
+def artists_of_venue(venue_id):
+    return [row.artist_id for row in db.session.query(performances.c.artist_id)
+            .filter(performances.c.venue_id == venue_id).distinct()]
 
 # ----------------------------------------------------------------------------#
 # Controllers.
@@ -49,47 +129,75 @@ def index():
     return render_template('pages/home.html')
 
 
+@app.route('/autocomplete')
+def autocomplete():
+    kind = request.args.get('type') or None
+    if kind not in (None, 'venue', 'artist'):
+        abort(400)
+    suggestions = search.autocomplete(request.args.get('q', ''),
+                                      app.config['AUTOCOMPLETE_LIMIT'], kind)
+    return jsonify(data=[{
+        'type': kind,
+        'id': entity_id,
+        'name': name,
+        'city': city,
+        'state': state,
+        'num_upcoming_shows': upcoming,
+        'url': url_for('show_' + kind, **{kind + '_id': entity_id}),
+    } for kind, entity_id, name, city, state, upcoming in suggestions])
+
+
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
 def venues():
-    data_venues = db.session.query(Venue.id,
-                                   Venue.name,
-                                   Venue.city,
-                                   Venue.state,
-                                   func.count(performances.c.id).filter(
-                                       performances.c.start_time > datetime.now())
-                                   .label('upcoming_shows')).outerjoin(performances, performances.c.venue_id == Venue.id).group_by(Venue.id).all()
-    places = db.session.query(Venue.city, Venue.state).group_by(
-        Venue.city, Venue.state).all()
-    data = []
-    for i in places:
-        venues = [ve for ve in data_venues if ve.city ==
-                  i.city and ve.state == i.state]
-        data_formated = {
-            "city": i.city,
-            "state": i.state,
-            "venues": venues
-        }
-        data.append(data_formated)
-    return render_template('pages/venues.html', areas=data)
+    state = request.args.get('state')
+    genre = request.args.get('genre')
+    query = queries.venue_list_query(state, genre)
+    page = stream(query, queries.VENUE_LIST_ORDER,
+                  request.args.get('cursor'), app.config['LIST_PAGE_SIZE'])
+    return stream_template('pages/venues.html', areas=venue_areas(page), page=page,
+                           facets=facets.facet_counts(Venue, state, genre))
+
+
+def venue_areas(venues):
+    # Rows arrive ordered by area, so one pass groups them.
+    return ({
+        "city": city,
+        "state": state,
+        "venues": list(venues)
+    } for (state, city), venues in groupby(venues, key=lambda ve: (ve.state, ve.city)))
+
+
+@app.route('/venues/nearby')
+def nearby_venues():
+    venues = None
+    if 'lat' in request.args:
+        try:
+            latitude, longitude, radius, limit = geo.search_params(
+                request.args, app.config['NEARBY_LIMIT'], app.config['LIST_PAGE_SIZE'])
+            venues = queries.nearby_venues(latitude, longitude, radius, limit)
+        except (KeyError, ValueError):
+            flash('Enter a latitude, a longitude and optionally a radius in km.')
+    return render_template('pages/venues_nearby.html', venues=venues)
 
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
     search_term = request.form.get('search_term', '')
-    venues = Venue.query.filter(or_(Venue.name.ilike(f'%{search_term}%'), Venue.city.ilike(
-        f'%{search_term}%'), Venue.state.ilike(f'%{search_term}%'))).all()
-    upcoming_show = db.session.query(performances.c.venue_id, func.count(performances.c.id).label('num_upcoming_shows'))\
-        .filter(performances.c.start_time > datetime.now())\
-        .group_by(performances.c.venue_id).all()
+    page = max(request.form.get('page', 1, type=int), 1)
+    total, venues = search.search(Venue, search_term, page,
+                                  app.config['SEARCH_PAGE_SIZE'])
     response = {
         "count": len(venues),
+        "total": total,
+        "page": page,
+        "pages": -(-total // app.config['SEARCH_PAGE_SIZE']),
         "data": [{
             "id": venue.id,
             "name": venue.name,
-            "num_upcoming_shows": [x.num_upcoming_shows for x in upcoming_show if x.venue_id == venue.id],
+            "num_upcoming_shows": venue.num_upcoming_shows,
         } for venue in venues]
     }
     return render_template('pages/search_venues.html', results=response, search_term=search_term)
@@ -97,46 +205,34 @@ def search_venues():
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-    venue = Venue.query.get(venue_id)
-
-    venue_data = {
-        'id': venue.id,
-        'name': venue.name,
-        'genres': venue.genres,
-        'address': venue.address,
-        'city': venue.city,
-        'state': venue.state,
-        'phone': venue.phone,
-        'website': venue.website,
-        'facebook_link': venue.facebook_link,
-        'seeking_talent': venue.seeking_talent,
-        'seeking_description': venue.seeking_description,
-        'image_link': venue.image_link,
+    key = fragment_key(Venue, venue_key, venue_id)
+    page = cache.get(key)
+    if page is None:
+        venue_data = queries.venue_details(venue_id)
+        page = render_venue(venue_data)
+        cache.set(key, page, fragment_ttl(venue_data, app.config['CACHE_TTL']))
+    return render_template('pages/show_venue.html', name=page['name'],
+                           fragment=Markup(page['fragment']))
+
+
+def render_venue(venue_data):
+    if venue_data is None:
+        abort(404)
+    return {
+        'name': venue_data['name'],
+        'fragment': render_template('fragments/show_venue.html', venue=venue_data)
     }
 
-    show_query = db.session.query(performances, Artist.name.label('name'),
-                                  Artist.image_link.label('image_link')).join(Artist, performances.c.artist_id == Artist.id).filter(
-        performances.c.venue_id == venue_id).all()
-
-    upcoming_shows = []
-    past_shows = []
-    for show in show_query:
-        show_data = {
-            'artist_id': show.artist_id,
-            'artist_name': show.name,
-            'artist_image_link': show.image_link,
-            'start_time': str(show.start_time)
-        }
-        if show.start_time > datetime.now():
-            upcoming_shows.append(show_data)
-        else:
-            past_shows.append(show_data)
-
-    venue_data['upcoming_shows'] = upcoming_shows
-    venue_data['upcoming_shows_count'] = len(upcoming_shows)
-    venue_data['past_shows'] = past_shows
-    venue_data['past_shows_count'] = len(past_shows)
-    return render_template('pages/show_venue.html', venue=venue_data)
+
+@app.route('/venues/<int:venue_id>/past-shows')
+def venue_past_shows(venue_id):
+    page = queries.venue_past_shows(venue_id, request.args.get('cursor'))
+    if page is None:
+        abort(404)
+    shows, cursor = page
+    more_url = cursor and url_for('venue_past_shows', venue_id=venue_id, cursor=cursor)
+    return render_template('fragments/show_tiles.html', shows=shows, other='artist',
+                           more_url=more_url)
 
 #  Create Venue
 #  ----------------------------------------------------------------
@@ -165,14 +261,16 @@ def create_venue_submission():
                 website=request.form["website_link"],
                 seeking_talent=True if "seeking_talent" in request.form else False,
                 seeking_description=request.form["seeking_description"],
+                latitude=form.latitude.data,
+                longitude=form.longitude.data,
             )
             db.session.add(new_venue)
             db.session.commit()
             flash('Venue ' + request.form['name'] +
                   ' was successfully listed!')
-        except Exception as exception:
+        except Exception:
             db.session.rollback()
-            print(exception)
+            app.logger.exception('Venue could not be listed')
             flash('An error occurred. Venue ' +
                   request.form['name'] + ' could not be listed.')
         finally:
@@ -187,12 +285,26 @@ def create_venue_submission():
 @app.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
     try:
-        venue = Venue.query.filter_by(id=venue_id).delete()
+        artist_ids = artists_of_venue(venue_id)
+        venue = db.session.query(Venue.state, Venue.genres).filter_by(
+            id=venue_id).first()
+        rollups.remove_venue(db.session.connection(), venue_id)
+        # Show has no ON DELETE CASCADE: remove the venue's shows with it so
+        # none are left behind for the rollups and recommendations to miss.
+        db.session.execute(performances.delete()
+                           .where(performances.c.venue_id == venue_id))
+        if Venue.query.filter_by(id=venue_id).delete():
+            # Bulk deletes skip the mapper events that keep facets current.
+            facets.record(db.session.connection(), Venue,
+                          venue.state, venue.genres, -1)
         db.session.commit()
+        invalidate_venues(venue_id)
+        invalidate_artists(*artist_ids)
+        refresh_similar(artist_ids)
         flash('Venue was successfully deleted!')
-    except Exception as ex:
+    except Exception:
         db.session.rollback()
-        print(ex)
+        app.logger.exception('Venue %s could not be deleted', venue_id)
         flash('An error occurred. Venue could not be deleted.')
     finally:
         db.session.close()
@@ -204,73 +316,66 @@ def delete_venue(venue_id):
 
 @app.route('/artists')
 def artists():
-    data = db.session.query(Artist)
-    print(data)
-    return render_template('pages/artists.html', artists=data)
+    state = request.args.get('state')
+    genre = request.args.get('genre')
+    query = queries.artist_list_query(state, genre)
+    page = paginate(query, queries.ARTIST_LIST_ORDER,
+                    request.args.get('cursor'), app.config['LIST_PAGE_SIZE'])
+    return render_template('pages/artists.html', artists=page, page=page,
+                           facets=facets.facet_counts(Artist, state, genre))
 
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
     search_term = request.form.get('search_term', '')
-    artists = Artist.query.filter(or_(Artist.name.ilike(f'%{search_term}%'), Artist.city.ilike(
-        f'%{search_term}%'), Artist.state.ilike(f'%{search_term}%'))).all()
-    upcoming_show = db.session.query(performances.c.artist_id, func.count(performances.c.id).label('num_upcoming_shows'))\
-        .filter(performances.c.start_time > datetime.now())\
-        .group_by(performances.c.artist_id).all()
+    page = max(request.form.get('page', 1, type=int), 1)
+    total, artists = search.search(Artist, search_term, page,
+                                   app.config['SEARCH_PAGE_SIZE'])
     response = {
         "count": len(artists),
+        "total": total,
+        "page": page,
+        "pages": -(-total // app.config['SEARCH_PAGE_SIZE']),
         "data": [{
             "id": artist.id,
             "name": artist.name,
-            "num_upcoming_shows": [x.num_upcoming_shows for x in upcoming_show if x.artist_id == artist.id],
+            "num_upcoming_shows": artist.num_upcoming_shows,
         } for artist in artists]
     }
-    return render_template('pages/search_venues.html', results=response, search_term=search_term)
+    return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-
-    artist = Artist.query.get(artist_id)
-
-    artist_data = {
-        "id": artist.id,
-        "name": artist.name,
-        "genres": artist.genres,
-        "city": artist.city,
-        "state": artist.state,
-        "phone": artist.phone,
-        "seeking_venue": artist.seeking_venue,
-        "image_link": artist.image_link,
+    key = fragment_key(Artist, artist_key, artist_id)
+    page = cache.get(key)
+    if page is None:
+        artist_data = queries.artist_details(artist_id)
+        page = render_artist(artist_data)
+        cache.set(key, page, fragment_ttl(artist_data, app.config['CACHE_TTL']))
+    return render_template('pages/show_artist.html', name=page['name'],
+                           fragment=Markup(page['fragment']))
+
+
+def render_artist(artist_data):
+    if artist_data is None:
+        abort(404)
+    artist_data['similar_artists'] = recommendations.similar_artists(artist_data['id'])
+    return {
+        'name': artist_data['name'],
+        'fragment': render_template('fragments/show_artist.html', artist=artist_data)
     }
 
-    print("artist.genres ===> ", artist.genres)
-
-    show_query = db.session.query(performances, Venue.name.label('name'),
-                                  Venue.image_link.label('image_link')).join(Venue, performances.c.venue_id == Venue.id).filter(
-        performances.c.artist_id == artist_id).all()
-
-    print(show_query)
-    upcoming_shows = []
-    past_shows = []
-    for show in show_query:
-        show_data = {
-            "venue_id": show.venue_id,
-            "venue_name": show.name,
-            "venue_image_link": show.image_link,
-            "start_time": str(show.start_time)
-        }
-        if show.start_time > datetime.now():
-            upcoming_shows.append(show_data)
-        else:
-            past_shows.append(show_data)
-
-    artist_data['upcoming_shows'] = upcoming_shows
-    artist_data['upcoming_shows_count'] = len(upcoming_shows)
-    artist_data['past_shows'] = past_shows
-    artist_data['past_shows_count'] = len(past_shows)
-
-    return render_template('pages/show_artist.html', artist=artist_data)
+
+@app.route('/artists/<int:artist_id>/past-shows')
+def artist_past_shows(artist_id):
+    page = queries.artist_past_shows(artist_id, request.args.get('cursor'))
+    if page is None:
+        abort(404)
+    shows, cursor = page
+    more_url = cursor and url_for('artist_past_shows', artist_id=artist_id, cursor=cursor)
+    return render_template('fragments/show_tiles.html', shows=shows, other='venue',
+                           more_url=more_url)
 
 #  Update
 #  ----------------------------------------------------------------
@@ -290,14 +395,28 @@ def edit_artist(artist_id):
     form.seeking_venue.data = artist.seeking_venue
     form.seeking_description.data = artist.seeking_description
     form.image_link.data = artist.image_link
+    form.version.data = artist.version
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
+STALE_EDIT = ('{} {} was changed by someone else while you were editing it. '
+              'Reload the edit page and make your changes again.')
+
+
+def is_stale(form, entity):
+    """ Whether the entity changed since its edit form was loaded. Forms
+    posted without a version are checked only by the version_id_col
+    UPDATE, which catches edits that overlap in flight."""
+    return bool(form.version.data) and form.version.data != str(entity.version)
+
+
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     form = ArtistForm(request.form)
     artist = Artist.query.get(artist_id)
-    if form.validate():
+    if is_stale(form, artist):
+        flash(STALE_EDIT.format('Artist', request.form['name']))
+    elif form.validate():
         artist.name = form.name.data
         artist.city = form.city.data
         artist.state = form.state.data
@@ -308,7 +427,15 @@ def edit_artist_submission(artist_id):
         artist.website = form.website_link.data
         artist.seeking_venue = form.seeking_venue.data
         artist.seeking_description = form.seeking_description.data
-        db.session.commit()
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            flash(STALE_EDIT.format('Artist', request.form['name']))
+            return redirect(url_for('show_artist', artist_id=artist_id))
+        invalidate_artists(artist_id, *recommendations.listed_by(artist_id))
+        refresh_similar([artist_id])
+        invalidate_venues(*venues_of_artist(artist_id))
         flash('Artist ' + request.form['name'] + ' was successfully updated!')
     else:
         flash('An error occurred. Artist ' +
@@ -331,6 +458,9 @@ def edit_venue(venue_id):
     form.seeking_talent.data = venue.seeking_talent
     form.seeking_description.data = venue.seeking_description
     form.image_link.data = venue.image_link
+    form.latitude.data = venue.latitude
+    form.longitude.data = venue.longitude
+    form.version.data = venue.version
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
@@ -338,7 +468,9 @@ def edit_venue(venue_id):
 def edit_venue_submission(venue_id):
     form = VenueForm(request.form)
     venue = Venue.query.get(venue_id)
-    if form.validate():
+    if is_stale(form, venue):
+        flash(STALE_EDIT.format('Venue', request.form['name']))
+    elif form.validate():
         venue.name = form.name.data
         venue.address = form.address.data
         venue.city = form.city.data
@@ -350,7 +482,16 @@ def edit_venue_submission(venue_id):
         venue.website = form.website_link.data
         venue.seeking_talent = form.seeking_talent.data
         venue.seeking_description = form.seeking_description.data
-        db.session.commit()
+        venue.latitude = form.latitude.data
+        venue.longitude = form.longitude.data
+        try:
+            db.session.commit()
+        except StaleDataError:
+            db.session.rollback()
+            flash(STALE_EDIT.format('Venue', request.form['name']))
+            return redirect(url_for('show_venue', venue_id=venue_id))
+        invalidate_venues(venue_id)
+        invalidate_artists(*artists_of_venue(venue_id))
         flash('Venue ' + request.form['name'] + ' was successfully updated!')
     else:
         flash('An error occurred. Venue ' +
@@ -388,9 +529,9 @@ def create_artist_submission():
             db.session.commit()
             flash('Artist ' + request.form['name'] +
                   ' was successfully listed!')
-        except Exception as exception:
+        except Exception:
             db.session.rollback()
-            print(exception)
+            app.logger.exception('Artist could not be listed')
             flash('An error occurred. Artist ' +
                   request.form['name'] + ' could not be listed.')
         finally:
@@ -406,26 +547,17 @@ def create_artist_submission():
 
 @app.route('/shows')
 def shows():
-    data = []
-    dataQuery = db.session.query(performances.c.venue_id,
-                                 Venue.name.label('venue_name'),
-                                 Artist.name.label('arist_name'),
-                                 performances.c.artist_id, performances.c.start_time,
-                                 Artist.image_link.label('artist_image_link')).join(Venue, performances.c.venue_id == Venue.id)\
-        .join(Artist, performances.c.artist_id == Artist.id).all()
-    print(dataQuery)
-    for d in dataQuery:
-        print(d)
-        dt = {
-            "start_time": str(d.start_time),
-            "venue_id": str(d.venue_id),
-            "artist_id": str(d.artist_id),
-            "venue_name": d.venue_name,
-            "arist_name": d.arist_name,
-            "artist_image_link": d.artist_image_link,
-        }
-        data.append(dt)
-    return render_template('pages/shows.html', shows=data)
+    page = stream(queries.show_list_query(), queries.SHOW_LIST_ORDER,
+                  request.args.get('cursor'), app.config['LIST_PAGE_SIZE'])
+    data = ({
+        "start_time": d.start_time,
+        "venue_id": str(d.venue_id),
+        "artist_id": str(d.artist_id),
+        "venue_name": d.venue_name,
+        "artist_name": d.artist_name,
+        "artist_image_link": d.artist_image_link,
+    } for d in page)
+    return stream_template('pages/shows.html', shows=data, page=page)
 
 
 @app.route('/shows/create')
@@ -435,35 +567,308 @@ def create_shows():
     return render_template('forms/new_show.html', form=form)
 
 
+def book_shows(rows, rejects=()):
+    """ Lists show rows in one transaction: one existence query per
+    referenced table, the overlap check, then a single multi-row INSERT.
+    Nothing is written if any row, or any of `rejects` from validating
+    them, is rejected; returns all the rejects."""
+    rows, more_rejects = bulk_import.check_show_rows(rows)
+    rejects = list(rejects) + more_rejects
+    if rejects:
+        # Also releases the rows reserved in the venues' schedules.
+        db.session.rollback()
+        return rejects
+    db.session.execute(performances.insert().values(rows))
+    rollups.record_shows(db.session.connection(), rows)
+    db.session.commit()
+    artist_ids = {row['artist_id'] for row in rows}
+    invalidate_venues(*{row['venue_id'] for row in rows})
+    invalidate_artists(*artist_ids)
+    refresh_similar(artist_ids)
+    for row in rows:
+        search.autocomplete_booked(row['venue_id'], row['artist_id'], row['start_time'])
+    return []
+
+
+def reject_message(errors):
+    return ' '.join(error for messages in errors.values() for error in messages)
+
+
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
     form = ShowForm(request.form)
     if form.validate():
         try:
-            venue_id = request.form.get('venue_id')
-            artist_id = request.form.get('artist_id')
             start_time = datetime.strptime(
                 request.form.get('start_time'), '%Y-%m-%d %H:%M:%S')
-            show = performances.insert().values(
-                venue_id=venue_id,
-                artist_id=artist_id,
-                start_time=start_time
-            )
-            db.session.execute(show)
-            db.session.commit()
-            flash('Show was successfully listed!')
-        except Exception as e:
-            print(str(e))
-            flash('An error occurred. Show could not be listed.')
+            show = {
+                'venue_id': int(request.form.get('venue_id')),
+                'artist_id': int(request.form.get('artist_id')),
+                'start_time': start_time,
+                'end_time': bookings.end_of(start_time, form.end_time.data),
+            }
+            rejects = book_shows([show])
+            if rejects:
+                flash('Show could not be listed. ' + reject_message(rejects[0][1]))
+            else:
+                flash('Show was successfully listed!')
+        except Exception as error:
             db.session.rollback()
+            if bookings.is_overlap(error):
+                flash('Show could not be listed. The venue was booked for that time meanwhile.')
+            else:
+                app.logger.exception('Show could not be listed')
+                flash('An error occurred. Show could not be listed.')
         finally:
             db.session.close()
         return render_template('pages/home.html')
     else:
-        flash('Show ' + request.form['name'] + ' was failed listed!')
+        flash('Show could not be listed: ' + '; '.join(
+            error for errors in form.errors.values() for error in errors))
         return render_template('pages/home.html')
 
 
+@app.route('/shows/create/batch')
+def create_show_batch():
+    return render_template('forms/new_show_batch.html', form=ShowBatchForm(), errors={},
+                           rejects=[])
+
+
+def batch_form(payload):
+    """ The batch form filled from the request, and the show records of a
+    JSON body's "shows" list, if it has one."""
+    if payload is None:
+        return ShowBatchForm(request.form), None
+    records = payload.get('shows')
+    if records is not None:
+        return ShowBatchForm(), records
+    return ShowBatchForm(MultiDict({key: str(value) for key, value in payload.items()
+                                    if value is not None})), None
+
+
+def batch_rows(form, records, limit):
+    """ (rows, errors, rejects) for the records, the form's listed shows or
+    its repeated show. More than `limit` shows are an error."""
+    if records is not None:
+        if not (isinstance(records, list) and all(isinstance(r, dict) for r in records)):
+            return [], {'shows': ['Must be a list of objects.']}, []
+    elif not form.validate():
+        return [], form.errors, []
+    elif (form.shows.data or '').strip():
+        records = bulk_import.read_show_lines(form.shows.data)
+    if records is not None:
+        rows, rejects = bulk_import.show_rows(records)
+    else:
+        try:
+            show = {'venue_id': int(form.venue_id.data),
+                    'artist_id': int(form.artist_id.data)}
+        except ValueError:
+            return [], {'venue_id/artist_id': ['Must be integers.']}, []
+        show['start_time'] = form.start_time.data
+        show['end_time'] = bookings.end_of(form.start_time.data, form.end_time.data)
+        rows = bookings.recurrence(show, form.frequency.data,
+                                   min(form.occurrences.data, limit + 1),
+                                   form.interval.data or 1)
+        rejects = []
+    if len(rows) + len(rejects) > limit:
+        return [], {'shows': ['At most {} shows can be listed at once.'.format(limit)]}, []
+    return rows, {}, rejects
+
+
+@app.route('/shows/create/batch', methods=['POST'])
+def create_show_batch_submission():
+    """ Lists many shows at once, all or none. Takes the batch form, or JSON
+    with the form's fields or with "shows", a list of show objects."""
+    payload = request.get_json(silent=True) if request.is_json else None
+    payload = payload if isinstance(payload, dict) else None
+    form, records = batch_form(payload)
+    rows, errors, rejects = batch_rows(form, records, app.config['SHOW_BATCH_LIMIT'])
+    if not errors:
+        try:
+            rejects = book_shows(rows, rejects)
+        except Exception as error:
+            db.session.rollback()
+            if bookings.is_overlap(error):
+                errors = {'start_time': ['A venue was booked for one of these times meanwhile.']}
+            else:
+                app.logger.exception('Shows could not be listed')
+                errors = {'shows': ['An error occurred.']}
+        finally:
+            db.session.close()
+
+    if payload is not None:
+        if errors or rejects:
+            return jsonify(errors=errors, rejects=[
+                {'record': record, 'errors': record_errors}
+                for record, record_errors in rejects]), 422
+        return jsonify(created=len(rows)), 201
+    if errors or rejects:
+        flash('Shows could not be listed. Nothing was saved.')
+        return render_template('forms/new_show_batch.html', form=form, errors=errors,
+                               rejects=rejects)
+    flash('{} shows were successfully listed!'.format(len(rows)))
+    return render_template('pages/home.html')
+
+
+#  Reports
+#  ----------------------------------------------------------------
+#  Read from the booking rollups only; see rollups.py.
+
+@app.route('/reports')
+def reports():
+    return redirect(url_for('venue_month_report'))
+
+
+@app.route('/reports/venues')
+def venue_month_report():
+    try:
+        month = datetime.strptime(request.args.get('month', ''), '%Y-%m').date()
+    except ValueError:
+        month = rollups.month_of(datetime.now())
+    return render_template('pages/reports.html', report='venues', month=month,
+                           rows=rollups.venue_months(month, app.config['LIST_PAGE_SIZE']))
+
+
+@app.route('/reports/artists')
+def top_artists_report():
+    return render_template('pages/reports.html', report='artists',
+                           rows=rollups.top_artists(app.config['LIST_PAGE_SIZE']))
+
+
+@app.route('/reports/genres')
+def genre_demand_report():
+    state = request.args.get('state')
+    return render_template('pages/reports.html', report='genres', state=state,
+                           states=[s.value for s in State],
+                           rows=rollups.genre_demand(state))
+
+
+#  Async views
+#  ----------------------------------------------------------------
+#  With ASYNC_VIEWS on, these stand in for the views of the same name and
+#  run their independent queries concurrently (see aio.py).
+
+async def venues_async():
+    state = request.args.get('state')
+    genre = request.args.get('genre')
+    per_page = app.config['LIST_PAGE_SIZE']
+    query, direction = page_query(queries.venue_list_query(state, genre),
+                                  queries.VENUE_LIST_ORDER,
+                                  request.args.get('cursor'), per_page)
+    rows, genre_rows, state_rows = await aio.fetch_all(
+        query, *facets.facet_queries(Venue, state, genre))
+    page = to_page(rows, queries.VENUE_LIST_ORDER, direction, per_page)
+    return render_template('pages/venues.html', areas=venue_areas(page), page=page,
+                           facets=facets.facet_lists(genre_rows, state_rows))
+
+
+async def show_venue_async(venue_id):
+    key = fragment_key(Venue, venue_key, venue_id)
+    page = cache.get(key)
+    if page is None:
+        venue_data = await queries.venue_details_async(venue_id)
+        page = render_venue(venue_data)
+        cache.set(key, page, fragment_ttl(venue_data, app.config['CACHE_TTL']))
+    return render_template('pages/show_venue.html', name=page['name'],
+                           fragment=Markup(page['fragment']))
+
+
+async def show_artist_async(artist_id):
+    key = fragment_key(Artist, artist_key, artist_id)
+    page = cache.get(key)
+    if page is None:
+        artist_data = await queries.artist_details_async(artist_id)
+        page = render_artist(artist_data)
+        cache.set(key, page, fragment_ttl(artist_data, app.config['CACHE_TTL']))
+    return render_template('pages/show_artist.html', name=page['name'],
+                           fragment=Markup(page['fragment']))
+
+
+if app.config['ASYNC_VIEWS']:
+    aio.check_requirements(app)
+    app.view_functions.update(venues=venues_async, show_venue=show_venue_async,
+                              show_artist=show_artist_async)
+
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics')
+def show_metrics():
+    return Response(metrics.render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+#  Commands
+#  ----------------------------------------------------------------
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(bulk_import.KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--restart', is_flag=True,
+              help='Ignore the saved progress and read the file from the start.')
+def import_command(kind, path, batch_size, restart):
+    """Bulk load venues, artists or shows from a CSV or JSONL file."""
+    # Only a shared (redis) cache can be invalidated from here. With the
+    # memory cache each worker keeps serving its fragments until they
+    # expire, after at most CACHE_TTL seconds.
+    def on_batch(rows):
+        if kind == 'shows':
+            invalidate_venues(*{row['venue_id'] for row in rows})
+            invalidate_artists(*{row['artist_id'] for row in rows})
+    bulk_import.load(kind, path, batch_size, resume=not restart,
+                     on_batch=on_batch if cache.shared else None, echo=click.echo)
+    if kind == 'shows':
+        # Cheaper once for the whole file than refreshed batch by batch.
+        recommendations.rebuild()
+        if cache.shared:
+            cache.clear()
+        click.echo('Similar artists rebuilt.')
+
+
+@app.cli.command('check-indexes')
+@click.option('--verbose', is_flag=True, help='Print every query plan.')
+def check_indexes_command(verbose):
+    """Check that the hot queries are served by their indexes."""
+    failed = 0
+    for name, indexes, plan, ok in query_plans.check_plans():
+        click.echo('{} {}: {}'.format('ok  ' if ok else 'FAIL', name, ', '.join(indexes)))
+        if verbose or not ok:
+            click.echo('    ' + plan.replace('\n', '\n    '))
+        failed += not ok
+    if failed:
+        raise SystemExit(1)
+
+
+@app.cli.command('rebuild-facets')
+def rebuild_facets_command():
+    """Recompute the genre/state facet counts from scratch."""
+    facets.rebuild()
+    click.echo('Facet counts rebuilt.')
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the booking rollups behind /reports from scratch."""
+    rollups.rebuild()
+    click.echo('Booking rollups rebuilt.')
+
+
+@app.cli.command('rebuild-recommendations')
+def rebuild_recommendations_command():
+    """Recompute every artist's similar artists from scratch."""
+    recommendations.rebuild()
+    click.echo('Similar artists rebuilt.')
+
+
+@app.cli.command('maintain-partitions')
+def maintain_partitions_command():
+    """Create upcoming Show partitions and archive old ones (Postgres)."""
+    partitions.maintain(echo=click.echo)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -474,17 +879,6 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
 # ----------------------------------------------------------------------------#
 # Launch.
 # ----------------------------------------------------------------------------#
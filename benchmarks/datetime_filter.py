@@ -0,0 +1,54 @@
+"""Per-call cost of the `datetime` Jinja filter.
+
+    python benchmarks/datetime_filter.py [--number N]
+
+Compares the previous filter (str() in the view, dateutil parse and an
+uncached Babel format in the filter) with filters.format_datetime on
+native datetimes.
+"""
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filters import format_datetime  # noqa: E402
+
+
+def previous_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    start_time = datetime(2023, 4, 21, 20, 30, 15, 123456)
+    assert previous_format_datetime(str(start_time), 'full') == \
+        format_datetime(start_time, 'full')
+
+    cases = [
+        ('before', lambda: previous_format_datetime(str(start_time), 'full')),
+        ('after', lambda: format_datetime(start_time, 'full')),
+    ]
+    results = {}
+    for name, call in cases:
+        best = min(timeit.repeat(call, number=args.number, repeat=5))
+        results[name] = best / args.number * 1e6
+        print('{:<7} {:8.2f} us/call'.format(name, results[name]))
+    print('speedup {:8.1f}x'.format(results['before'] / results['after']))
+
+
+if __name__ == '__main__':
+    main()
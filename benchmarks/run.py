@@ -0,0 +1,371 @@
+"""Latency, throughput and query counts for every route in app.py.
+
+    python benchmarks/run.py --database sqlite:///bench.db
+    python benchmarks/run.py --database sqlite:///bench.db --writes
+    python benchmarks/run.py --url http://localhost:5000 --threads 16
+    python benchmarks/run.py --compare before.json after.json
+
+With --database the app runs in-process behind the Flask test client and
+every request's SQL statements are counted. With --url an already running
+server is loaded from --threads threads over HTTP; query counts are not
+available there. Results are written as JSON (see --output) so two runs
+can be compared with --compare. Build the database with seed.py first.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SEARCH_TERMS = ['blue', 'hall', 'new york', 'jazz', 'velvet lounge', 'ca']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--database', help='SQLAlchemy URL; test client mode')
+    target.add_argument('--url', help='base URL of a running server; HTTP mode')
+    target.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='compare two result files')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='measured requests per route')
+    parser.add_argument('--warmup', type=int, default=5,
+                        help='unmeasured requests per route')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='concurrent clients in HTTP mode')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--routes', help='comma separated route names to run')
+    parser.add_argument('--writes', action='store_true',
+                        help='also drive the create, edit and delete routes '
+                             '(test client mode only; modifies the database)')
+    parser.add_argument('--output', help='result file (default: '
+                        'benchmarks/results/<commit>-<mode>.json)')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative p95 slowdown reported as a regression')
+    args = parser.parse_args()
+    if args.writes and args.url:
+        parser.error('--writes needs --database (forms are CSRF protected)')
+    return args
+
+
+# ----------------------------------------------------------------------------#
+# Routes.
+# ----------------------------------------------------------------------------#
+
+class Context(object):
+    """ Random ids and form data shared by the route factories."""
+
+    def __init__(self, rng, venue_ids, artist_ids):
+        self.rng = rng
+        self.venue_ids = venue_ids
+        self.artist_ids = artist_ids
+        self.created_venues = []
+
+    def venue(self):
+        return self.rng.choice(self.venue_ids)
+
+    def artist(self):
+        return self.rng.choice(self.artist_ids)
+
+    def term(self):
+        return {'search_term': self.rng.choice(SEARCH_TERMS)}
+
+    def profile(self, **extra):
+        data = {
+            'name': 'Benchmark {}'.format(self.rng.randint(0, 10 ** 6)),
+            'city': 'San Francisco', 'state': 'CA', 'phone': '415-555-0100',
+            'genres': ['Jazz', 'Blues'], 'image_link': '',
+            'facebook_link': 'https://www.facebook.com/benchmark',
+            'website_link': '', 'seeking_description': '',
+        }
+        data.update(extra)
+        return data
+
+    def show(self):
+        start_time = datetime(2030, 1, 1) + timedelta(
+            hours=self.rng.randint(0, 24 * 365))
+        return {'venue_id': str(self.venue()), 'artist_id': str(self.artist()),
+                'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    def residency(self):
+        return dict(self.show(), frequency='weekly', occurrences='8')
+
+
+# (name, method, request factory, writes)
+ROUTES = [
+    ('index', 'GET', lambda c: ('/', None), False),
+    ('autocomplete', 'GET', lambda c: ('/autocomplete?q={}'.format(
+        c.term()['search_term'][:3]), None), False),
+    ('venues', 'GET', lambda c: ('/venues', None), False),
+    ('venues_by_state', 'GET', lambda c: ('/venues?state=CA', None), False),
+    ('venues_by_genre', 'GET', lambda c: ('/venues?genre=Jazz', None), False),
+    ('search_venues', 'POST', lambda c: ('/venues/search', c.term()), False),
+    ('nearby_venues', 'GET', lambda c: ('/venues/nearby?lat=37.77&lon=-122.42&radius=25', None), False),
+    ('show_venue', 'GET', lambda c: ('/venues/{}'.format(c.venue()), None), False),
+    ('venue_past_shows', 'GET', lambda c: ('/venues/{}/past-shows'.format(c.venue()), None), False),
+    ('create_venue_form', 'GET', lambda c: ('/venues/create', None), False),
+    ('edit_venue', 'GET', lambda c: ('/venues/{}/edit'.format(c.venue()), None), False),
+    ('artists', 'GET', lambda c: ('/artists', None), False),
+    ('artists_by_genre', 'GET', lambda c: ('/artists?genre=Jazz', None), False),
+    ('search_artists', 'POST', lambda c: ('/artists/search', c.term()), False),
+    ('show_artist', 'GET', lambda c: ('/artists/{}'.format(c.artist()), None), False),
+    ('artist_past_shows', 'GET', lambda c: ('/artists/{}/past-shows'.format(c.artist()), None), False),
+    ('create_artist_form', 'GET', lambda c: ('/artists/create', None), False),
+    ('edit_artist', 'GET', lambda c: ('/artists/{}/edit'.format(c.artist()), None), False),
+    ('shows', 'GET', lambda c: ('/shows', None), False),
+    ('create_shows', 'GET', lambda c: ('/shows/create', None), False),
+    ('report_venues', 'GET', lambda c: ('/reports/venues', None), False),
+    ('report_artists', 'GET', lambda c: ('/reports/artists', None), False),
+    ('report_genres', 'GET', lambda c: ('/reports/genres?state=CA', None), False),
+    ('api_venues', 'GET', lambda c: ('/api/v1/venues', None), False),
+    ('api_artists', 'GET', lambda c: ('/api/v1/artists', None), False),
+    ('api_shows', 'GET', lambda c: ('/api/v1/shows', None), False),
+    ('api_shows_export', 'GET', lambda c: ('/api/v1/shows/export', None), False),
+    ('api_venue', 'GET', lambda c: ('/api/v1/venues/{}'.format(c.venue()), None), False),
+    ('api_artist', 'GET', lambda c: ('/api/v1/artists/{}'.format(c.artist()), None), False),
+    ('create_venue_submission', 'POST', lambda c: (
+        '/venues/create', c.profile(address='1 Benchmark Way')), True),
+    ('edit_venue_submission', 'POST', lambda c: (
+        '/venues/{}/edit'.format(c.venue()), c.profile(address='1 Benchmark Way')), True),
+    ('create_artist_submission', 'POST', lambda c: (
+        '/artists/create', c.profile()), True),
+    ('edit_artist_submission', 'POST', lambda c: (
+        '/artists/{}/edit'.format(c.artist()), c.profile()), True),
+    ('create_show_submission', 'POST', lambda c: ('/shows/create', c.show()), True),
+    ('create_show_batch', 'POST', lambda c: ('/shows/create/batch', c.residency()), True),
+    # Only deletes the venues created_venue_submission added above.
+    ('delete_venue', 'DELETE', lambda c: (
+        '/venues/{}'.format(c.created_venues.pop()), None), True),
+]
+
+
+# ----------------------------------------------------------------------------#
+# Clients.
+# ----------------------------------------------------------------------------#
+
+class TestClient(object):
+    """ Runs the app in-process and counts SQL statements per request."""
+
+    mode = 'client'
+    threads = 1
+
+    def __init__(self, database):
+        os.environ['DATABASE_URL'] = database
+        from sqlalchemy import event, func
+        from sqlalchemy.engine import Engine
+        from app import app
+        from models import db, Venue, Artist, performances
+
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.app = app
+        self.client = app.test_client()
+        self.statements = 0
+        with app.app_context():
+            # Every engine, so replicas and the ASYNC_VIEWS engines count too.
+            event.listen(Engine, 'before_cursor_execute', self._count)
+            self.venue_ids = [id for id, in db.session.query(Venue.id)]
+            self.artist_ids = [id for id, in db.session.query(Artist.id)]
+            self.rows = {
+                'venues': len(self.venue_ids),
+                'artists': len(self.artist_ids),
+                'shows': db.session.query(func.count(performances.c.id)).scalar(),
+            }
+        self.db, self.Venue = db, Venue
+
+    def _count(self, *args):
+        self.statements += 1
+
+    def request(self, method, path, data):
+        before = self.statements
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, data=data)
+        response.get_data()
+        response.close()
+        elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, self.statements - before
+
+    def created_venues(self, after):
+        with self.app.app_context():
+            return [id for id, in self.db.session.query(self.Venue.id)
+                    .filter(self.Venue.id > after)]
+
+    def run(self, requests):
+        return [self.request(*request) for request in requests]
+
+
+class HTTPClient(object):
+    """ Loads a running server from a pool of threads."""
+
+    mode = 'http'
+
+    def __init__(self, url, threads):
+        self.url = url.rstrip('/')
+        self.threads = threads
+        self.venue_ids = self._ids('/api/v1/venues')
+        self.artist_ids = self._ids('/api/v1/artists')
+        self.rows = None
+
+    def _ids(self, path):
+        with urllib.request.urlopen(self.url + path) as response:
+            return [row['id'] for row in json.load(response)['data']]
+
+    def request(self, method, path, data):
+        body = urllib.parse.urlencode(data, doseq=True).encode() if data else None
+        request = urllib.request.Request(self.url + path, data=body, method=method)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            status = error.code
+        return status, time.perf_counter() - started, None
+
+    def run(self, requests):
+        with ThreadPoolExecutor(self.threads) as pool:
+            return list(pool.map(lambda request: self.request(*request), requests))
+
+
+# ----------------------------------------------------------------------------#
+# Measuring.
+# ----------------------------------------------------------------------------#
+
+def percentile(values, fraction):
+    """ Nearest-rank percentile of a sorted list."""
+    index = max(int(round(fraction * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def summarize(method, results, elapsed):
+    latencies = sorted(latency for _, latency, _ in results)
+    statements = [count for _, _, count in results if count is not None]
+    return {
+        'method': method,
+        'requests': len(results),
+        'errors': sum(1 for status, _, _ in results if status >= 500),
+        'statuses': sorted({status for status, _, _ in results}),
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'throughput_rps': len(results) / elapsed if elapsed else None,
+        'queries_per_request': sum(statements) / len(statements) if statements else None,
+    }
+
+
+def benchmark(client, args):
+    rng = random.Random(args.seed)
+    context = Context(rng, client.venue_ids, client.artist_ids)
+    selected = set(args.routes.split(',')) if args.routes else None
+    last_venue = max(client.venue_ids or [0])
+    results = {}
+    for name, method, build, writes in ROUTES:
+        if (writes and not args.writes) or (selected and name not in selected):
+            continue
+        if name == 'delete_venue':
+            context.created_venues = client.created_venues(last_venue)
+            count = len(context.created_venues)
+            warmup = 0
+        else:
+            count, warmup = args.requests, args.warmup
+        if not count:
+            continue
+        client.run([(method,) + build(context) for _ in range(min(warmup, count))])
+        requests = [(method,) + build(context) for _ in range(count)]
+        started = time.perf_counter()
+        measured = client.run(requests)
+        results[name] = summarize(method, measured, time.perf_counter() - started)
+        print('{:<26} p50 {p50_ms:8.2f}ms  p95 {p95_ms:8.2f}ms  p99 {p99_ms:8.2f}ms  '
+              '{throughput_rps:8.1f} req/s  {queries}  {errors} errors'.format(
+                  name, queries='-' if results[name]['queries_per_request'] is None
+                  else '{:.1f} queries'.format(results[name]['queries_per_request']),
+                  **results[name]))
+    return results
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(before_path, after_path, threshold):
+    """ Prints per-route p95 and query count changes; returns the number of
+    routes whose p95 grew by more than `threshold` or that issue more
+    queries than before."""
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print('{} -> {}'.format(before['meta']['commit'], after['meta']['commit']))
+    regressions = 0
+    for name, new in after['routes'].items():
+        old = before['routes'].get(name)
+        if old is None:
+            print('{:<26} new'.format(name))
+            continue
+        change = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] if old['p95_ms'] else 0
+        queries = ''
+        slower = change > threshold
+        if old['queries_per_request'] is not None and new['queries_per_request'] is not None:
+            queries = '{:.1f} -> {:.1f} queries'.format(old['queries_per_request'],
+                                                       new['queries_per_request'])
+            slower = slower or \
+                new['queries_per_request'] - old['queries_per_request'] >= 0.5
+        regressions += slower
+        print('{:<26} p95 {:8.2f}ms -> {:8.2f}ms ({:+.0%})  {}{}'.format(
+            name, old['p95_ms'], new['p95_ms'], change, queries,
+            '  REGRESSION' if slower else ''))
+    return regressions
+
+
+def main():
+    args = parse_args()
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.threshold) else 0)
+
+    if args.database:
+        client = TestClient(args.database)
+    else:
+        client = HTTPClient(args.url, args.threads)
+    if not client.venue_ids or not client.artist_ids:
+        sys.exit('No venues or artists found; run benchmarks/seed.py first.')
+
+    results = {
+        'meta': {
+            'commit': commit(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'mode': client.mode,
+            'target': args.database or args.url,
+            'threads': client.threads,
+            'requests': args.requests,
+            'seed': args.seed,
+            'rows': client.rows,
+        },
+        'routes': benchmark(client, args),
+    }
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', '{}-{}.json'.format(
+        results['meta']['commit'], client.mode))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Saved {}'.format(output))
+    if any(route['errors'] for route in results['routes'].values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
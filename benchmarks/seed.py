@@ -0,0 +1,195 @@
+"""Seeded data generator for benchmarks.
+
+    python benchmarks/seed.py --database sqlite:///bench.db --shows 100000
+    python benchmarks/seed.py --database postgresql://localhost/fyyur_bench \
+        --shows 10000000 --drop
+
+The same --seed always produces the same venues, artists and shows. Show
+times are offsets from the current hour, so the past/upcoming split looks
+the same whenever the data is generated.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo  # noqa: E402
+
+CITIES = [
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('San Diego', 'CA'),
+    ('New York', 'NY'), ('Brooklyn', 'NY'), ('Buffalo', 'NY'),
+    ('Austin', 'TX'), ('Houston', 'TX'), ('Dallas', 'TX'),
+    ('Chicago', 'IL'), ('Seattle', 'WA'), ('Portland', 'OR'),
+    ('Nashville', 'TN'), ('Memphis', 'TN'), ('New Orleans', 'LA'),
+    ('Atlanta', 'GA'), ('Miami', 'FL'), ('Denver', 'CO'),
+    ('Boston', 'MA'), ('Philadelphia', 'PA'), ('Detroit', 'MI'),
+    ('Minneapolis', 'MN'), ('Phoenix', 'AZ'), ('Las Vegas', 'NV'),
+]
+WORDS = [
+    'Blue', 'Red', 'Golden', 'Velvet', 'Electric', 'Silver', 'Midnight',
+    'Rusty', 'Lucky', 'Wild', 'Neon', 'Hidden', 'Crooked', 'Broken',
+    'Owl', 'Fox', 'Lantern', 'Anchor', 'Harbor', 'Garden', 'Cellar',
+    'Room', 'Hall', 'Parlor', 'Tavern', 'Club', 'Lounge', 'Theatre',
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database', default=os.environ.get('DATABASE_URL'),
+                        help='SQLAlchemy URL (default: $DATABASE_URL)')
+    parser.add_argument('--shows', type=int, default=1000)
+    parser.add_argument('--venues', type=int,
+                        help='default: shows / 20, at least 10')
+    parser.add_argument('--artists', type=int,
+                        help='default: shows / 10, at least 10')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=10000)
+    parser.add_argument('--drop', action='store_true',
+                        help='drop and recreate all tables first')
+    args = parser.parse_args()
+    if not args.database:
+        parser.error('--database or $DATABASE_URL is required')
+    args.venues = args.venues or max(args.shows // 20, 10)
+    args.artists = args.artists or max(args.shows // 10, 10)
+    return args
+
+
+def name(rng, i):
+    return '{} {} {}'.format(rng.choice(WORDS), rng.choice(WORDS), i)
+
+
+def phone(rng):
+    return '{:03d}-{:03d}-{:04d}'.format(rng.randint(200, 999),
+                                         rng.randint(200, 999),
+                                         rng.randint(0, 9999))
+
+
+def venues(rng, count, genres, search_document):
+    for i in range(count):
+        city, state = rng.choice(CITIES)
+        row = {
+            'name': name(rng, i), 'city': city, 'state': state,
+            'address': '{} Main St'.format(rng.randint(1, 9999)),
+            'phone': phone(rng), 'genres': rng.sample(genres, rng.randint(1, 3)),
+            'image_link': '', 'facebook_link': '', 'website': '',
+            'seeking_talent': rng.random() < 0.3, 'seeking_description': '',
+        }
+        row['search_document'] = search_document(
+            row['name'], city, state, row['genres'])
+        # Spread venues over roughly 20km around their city's centre, on an
+        # rng of their own so the rest of the data stays as it was.
+        spread = random.Random(i)
+        latitude, longitude = geo.centroid(city, state)
+        row.update(geo.location(city, state,
+                                latitude + spread.uniform(-0.1, 0.1),
+                                longitude + spread.uniform(-0.1, 0.1)))
+        yield row
+
+
+def artists(rng, count, genres, search_document):
+    for i in range(count):
+        city, state = rng.choice(CITIES)
+        row = {
+            'name': name(rng, i), 'city': city, 'state': state,
+            'phone': phone(rng), 'genres': rng.sample(genres, rng.randint(1, 3)),
+            'image_link': '', 'facebook_link': '', 'website': '',
+            'seeking_venue': rng.random() < 0.3, 'seeking_description': '',
+        }
+        row['search_document'] = search_document(
+            row['name'], city, state, row['genres'])
+        yield row
+
+
+def shows(rng, count, venue_ids, artist_ids, anchor, duration):
+    # Each venue's shows follow one another with random gaps, from two years
+    # back to about a year ahead, so no two of them overlap.
+    first = anchor - timedelta(days=730)
+    slots = timedelta(days=1095) // duration
+    max_gap = max(2 * slots * (venue_ids[1] - venue_ids[0] + 1) // count, 1)
+    next_slot = {}
+    for _ in range(count):
+        venue_id = rng.randint(*venue_ids)
+        slot = next_slot.get(venue_id, 0) + rng.randrange(max_gap)
+        next_slot[venue_id] = slot + 1
+        start_time = first + slot * duration
+        yield {
+            'venue_id': venue_id,
+            'artist_id': rng.randint(*artist_ids),
+            'start_time': start_time,
+            'end_time': start_time + duration,
+        }
+
+
+def load(label, model, rows, batch_size):
+    import bulk_import
+    import facets
+    import rollups
+    from models import db, performances
+
+    table = getattr(model, '__table__', model)
+    started = time.monotonic()
+    total = 0
+    batch = []
+
+    def flush():
+        bulk_import.insert_rows(table, batch)
+        if model in facets.KINDS:
+            facets.record_rows(db.session.connection(), model, batch)
+        elif model is performances:
+            rollups.record_shows(db.session.connection(), batch)
+        db.session.commit()
+        del batch[:]
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            total += len(batch)
+            flush()
+    if batch:
+        total += len(batch)
+        flush()
+    elapsed = time.monotonic() - started
+    print('{}: {} rows in {:.1f}s ({:.0f} rows/s)'.format(
+        label, total, elapsed, total / elapsed if elapsed else 0))
+
+
+def main():
+    args = parse_args()
+    os.environ['DATABASE_URL'] = args.database
+
+    from sqlalchemy import func
+    from app import app
+    import recommendations
+    from enums import Genre
+    from models import db, Venue, Artist, performances, search_document
+
+    rng = random.Random(args.seed)
+    genres = [genre.value for genre in Genre]
+    anchor = datetime.now().replace(minute=0, second=0, microsecond=0)
+    with app.app_context():
+        if args.drop:
+            db.drop_all()
+        db.create_all()
+        first_venue = (db.session.query(func.max(Venue.id)).scalar() or 0) + 1
+        first_artist = (db.session.query(func.max(Artist.id)).scalar() or 0) + 1
+        load('venues', Venue, venues(rng, args.venues, genres, search_document),
+             args.batch_size)
+        load('artists', Artist, artists(rng, args.artists, genres, search_document),
+             args.batch_size)
+        load('shows', performances, shows(
+            rng, args.shows,
+            (first_venue, first_venue + args.venues - 1),
+            (first_artist, first_artist + args.artists - 1), anchor,
+            timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])),
+            args.batch_size)
+        started = time.monotonic()
+        recommendations.rebuild()
+        print('similar artists: rebuilt in {:.1f}s'.format(time.monotonic() - started))
+
+
+if __name__ == '__main__':
+    main()
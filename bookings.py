@@ -0,0 +1,165 @@
+from bisect import bisect_left, insort
+from datetime import timedelta
+
+from dateutil.rrule import DAILY, MONTHLY, WEEKLY, rrule
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import db, performances
+
+
+def end_of(start_time, end_time=None):
+    """ A show's end, or its start plus SHOW_DURATION_MINUTES."""
+    if end_time is not None:
+        return end_time
+    return start_time + timedelta(minutes=current_app.config['SHOW_DURATION_MINUTES'])
+
+
+FREQUENCIES = {'daily': DAILY, 'weekly': WEEKLY, 'monthly': MONTHLY}
+
+
+def recurrence(row, frequency, count, interval=1):
+    """ `count` show rows like `row`, repeating every `interval` days, weeks
+    or months. Monthly shows on the 29th to 31st skip shorter months."""
+    length = row['end_time'] - row['start_time']
+    return [dict(row, start_time=start, end_time=start + length)
+            for start in rrule(FREQUENCIES[frequency], dtstart=row['start_time'],
+                               interval=interval, count=count)]
+
+
+class Schedule(object):
+    """ The shows booked at one venue as sorted, non-overlapping intervals.
+    Because they never overlap, ordering by start also orders the ends, so
+    the only bookings that can clash with a new one are its two neighbours
+    by start time: one bisect answers the overlap query in O(log n), which
+    is all an interval tree would add for intervals that cannot overlap.
+    add() and remove() shift the list, O(n) but a single memmove for the
+    few thousand shows a venue has."""
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals)
+
+    def conflict(self, start, end):
+        """ The booked (start, end) overlapping [start, end), if any."""
+        i = bisect_left(self.intervals, (start, end))
+        if i > 0 and self.intervals[i - 1][1] > start:
+            return self.intervals[i - 1]
+        if i < len(self.intervals) and self.intervals[i][0] < end:
+            return self.intervals[i]
+        return None
+
+    def add(self, start, end):
+        insort(self.intervals, (start, end))
+
+    def remove(self, start, end):
+        i = bisect_left(self.intervals, (start, end))
+        if i < len(self.intervals) and self.intervals[i] == (start, end):
+            del self.intervals[i]
+
+
+# Per-process schedules for SQLite, which cannot enforce the exclusion
+# constraint the Postgres schema has. Each venue is loaded on first use
+# and all are dropped when shows are bulk deleted. Rows accepted by
+# check_bookings() are reserved in them right away, so a concurrent request
+# sees them before they commit; a transaction that ends without committing
+# releases its reservations.
+_schedules = {}
+
+
+def _bookings_query(venue_ids, window=None):
+    query = db.session.query(performances.c.venue_id, performances.c.start_time,
+                             performances.c.end_time)\
+        .filter(performances.c.venue_id.in_(venue_ids))
+    if window is not None:
+        query = query.filter(performances.c.start_time < window[1],
+                             performances.c.end_time > window[0])
+    return query
+
+
+def _load(venue_ids, window=None):
+    schedules = {venue_id: Schedule() for venue_id in venue_ids}
+    for venue_id, start, end in _bookings_query(venue_ids, window):
+        schedules[venue_id].intervals.append((start, end))
+    for schedule in schedules.values():
+        schedule.intervals.sort()
+    return schedules
+
+
+def _schedules_for(rows):
+    venue_ids = {row['venue_id'] for row in rows}
+    if db.engine.dialect.name == 'postgresql':
+        # The exclusion constraint is authoritative; only the shows that
+        # could clash with this batch are needed to reject it up front.
+        window = (min(row['start_time'] for row in rows),
+                  max(row['end_time'] for row in rows))
+        return _load(venue_ids, window)
+    missing = venue_ids - set(_schedules)
+    if missing:
+        _schedules.update(_load(missing))
+    return _schedules
+
+
+def check_bookings(rows):
+    """ Splits show rows into (rows, rejects): a row is rejected when its
+    venue is already booked for part of its time, by an existing show or an
+    earlier row. Accepted rows are reserved, so insert them in the current
+    transaction."""
+    if not rows:
+        return [], []
+    schedules = _schedules_for(rows)
+    reservations = _reservations(db.session()) if schedules is _schedules else []
+    valid, rejects = [], []
+    for row in rows:
+        schedule = schedules[row['venue_id']]
+        clash = schedule.conflict(row['start_time'], row['end_time'])
+        if clash is None:
+            schedule.add(row['start_time'], row['end_time'])
+            reservations.append((row['venue_id'], row['start_time'], row['end_time']))
+            valid.append(row)
+        else:
+            rejects.append((row, {'start_time': [
+                'Venue is already booked from {:%Y-%m-%d %H:%M} to {:%Y-%m-%d %H:%M}.'
+                .format(*clash)]}))
+    return valid, rejects
+
+
+def is_overlap(error):
+    """ Whether `error` is a Postgres exclusion constraint rejecting a
+    booking committed concurrently. Each Show partition has its own, named
+    ex_show_<partition>_period; overlaps across partitions are raised as
+    ex_show_boundary_period."""
+    diag = getattr(getattr(error, 'orig', None), 'diag', None)
+    name = getattr(diag, 'constraint_name', None) or ''
+    return name.startswith('ex_show_') and name.endswith('_period')
+
+
+def _reservations(session):
+    # Reservations belong to a transaction, even when the schedules were
+    # cached and nothing has been read yet, so that its end releases them.
+    if not session.in_transaction():
+        session.begin()
+    return session.info.setdefault('booking_reservations', [])
+
+
+def _keep_reservations(session):
+    session.info.pop('booking_reservations', None)
+
+
+def _release_reservations(session, transaction):
+    # Runs after after_commit has kept them, or on rollback and close.
+    if transaction.parent is not None:
+        return
+    for venue_id, start, end in session.info.pop('booking_reservations', ()):
+        schedule = _schedules.get(venue_id)
+        if schedule is not None:
+            schedule.remove(start, end)
+
+
+def _reset_schedules(*args):
+    _schedules.clear()
+
+
+event.listen(Session, 'after_commit', _keep_reservations)
+event.listen(Session, 'after_transaction_end', _release_reservations)
+event.listen(Session, 'after_bulk_delete', _reset_schedules)
@@ -0,0 +1,289 @@
+import csv
+import io
+import json
+import os
+import time
+
+from werkzeug.datastructures import MultiDict
+
+import bookings
+import facets
+import geo
+import rollups
+from enums import Genre, State
+from forms import ArtistForm, ShowForm, VenueForm
+from models import db, Venue, Artist, ImportProgress, performances, search_document
+
+GENRES = {genre.value for genre in Genre}
+STATES = {state.value for state in State}
+BOOLEAN_FIELDS = ('seeking_talent', 'seeking_venue')
+TRUE_VALUES = ('1', 'y', 'yes', 't', 'true', 'on')
+
+
+# ----------------------------------------------------------------------------#
+# Reading and validation.
+# ----------------------------------------------------------------------------#
+
+def read_records(path):
+    """ Yields dicts from a JSONL file, or from a CSV file with a header row.
+    In CSV files genres are separated by ';'."""
+    if path.endswith(('.jsonl', '.ndjson')):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, newline='') as f:
+            for record in csv.DictReader(f):
+                if 'genres' in record:
+                    record['genres'] = [genre.strip() for genre in
+                                        (record['genres'] or '').split(';')
+                                        if genre.strip()]
+                yield record
+
+
+def _formdata(record):
+    data = MultiDict()
+    for key, value in record.items():
+        if key == 'website':
+            key = 'website_link'
+        if key in BOOLEAN_FIELDS:
+            if value is True or str(value).lower() in TRUE_VALUES:
+                data.add(key, 'y')
+        elif isinstance(value, list):
+            for item in value:
+                data.add(key, item)
+        elif value is not None:
+            data.add(key, str(value))
+    return data
+
+
+def _validate(form_class, record):
+    form = form_class(_formdata(record), meta={'csrf': False})
+    if not form.validate():
+        raise ValueError(form.errors)
+    state = getattr(form, 'state', None)
+    if state is not None and state.data not in STATES:
+        raise ValueError({'state': ['Not a valid State.']})
+    genres = getattr(form, 'genres', None)
+    if genres is not None and not set(genres.data) <= GENRES:
+        raise ValueError({'genres': ['Not a valid Genre.']})
+    return form
+
+
+def venue_row(record):
+    form = _validate(VenueForm, record)
+    return {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'address': form.address.data,
+        'phone': form.phone.data,
+        'genres': form.genres.data,
+        'image_link': form.image_link.data,
+        'facebook_link': form.facebook_link.data,
+        'website': form.website_link.data,
+        'seeking_talent': form.seeking_talent.data,
+        'seeking_description': form.seeking_description.data,
+        'search_document': search_document(form.name.data, form.city.data,
+                                           form.state.data, form.genres.data),
+        **geo.location(form.city.data, form.state.data,
+                       form.latitude.data, form.longitude.data),
+    }
+
+
+def artist_row(record):
+    form = _validate(ArtistForm, record)
+    return {
+        'name': form.name.data,
+        'city': form.city.data,
+        'state': form.state.data,
+        'phone': form.phone.data,
+        'genres': form.genres.data,
+        'image_link': form.image_link.data,
+        'facebook_link': form.facebook_link.data,
+        'website': form.website_link.data,
+        'seeking_venue': form.seeking_venue.data,
+        'seeking_description': form.seeking_description.data,
+        'search_document': search_document(form.name.data, form.city.data,
+                                           form.state.data, form.genres.data),
+    }
+
+
+def show_row(record):
+    form = _validate(ShowForm, record)
+    try:
+        return {
+            'venue_id': int(form.venue_id.data),
+            'artist_id': int(form.artist_id.data),
+            'start_time': form.start_time.data,
+            'end_time': bookings.end_of(form.start_time.data, form.end_time.data),
+        }
+    except (TypeError, ValueError):
+        raise ValueError({'venue_id/artist_id': ['Must be integers.']})
+
+
+def _existing_ids(model, ids):
+    return {row.id for row in db.session.query(model.id).filter(model.id.in_(ids))}
+
+
+def check_show_rows(rows):
+    """ Splits a batch into (rows, rejects) with one existence query per
+    referenced table, then rejects shows that overlap a booking at their
+    venue."""
+    venues = _existing_ids(Venue, {row['venue_id'] for row in rows})
+    artists = _existing_ids(Artist, {row['artist_id'] for row in rows})
+    valid, rejects = [], []
+    for row in rows:
+        if row['venue_id'] in venues and row['artist_id'] in artists:
+            valid.append(row)
+        else:
+            rejects.append((row, {'venue_id/artist_id': ['Does not exist.']}))
+    valid, overlapping = bookings.check_bookings(valid)
+    return valid, rejects + overlapping
+
+
+SHOW_COLUMNS = ('artist_id', 'venue_id', 'start_time', 'end_time')
+
+
+def read_show_lines(text):
+    """ Show records from lines of "artist_id, venue_id, start_time[, end_time]"."""
+    return [dict(zip(SHOW_COLUMNS, (value.strip() for value in line)))
+            for line in csv.reader(io.StringIO(text)) if ''.join(line).strip()]
+
+
+def show_rows(records):
+    """ Validates records with ShowForm: (rows, rejects)."""
+    rows, rejects = [], []
+    for record in records:
+        try:
+            rows.append(show_row(record))
+        except ValueError as error:
+            rejects.append((record, error.args[0]))
+    return rows, rejects
+
+
+KINDS = {
+    'venues': (Venue, venue_row, None),
+    'artists': (Artist, artist_row, None),
+    'shows': (performances, show_row, check_show_rows),
+}
+
+
+# ----------------------------------------------------------------------------#
+# Loading.
+# ----------------------------------------------------------------------------#
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        return '{' + ','.join(
+            '"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"'
+            for item in value) + '}'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def copy_rows(table, rows):
+    """ Loads rows with COPY ... FROM STDIN (Postgres only)."""
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([_copy_value(row[column]) for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY "{}" ({}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'.format(
+        table.name, ', '.join('"{}"'.format(column) for column in columns)), buffer)
+
+
+def insert_rows(table, rows):
+    if db.engine.dialect.name == 'postgresql':
+        copy_rows(table, rows)
+    else:
+        db.session.execute(table.insert(), rows)
+
+
+def load(kind, path, batch_size=5000, resume=True, on_batch=None, echo=print):
+    """ Streams `path` into the `kind` table in batches of `batch_size`, one
+    transaction each. Each batch records the number of records consumed so
+    far in ImportProgress in the same transaction, so a rerun continues
+    after the last committed batch and never loads one twice. Invalid
+    records are appended to `<path>.rejects`.
+
+    The rows reach the web workers' in-process search and autocomplete
+    indexes when those next reload, after SEARCH_INDEX_MAX_AGE and
+    AUTOCOMPLETE_MAX_AGE seconds: an import runs in a process of its own,
+    so it has no way to clear them."""
+    model, to_row, check = KINDS[kind]
+    table = getattr(model, '__table__', model)
+    source = os.path.abspath(path)
+    progress = db.session.get(ImportProgress, (kind, source))
+    done = 0
+    if progress is not None and resume:
+        done = progress.records
+        echo('Resuming {} after record {}'.format(path, done))
+
+    started = time.monotonic()
+    totals = {'loaded': 0, 'rejected': 0}
+    batch, rejects = [], []
+
+    def flush(position):
+        batch_started = time.monotonic()
+        rows = batch
+        if check is not None and rows:
+            rows, missing = check(rows)
+            rejects.extend(missing)
+        if rows:
+            insert_rows(table, rows)
+            if model in facets.KINDS:
+                facets.record_rows(db.session.connection(), model, rows)
+            elif model is performances:
+                rollups.record_shows(db.session.connection(), rows)
+        db.session.merge(ImportProgress(kind=kind, path=source, records=position))
+        db.session.commit()
+        if rejects:
+            with open(path + '.rejects', 'a') as f:
+                for record, errors in rejects:
+                    f.write(json.dumps({'record': record, 'errors': errors},
+                                       default=str) + '\n')
+        if on_batch is not None and rows:
+            on_batch(rows)
+        elapsed = time.monotonic() - batch_started
+        totals['loaded'] += len(rows)
+        totals['rejected'] += len(rejects)
+        echo('{}: {} rows in {:.2f}s ({:.0f} rows/s), {} rejected, {} records read'.format(
+            kind, len(rows), elapsed, len(rows) / elapsed if elapsed else 0,
+            len(rejects), position))
+        del batch[:]
+        del rejects[:]
+
+    position = done
+    try:
+        for position, record in enumerate(read_records(path), 1):
+            if position <= done:
+                continue
+            try:
+                batch.append(to_row(record))
+            except ValueError as error:
+                rejects.append((record, error.args[0]))
+            if len(batch) + len(rejects) >= batch_size:
+                flush(position)
+        if batch or rejects:
+            flush(position)
+        db.session.query(ImportProgress).filter_by(kind=kind, path=source).delete()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        echo('Import failed; rerun the same command to resume after the last committed batch.')
+        raise
+
+    elapsed = time.monotonic() - started
+    echo('Loaded {} {} in {:.2f}s ({:.0f} rows/s), {} rejected'.format(
+        totals['loaded'], kind, elapsed,
+        totals['loaded'] / elapsed if elapsed else 0, totals['rejected']))
+    return totals
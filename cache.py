@@ -0,0 +1,107 @@
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+class MemoryCache(object):
+    """ Bounded in-process LRU cache with per-entry TTL."""
+
+    # Other processes cannot reach it to invalidate entries.
+    shared = False
+
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache(object):
+    """ Cache shared by all workers through a local Redis server. Values are
+    stored as JSON. Eviction is the server's job (maxmemory + allkeys-lru);
+    entries also carry a TTL."""
+
+    shared = True
+
+    def __init__(self, url, default_ttl=300, prefix='fyyur:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value),
+                        ex=ttl or self.default_ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def createCache(app):
+    if app.config['CACHE_BACKEND'] == 'redis':
+        return RedisCache(app.config['CACHE_URL'], app.config['CACHE_TTL'])
+    return MemoryCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_TTL'])
+
+
+# Fragment keys carry the entity id, CACHE_VERSION, which is bumped whenever
+# the detail templates change shape, and the entity's own version column, so
+# an edit retires the old fragment in every worker.
+
+def venue_key(venue_id, cache_version, version):
+    return 'venue:{}:v{}.{}'.format(venue_id, cache_version, version)
+
+
+def artist_key(artist_id, cache_version, version):
+    return 'artist:{}:v{}.{}'.format(artist_id, cache_version, version)
+
+
+def fragment_ttl(details, ttl):
+    """ `ttl`, cut short at the start of the entity's next show: from then on
+    the fragment would still list that show as upcoming."""
+    if details['upcoming_shows']:
+        starts_in = (details['upcoming_shows'][0]['start_time']
+                     - datetime.now()).total_seconds()
+        ttl = max(1, min(ttl, math.ceil(starts_in)))
+    return ttl
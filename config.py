@@ -1,7 +1,116 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Signs the session cookie (flash messages, CSRF tokens). Set it when
+# running several workers: a random key differs per process.
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-SQLALCHEMY_DATABASE_URI = 'postgresql://chaudo@localhost:5432/chaudn1'
+SQLALCHEMY_DATABASE_URI = os.environ.get(
+    'DATABASE_URL', 'postgresql://chaudo@localhost:5432/chaudn1')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+# Read replicas: comma-separated URLs in DATABASE_REPLICA_URLS, e.g.
+# sqlite:///replica1.db,sqlite:///replica2.db locally. GET requests read
+# from them in turn; a client that wrote in the last REPLICA_STICKY_SECONDS
+# reads from the primary, and a replica that fails to connect is skipped
+# for REPLICA_RETRY_SECONDS.
+REPLICA_URLS = [url.strip() for url in
+                os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+SQLALCHEMY_BINDS = {'replica_{}'.format(i): url for i, url in enumerate(REPLICA_URLS)}
+REPLICA_STICKY_SECONDS = 10
+REPLICA_RETRY_SECONDS = 30
+
+# Connection pool per engine. Each worker holds up to DB_POOL_SIZE +
+# DB_MAX_OVERFLOW connections and waits DB_POOL_TIMEOUT seconds for one
+# before failing the request. DB_POOL=null opens a connection per checkout,
+# leaving pooling to PgBouncer; DB_PGBOUNCER=1 turns off prepared
+# statements for its transaction mode.
+DB_POOL = os.environ.get('DB_POOL', 'queue')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '0') == '1'
+
+# Experimental: serve /venues and the venue and artist pages from async
+# views whose independent queries run concurrently. That shortens those
+# pages on a networked database but does not let a worker serve more
+# requests; see aio.py for what it needs and what it gains.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', '0') == '1'
+
+# Results per page on /venues/search and /artists/search.
+SEARCH_PAGE_SIZE = 20
+
+# The in-process search index (SQLite) is reloaded after this many seconds,
+# picking up writes made by other processes.
+SEARCH_INDEX_MAX_AGE = 300
+
+# Suggestions returned by /autocomplete. Each process keeps its own prefix
+# index and reloads it every AUTOCOMPLETE_MAX_AGE seconds, picking up other
+# processes' writes and shows that have since taken place.
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_AGE = 300
+
+# Rows per page on the /venues, /artists and /shows listings.
+LIST_PAGE_SIZE = 50
+
+# Venues returned by /venues/nearby unless k= asks for more (up to
+# LIST_PAGE_SIZE).
+NEARBY_LIMIT = 10
+
+# Rows fetched per round trip by streamed exports such as /api/v1/shows/export.
+EXPORT_CHUNK_SIZE = 1000
+
+# Upcoming and past shows listed on a venue or artist page; older past
+# shows are loaded this many at a time.
+SHOW_SECTION_LIMIT = 12
+
+# Similar artists listed on an artist page; see recommendations.py.
+SIMILAR_ARTISTS = 6
+
+# Length of a show booked without an end time.
+SHOW_DURATION_MINUTES = 120
+
+# Shows one submission of /shows/create/batch may list.
+SHOW_BATCH_LIMIT = 200
+
+# Postgres partitioning of Show (flask maintain-partitions): monthly
+# partitions are created this many months ahead, and months that ended more
+# than SHOW_HOT_MONTHS ago are folded into the archive partition, optionally
+# kept in a slower SHOW_ARCHIVE_TABLESPACE.
+SHOW_PARTITION_MONTHS_AHEAD = 12
+SHOW_HOT_MONTHS = 12
+SHOW_ARCHIVE_TABLESPACE = os.environ.get('SHOW_ARCHIVE_TABLESPACE')
+
+# Detail page fragment cache. CACHE_BACKEND is 'memory' (per process, so
+# `flask import` cannot invalidate it and workers wait out CACHE_TTL) or
+# 'redis' (shared by all workers, see CACHE_URL; needs the redis package from
+# requirements-optional.txt). Bump CACHE_VERSION when the fragment templates
+# change.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+CACHE_URL = os.environ.get('CACHE_URL', 'redis://localhost:6379/0')
+CACHE_MAX_ENTRIES = 1024
+CACHE_TTL = 300
+CACHE_VERSION = 3
+
+# Requests slower than SLOW_REQUEST_THRESHOLD seconds are logged with their
+# slowest SQL statements (at most SLOW_REQUEST_STATEMENTS). 0 turns it off.
+SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 0))
+SLOW_REQUEST_STATEMENTS = 10
+
+# Logging. Records are handed to a background thread through a queue of at
+# most LOG_QUEUE_SIZE records (further records are dropped, never waited
+# on) and written as JSON lines to LOG_FILE, rotated at LOG_MAX_BYTES.
+# LOG_SAMPLING keeps a fraction of a logger's records below WARNING;
+# LOG_RATE_LIMITS caps those records at that many per second. queries logs
+# at DEBUG on every detail and past-shows page, so it needs both. Only the
+# app's logger and the loggers named here are routed; the root logger is
+# left to whoever embeds the app.
+LOG_FILE = os.environ.get('LOG_FILE', os.path.join(basedir, 'logs', 'fyyur.log'))
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000
+LOG_SAMPLING = {'queries': 0.1}
+LOG_RATE_LIMITS = {'queries': 50, 'app': 100}
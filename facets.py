@@ -0,0 +1,122 @@
+from collections import Counter
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from enums import Genre, State
+from models import db, Venue, Artist, FacetCount
+
+KINDS = {Venue: 'venue', Artist: 'artist'}
+
+
+def contributions(state, genres):
+    keys = [(state or '', '')]
+    keys += [(state or '', genre) for genre in set(genres or [])]
+    return keys
+
+
+def apply_deltas(connection, kind, deltas):
+    """ Adds `deltas`, a Counter of (state, genre) -> change, to the facet
+    table inside the caller's transaction."""
+    rows = [{'kind': kind, 'state': state, 'genre': genre, 'count': change}
+            for (state, genre), change in deltas.items() if change]
+    if not rows:
+        return
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(FacetCount.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['kind', 'state', 'genre'],
+        set_={'count': FacetCount.__table__.c.count + statement.excluded['count']})
+    connection.execute(statement, rows)
+
+
+def record(connection, model, state, genres, sign=1):
+    deltas = Counter()
+    for key in contributions(state, genres):
+        deltas[key] += sign
+    apply_deltas(connection, KINDS[model], deltas)
+
+
+def record_rows(connection, model, rows):
+    deltas = Counter()
+    for row in rows:
+        deltas.update(contributions(row['state'], row['genres']))
+    apply_deltas(connection, KINDS[model], deltas)
+
+
+def _old_value(target, key):
+    history = inspect(target).attrs[key].history
+    return history.deleted[0] if history.deleted else getattr(target, key)
+
+
+def _after_insert(mapper, connection, target):
+    record(connection, type(target), target.state, target.genres)
+
+
+def _after_update(mapper, connection, target):
+    deltas = Counter(contributions(target.state, target.genres))
+    deltas.subtract(contributions(_old_value(target, 'state'),
+                                  _old_value(target, 'genres')))
+    apply_deltas(connection, KINDS[type(target)], deltas)
+
+
+def _after_delete(mapper, connection, target):
+    record(connection, type(target), target.state, target.genres, -1)
+
+
+for _model in KINDS:
+    event.listen(_model, 'after_insert', _after_insert)
+    event.listen(_model, 'after_update', _after_update)
+    event.listen(_model, 'after_delete', _after_delete)
+
+
+def genre_filter(model, genre):
+    if db.engine.dialect.name == 'postgresql':
+        return model.genres.contains([genre])
+    genres = func.json_each(model.genres).table_valued('value')
+    return select(genres.c.value).where(genres.c.value == genre).exists()
+
+
+def facet_counts(model, state=None, genre=None):
+    """ Counts for every Genre and State value under the other facet's
+    current selection, read from the facet table only."""
+    genre_rows, state_rows = facet_queries(model, state, genre)
+    return facet_lists(genre_rows.all(), state_rows.all())
+
+
+def facet_queries(model, state=None, genre=None):
+    kind = KINDS[model]
+    query = db.session.query
+    if state:
+        genre_rows = query(FacetCount.genre, FacetCount.count)\
+            .filter(FacetCount.kind == kind, FacetCount.state == state,
+                    FacetCount.genre != '')
+    else:
+        genre_rows = query(FacetCount.genre, func.sum(FacetCount.count))\
+            .filter(FacetCount.kind == kind, FacetCount.genre != '')\
+            .group_by(FacetCount.genre)
+    state_rows = query(FacetCount.state, FacetCount.count)\
+        .filter(FacetCount.kind == kind, FacetCount.genre == (genre or ''))
+    return genre_rows, state_rows
+
+
+def facet_lists(genre_rows, state_rows):
+    genres = dict(genre_rows)
+    states = dict(state_rows)
+    return {
+        'genres': [(g.value, genres.get(g.value, 0)) for g in Genre],
+        'states': [(s.value, states.get(s.value, 0)) for s in State],
+    }
+
+
+def rebuild():
+    """ Recomputes the facet table from scratch in one transaction."""
+    with db.engine.begin() as connection:
+        connection.execute(FacetCount.__table__.delete())
+        for model, kind in KINDS.items():
+            deltas = Counter()
+            rows = connection.execution_options(yield_per=1000)\
+                .execute(select(model.state, model.genres))
+            for row in rows:
+                deltas.update(contributions(row.state, row.genres))
+            apply_deltas(connection, kind, deltas)
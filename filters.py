@@ -0,0 +1,24 @@
+from functools import lru_cache
+
+import babel
+import babel.dates
+import dateutil.parser
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@lru_cache(maxsize=64)
+def compiled_datetime_format(format, locale):
+    """ Parsed Babel pattern and Locale for a (format, locale) pair."""
+    pattern = DATETIME_FORMATS.get(format, format)
+    return babel.dates.parse_pattern(pattern), babel.Locale.parse(locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    if isinstance(value, str):
+        value = dateutil.parser.parse(value)
+    pattern, locale = compiled_datetime_format(format, locale)
+    return pattern.apply(value, locale)
@@ -1,7 +1,9 @@
 from datetime import datetime
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField
-from wtforms.validators import DataRequired, AnyOf, URL, Regexp
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, \
+    FloatField, HiddenField, IntegerField, TextAreaField
+from wtforms.validators import DataRequired, AnyOf, URL, Regexp, Optional, \
+    ValidationError, NumberRange
 
 from enums import Genre, State
 
@@ -18,6 +20,64 @@ class ShowForm(Form):
         validators=[DataRequired()],
         default=datetime.today()
     )
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
+
+    def validate_end_time(self, field):
+        if field.data and self.start_time.data and field.data <= self.start_time.data:
+            raise ValidationError('End time must be after the start time.')
+
+
+class ShowBatchForm(Form):
+    # Either a list of shows, one "artist_id, venue_id, start_time[, end_time]"
+    # per line, or one show and how it repeats.
+    shows = TextAreaField(
+        'shows'
+    )
+    artist_id = StringField(
+        'artist_id'
+    )
+    venue_id = StringField(
+        'venue_id'
+    )
+    start_time = DateTimeField(
+        'start_time',
+        validators=[Optional()]
+    )
+    end_time = DateTimeField(
+        'end_time',
+        validators=[Optional()]
+    )
+    frequency = SelectField(
+        'frequency',
+        choices=[('daily', 'days'), ('weekly', 'weeks'), ('monthly', 'months')],
+        default='weekly'
+    )
+    interval = IntegerField(
+        'interval',
+        validators=[Optional(), NumberRange(min=1)],
+        default=1
+    )
+    occurrences = IntegerField(
+        'occurrences',
+        validators=[Optional(), NumberRange(min=1)]
+    )
+
+    def validate_shows(self, field):
+        repeated = self.artist_id.data or self.venue_id.data or self.start_time.data
+        if field.data and field.data.strip():
+            if repeated:
+                raise ValidationError('List shows or repeat one, not both.')
+        elif not (self.artist_id.data and self.venue_id.data and self.start_time.data
+                  and self.occurrences.data):
+            raise ValidationError(
+                'List shows, or give an artist, venue, start time and occurrences.')
+
+    def validate_end_time(self, field):
+        if field.data and self.start_time.data and field.data <= self.start_time.data:
+            raise ValidationError('End time must be after the start time.')
 
 
 class VenueForm(Form):
@@ -86,6 +146,13 @@ class VenueForm(Form):
     address = StringField(
         'address', validators=[DataRequired()]
     )
+    # Left blank, the venue is placed at its city's centroid.
+    latitude = FloatField(
+        'latitude', validators=[Optional(), NumberRange(-90, 90)]
+    )
+    longitude = FloatField(
+        'longitude', validators=[Optional(), NumberRange(-180, 180)]
+    )
     phone = StringField(
         'phone', validators=[Regexp('^\d{3}-\d{3}-\d{4}$', message='Invalid phone format (should be xxx-xxx-xxxx)')]
     )
@@ -130,6 +197,9 @@ class VenueForm(Form):
         'seeking_description'
     )
 
+    # The version the edit form was loaded at; see edit_venue_submission().
+    version = HiddenField('version')
+
 
 class ArtistForm(Form):
     name = StringField(
@@ -168,3 +238,5 @@ class ArtistForm(Form):
     seeking_description = StringField(
         'seeking_description'
     )
+
+    version = HiddenField('version')
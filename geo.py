@@ -0,0 +1,129 @@
+import csv
+import math
+import os
+from functools import lru_cache
+
+# Venues are indexed by geocell: the geohash of their coordinates as an
+# integer, PRECISION characters (5 bits each) deep. All points in a geohash
+# cell share its bit prefix, so every cell is one contiguous range of
+# geocells and a plain B-tree index answers "venues in these cells".
+PRECISION = 12
+BITS = 5 * PRECISION
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+CENTROIDS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'data', 'centroids.csv')
+
+
+def encode(latitude, longitude, bits=BITS):
+    """ The first `bits` bits of the geohash of a point, as an integer."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    value = 0
+    for i in range(bits):
+        value <<= 1
+        if i % 2 == 0:
+            middle = (lon_lo + lon_hi) / 2
+            if longitude >= middle:
+                value |= 1
+                lon_lo = middle
+            else:
+                lon_hi = middle
+        else:
+            middle = (lat_lo + lat_hi) / 2
+            if latitude >= middle:
+                value |= 1
+                lat_lo = middle
+            else:
+                lat_hi = middle
+    return value
+
+
+def cell_size(precision):
+    """ (height, width) in degrees of the cells `precision` characters deep."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def reach(latitude, precision):
+    """ Distance in km from a point within which everything lies in the
+    3x3 block of cells around it: one cell's smallest extent."""
+    if precision == 0:
+        return math.inf
+    height, width = cell_size(precision)
+    narrowest = min(90.0, abs(latitude) + 2 * height)
+    across = math.sin(math.radians(min(width, 90.0))) * math.cos(math.radians(narrowest))
+    return min(height * KM_PER_DEGREE, EARTH_RADIUS_KM * math.asin(across))
+
+
+def covering(latitude, longitude, precision):
+    """ Merged [low, high) geocell ranges of the 3x3 block of cells
+    `precision` characters deep around a point; precision 0 is the globe."""
+    height, width = cell_size(precision)
+    shift = BITS - 5 * precision
+    prefixes = set()
+    for dlat in (-height, 0, height):
+        lat = latitude + dlat
+        if not -90 <= lat <= 90:
+            continue
+        for dlon in (-width, 0, width):
+            lon = (longitude + dlon + 180) % 360 - 180
+            prefixes.add(encode(lat, lon, 5 * precision))
+    ranges = []
+    for prefix in sorted(prefixes):
+        low, high = prefix << shift, (prefix + 1) << shift
+        if ranges and ranges[-1][1] == low:
+            ranges[-1][1] = high
+        else:
+            ranges.append([low, high])
+    return ranges
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """ Great-circle distance in km."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+@lru_cache(maxsize=1)
+def centroids():
+    """ {(city, state): (latitude, longitude)}; city is '' for a state's
+    centroid. Cities are lowercased."""
+    with open(CENTROIDS, newline='') as f:
+        return {(row['city'].strip().lower(), row['state']):
+                (float(row['latitude']), float(row['longitude']))
+                for row in csv.DictReader(f)}
+
+
+def centroid(city, state):
+    table = centroids()
+    return table.get(((city or '').strip().lower(), state)) or table.get(('', state))
+
+
+def location(city, state, latitude=None, longitude=None):
+    """ Coordinates and geocell of a venue: the given coordinates, or else
+    the centroid of its city, or else of its state."""
+    if latitude is None or longitude is None:
+        latitude, longitude = centroid(city, state) or (None, None)
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'geocell': encode(latitude, longitude) if latitude is not None else None,
+    }
+
+
+def search_params(args, default_limit, max_limit):
+    """ (latitude, longitude, radius, limit) from lat, lon, radius (km) and
+    k request arguments. Raises ValueError if they are missing or invalid."""
+    latitude, longitude = float(args['lat']), float(args['lon'])
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError('lat/lon out of range')
+    radius = float(args['radius']) if args.get('radius') else None
+    if radius is not None and not radius > 0:
+        raise ValueError('radius must be positive')
+    limit = min(int(args.get('k') or default_limit), max_limit)
+    if limit < 1:
+        raise ValueError('k must be positive')
+    return latitude, longitude, radius, limit
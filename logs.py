@@ -0,0 +1,150 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import has_request_context, request
+from flask.logging import default_handler
+
+from metrics import LOG_RECORDS_DROPPED
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message'}
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc)
+                            .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestFilter(logging.Filter):
+    """ Adds the method and path of the current request, if any."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+            record.endpoint = request.endpoint
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """ Lets through a `rate` fraction of records below WARNING."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class RateLimitFilter(logging.Filter):
+    """ Token bucket over the records below WARNING: at most `per_second` on
+    average, bursts of up to `burst`. Records over the limit are dropped and
+    counted; warnings and errors always pass."""
+
+    def __init__(self, per_second, burst=None):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst or per_second
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.per_second)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            LOG_RECORDS_DROPPED.inc(record.name, 'rate_limit')
+            return False
+
+
+class DroppingQueueHandler(QueueHandler):
+    """ Hands records to the listener thread without ever blocking: when the
+    bounded queue is full the record is dropped and counted."""
+
+    def prepare(self, record):
+        # Render the message and traceback now, while the objects they refer
+        # to are still what the request saw.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(record.name, 'queue_full')
+
+
+def createLogging(app):
+    """ Routes the records of app.logger and of the loggers named in
+    LOG_SAMPLING and LOG_RATE_LIMITS through a bounded queue to a thread that
+    writes them as JSON lines to a size-rotated LOG_FILE. The request thread
+    only pays for building the record; disabled levels cost one check."""
+    config = app.config
+    handler = DroppingQueueHandler(queue.Queue(config['LOG_QUEUE_SIZE']))
+    handler.addFilter(RequestFilter())
+    directory = os.path.dirname(config['LOG_FILE'])
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    file_handler = RotatingFileHandler(config['LOG_FILE'],
+                                       maxBytes=config['LOG_MAX_BYTES'],
+                                       backupCount=config['LOG_BACKUP_COUNT'])
+    file_handler.setFormatter(JsonFormatter())
+    handlers = [file_handler]
+    if app.debug:
+        handlers.append(logging.StreamHandler())
+    listener = QueueListener(handler.queue, *handlers)
+
+    app.logger.removeHandler(default_handler)
+    names = {app.logger.name, *config['LOG_SAMPLING'], *config['LOG_RATE_LIMITS']}
+    for name in names:
+        logger = logging.getLogger(name)
+        logger.addHandler(handler)
+        logger.setLevel(config['LOG_LEVEL'])
+    for name, rate in config['LOG_SAMPLING'].items():
+        logging.getLogger(name).addFilter(SamplingFilter(rate))
+    for name, per_second in config['LOG_RATE_LIMITS'].items():
+        logging.getLogger(name).addFilter(RateLimitFilter(per_second))
+
+    listener.start()
+    atexit.register(listener.stop)
+    return handler
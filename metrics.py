@@ -0,0 +1,251 @@
+import threading
+import time
+from functools import partial
+
+from flask import g, has_app_context, request, before_render_template, \
+    template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+# ----------------------------------------------------------------------------#
+# Metric types.
+# ----------------------------------------------------------------------------#
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, _escape(value))
+                          for name, value in pairs) + '}'
+
+
+class Counter(object):
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield '{}{} {}'.format(self.name, _labels(self.labels, labels), value)
+
+
+class Histogram(object):
+    """ Cumulative buckets plus _sum and _count per label set, in the shape
+    Prometheus expects."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, list(counts))
+                            for labels, counts in self._values.items())
+        for labels, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                total += count
+                yield '{}_bucket{} {}'.format(self.name, _labels(
+                    self.labels, labels, [('le', bound)]), total)
+            yield '{}_sum{} {}'.format(self.name, _labels(self.labels, labels), counts[-1])
+            yield '{}_count{} {}'.format(self.name, _labels(self.labels, labels), total)
+
+
+class Gauge(object):
+    """ Current values, read from `collect` at scrape time: a callable
+    returning (labels, value) pairs."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), collect=None):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+
+    def samples(self):
+        if self.collect is None:
+            return
+        for labels, value in sorted(self.collect()):
+            yield '{}{} {}'.format(self.name, _labels(self.labels, labels), value)
+
+
+REQUESTS = Counter('fyyur_requests_total', 'Requests served.',
+                   ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = Histogram('fyyur_request_duration_seconds',
+                            'Request latency, including streamed bodies.',
+                            ('endpoint', 'method'))
+REQUEST_QUERIES = Histogram('fyyur_request_queries',
+                            'SQL statements executed per request.',
+                            ('endpoint',), QUERY_COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('fyyur_request_sql_seconds',
+                                'Time spent in SQL per request.', ('endpoint',))
+SQL_SECONDS = Histogram('fyyur_sql_query_duration_seconds',
+                        'SQL statement latency.', ('operation',))
+TEMPLATE_SECONDS = Histogram('fyyur_template_render_seconds',
+                             'Jinja render time per template.', ('template',))
+LOG_RECORDS_DROPPED = Counter('fyyur_log_records_dropped_total',
+                              'Log records dropped by rate limits or a full queue.',
+                              ('logger', 'reason'))
+REPLICA_FALLBACKS = Counter('fyyur_replica_fallbacks_total',
+                            'Requests moved to the primary because their replica was down.',
+                            ('replica',))
+POOL_CONNECTIONS = Gauge('fyyur_db_pool_connections',
+                         'Pooled connections by state: checked_out, idle, overflow, size.',
+                         ('bind', 'state'))
+POOL_WAIT_SECONDS = Histogram('fyyur_db_pool_wait_seconds',
+                              'Time spent waiting to check out a pooled connection.',
+                              ('bind',))
+POOL_TIMEOUTS = Counter('fyyur_db_pool_timeouts_total',
+                        'Checkouts that gave up after DB_POOL_TIMEOUT seconds.',
+                        ('bind',))
+
+METRICS = [REQUESTS, REQUEST_SECONDS, REQUEST_QUERIES, REQUEST_SQL_SECONDS,
+           SQL_SECONDS, TEMPLATE_SECONDS, LOG_RECORDS_DROPPED, REPLICA_FALLBACKS,
+           POOL_CONNECTIONS, POOL_WAIT_SECONDS, POOL_TIMEOUTS]
+
+
+def render():
+    """ All metrics of this process in the Prometheus text format."""
+    lines = []
+    for metric in METRICS:
+        lines.append('# HELP {} {}'.format(metric.name, metric.help))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+        lines.extend(metric.samples())
+    return '\n'.join(lines) + '\n'
+
+
+# ----------------------------------------------------------------------------#
+# Collection.
+# ----------------------------------------------------------------------------#
+
+class RequestStats(object):
+    """ SQL executed on behalf of one request. Statements are only kept when
+    the slow request log is on."""
+
+    def __init__(self, keep_statements):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.statements = [] if keep_statements else None
+
+
+def _current_stats():
+    return g.get('_request_stats') if has_app_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_started'].pop()
+    SQL_SECONDS.observe(elapsed, statement.lstrip().split(None, 1)[0].upper())
+    stats = _current_stats()
+    if stats is not None:
+        stats.queries += 1
+        stats.sql_seconds += elapsed
+        if stats.statements is not None:
+            stats.statements.append((elapsed, statement))
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start
+    # time so it does not stay on the pooled connection.
+    connection = context.connection
+    if connection is not None and context.execution_context is not None \
+            and connection.info.get('query_started'):
+        connection.info['query_started'].pop()
+
+
+def _before_render(app, template, context, **extra):
+    if has_app_context():
+        g.setdefault('_template_started', []).append(time.perf_counter())
+
+
+def _rendered(app, template, context, **extra):
+    if has_app_context() and g.get('_template_started'):
+        TEMPLATE_SECONDS.observe(time.perf_counter() - g._template_started.pop(),
+                                 template.name)
+
+
+def _finish(app, stats, endpoint, method, status, path):
+    elapsed = time.perf_counter() - stats.started
+    REQUESTS.inc(endpoint, method, status)
+    REQUEST_SECONDS.observe(elapsed, endpoint, method)
+    REQUEST_QUERIES.observe(stats.queries, endpoint)
+    REQUEST_SQL_SECONDS.observe(stats.sql_seconds, endpoint)
+    threshold = app.config['SLOW_REQUEST_THRESHOLD']
+    if threshold and elapsed >= threshold:
+        slowest = sorted(stats.statements, key=lambda item: item[0], reverse=True)
+        app.logger.warning('Slow request %s %s: %.0fms', method, path, elapsed * 1000, extra={
+            'duration_ms': round(elapsed * 1000, 1),
+            'queries': stats.queries,
+            'sql_ms': round(stats.sql_seconds * 1000, 1),
+            'statements': [{'ms': round(seconds * 1000, 1), 'sql': ' '.join(statement.split())}
+                           for seconds, statement in slowest[:app.config['SLOW_REQUEST_STATEMENTS']]],
+        })
+
+
+def createMetrics(app):
+    """ Times every request, the SQL it runs and the templates it renders.
+    The numbers are per process; scrape each worker."""
+
+    @app.before_request
+    def start_request_stats():
+        g._request_stats = RequestStats(bool(app.config['SLOW_REQUEST_THRESHOLD']))
+
+    @app.after_request
+    def finish_request_stats(response):
+        stats = g.get('_request_stats')
+        if stats is not None:
+            # Streamed bodies are still being rendered here; the numbers are
+            # final once the server closes the response.
+            response.call_on_close(partial(
+                _finish, app, stats, request.endpoint or 'unknown',
+                request.method, response.status_code, request.full_path.rstrip('?')))
+        return response
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
@@ -0,0 +1,82 @@
+"""show boundary overlaps
+
+Revision ID: 3e8d5b1f6a27
+Revises: 7a3f0c92d4e8
+Create Date: 2023-05-30 16:48:02.615374
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e8d5b1f6a27'
+down_revision = '7a3f0c92d4e8'
+branch_labels = None
+depends_on = None
+
+UNGUARDED = ['Show_archive', 'Show_default']
+
+
+def upgrade():
+    # f2c8a5d36e19 left these two without the exclusion constraint every
+    # monthly partition has; imports can still add past shows.
+    for name in UNGUARDED:
+        op.execute(f'''
+            ALTER TABLE "{name}" ADD CONSTRAINT "ex_{name.lower()}_period"
+            EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)
+        ''')
+
+    # Exclusion constraints only hold within a partition. Two shows in
+    # different partitions can only overlap across a month boundary: the
+    # later one starts in a month the earlier one runs into. Since a venue's
+    # shows never overlap, the only earlier show that can reach into the new
+    # show's month is the last one starting before it, and the only later
+    # ones are those starting between the next month and the new show's end.
+    # The advisory lock serializes a venue's bookings, so each check sees
+    # the other's committed row.
+    op.execute('''
+        CREATE FUNCTION show_check_boundary_overlap() RETURNS trigger AS $$
+        DECLARE
+            month_start timestamp := date_trunc('month', NEW.start_time);
+            clash record;
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('Show'), NEW.venue_id);
+            SELECT start_time, end_time INTO clash FROM "Show"
+            WHERE venue_id = NEW.venue_id AND start_time < month_start
+            ORDER BY start_time DESC LIMIT 1;
+            IF FOUND AND clash.end_time > NEW.start_time THEN
+                RAISE EXCEPTION 'Venue % is already booked from % to %',
+                    NEW.venue_id, clash.start_time, clash.end_time
+                    USING ERRCODE = 'exclusion_violation',
+                          CONSTRAINT = 'ex_show_boundary_period';
+            END IF;
+            IF NEW.end_time > month_start + interval '1 month' THEN
+                SELECT start_time, end_time INTO clash FROM "Show"
+                WHERE venue_id = NEW.venue_id
+                  AND start_time >= month_start + interval '1 month'
+                  AND start_time < NEW.end_time
+                ORDER BY start_time LIMIT 1;
+                IF FOUND THEN
+                    RAISE EXCEPTION 'Venue % is already booked from % to %',
+                        NEW.venue_id, clash.start_time, clash.end_time
+                        USING ERRCODE = 'exclusion_violation',
+                              CONSTRAINT = 'ex_show_boundary_period';
+                END IF;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    op.execute('''
+        CREATE TRIGGER tr_show_boundary_overlap
+        AFTER INSERT OR UPDATE OF venue_id, start_time, end_time ON "Show"
+        FOR EACH ROW EXECUTE FUNCTION show_check_boundary_overlap()
+    ''')
+
+
+def downgrade():
+    op.execute('DROP TRIGGER tr_show_boundary_overlap ON "Show"')
+    op.execute('DROP FUNCTION show_check_boundary_overlap()')
+    for name in UNGUARDED:
+        op.execute(f'ALTER TABLE "{name}" DROP CONSTRAINT "ex_{name.lower()}_period"')
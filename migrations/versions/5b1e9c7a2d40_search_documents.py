@@ -0,0 +1,44 @@
+"""search documents
+
+Revision ID: 5b1e9c7a2d40
+Revises: 23a4f7d19ac1
+Create Date: 2023-03-26 14:02:51.318406
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e9c7a2d40'
+down_revision = '23a4f7d19ac1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('search_document', sa.Text(),
+                                       nullable=False, server_default=''))
+        op.execute(f'''
+            UPDATE "{table}" SET search_document = lower(concat_ws(' ',
+                name, city, state, array_to_string(genres, ' ')))
+        ''')
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table in ('Venue', 'Artist'):
+        op.execute(f'''
+            CREATE INDEX ix_{table.lower()}_search_fts ON "{table}"
+            USING gin (to_tsvector('simple', search_document))
+        ''')
+        op.execute(f'''
+            CREATE INDEX ix_{table.lower()}_search_trgm ON "{table}"
+            USING gin (search_document gin_trgm_ops)
+        ''')
+
+
+def downgrade():
+    for table in ('Venue', 'Artist'):
+        op.drop_index(f'ix_{table.lower()}_search_trgm', table_name=table)
+        op.drop_index(f'ix_{table.lower()}_search_fts', table_name=table)
+        op.drop_column(table, 'search_document')
@@ -0,0 +1,42 @@
+"""show end time default
+
+Revision ID: 7a3f0c92d4e8
+Revises: c4d9a1e7f352
+Create Date: 2023-05-29 11:06:13.472950
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3f0c92d4e8'
+down_revision = 'c4d9a1e7f352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A column default cannot refer to start_time, so inserts that leave
+    # end_time out get config.SHOW_DURATION_MINUTES (120) from a trigger,
+    # like the backfill in e7b2d94a1c05. BEFORE ROW triggers run before the
+    # NOT NULL check, and partitions created later inherit it.
+    op.execute('''
+        CREATE FUNCTION show_default_end_time() RETURNS trigger AS $$
+        BEGIN
+            IF NEW.end_time IS NULL THEN
+                NEW.end_time := NEW.start_time + interval '120 minutes';
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    ''')
+    op.execute('''
+        CREATE TRIGGER tr_show_default_end_time BEFORE INSERT ON "Show"
+        FOR EACH ROW EXECUTE FUNCTION show_default_end_time()
+    ''')
+
+
+def downgrade():
+    op.execute('DROP TRIGGER tr_show_default_end_time ON "Show"')
+    op.execute('DROP FUNCTION show_default_end_time()')
@@ -0,0 +1,36 @@
+"""lookup indexes
+
+Revision ID: 8c2f4e61b9d3
+Revises: 5b1e9c7a2d40
+Create Date: 2023-04-02 10:41:07.552913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2f4e61b9d3'
+down_revision = '5b1e9c7a2d40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_venue_start_time', 'Show', ['venue_id', 'start_time'])
+    op.create_index('ix_show_artist_start_time', 'Show', ['artist_id', 'start_time'])
+    op.create_index('ix_show_start_time', 'Show', ['start_time', 'id'])
+    op.create_index('ix_venue_area', 'Venue', ['state', 'city', 'name', 'id'])
+    op.create_index('ix_artist_name', 'Artist', ['name', 'id'])
+    op.create_index('ix_venue_genres', 'Venue', ['genres'], postgresql_using='gin')
+    op.create_index('ix_artist_genres', 'Artist', ['genres'], postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_artist_genres', table_name='Artist')
+    op.drop_index('ix_venue_genres', table_name='Venue')
+    op.drop_index('ix_artist_name', table_name='Artist')
+    op.drop_index('ix_venue_area', table_name='Venue')
+    op.drop_index('ix_show_start_time', table_name='Show')
+    op.drop_index('ix_show_artist_start_time', table_name='Show')
+    op.drop_index('ix_show_venue_start_time', table_name='Show')
@@ -0,0 +1,36 @@
+"""listing keys not null
+
+Revision ID: 9e4b2a7c5d61
+Revises: a61c4f9e2b38
+Create Date: 2023-05-27 09:12:44.105238
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b2a7c5d61'
+down_revision = 'a61c4f9e2b38'
+branch_labels = None
+depends_on = None
+
+# The keyset pagination columns; a NULL in any of them drops the row from
+# row-value comparisons.
+COLUMNS = {
+    'Venue': ['name', 'city', 'state'],
+    'Artist': ['name'],
+}
+
+
+def upgrade():
+    for table, columns in COLUMNS.items():
+        for column in columns:
+            op.execute(f'UPDATE "{table}" SET {column} = \'\' WHERE {column} IS NULL')
+            op.alter_column(table, column, nullable=False)
+
+
+def downgrade():
+    for table, columns in COLUMNS.items():
+        for column in columns:
+            op.alter_column(table, column, nullable=True)
@@ -0,0 +1,42 @@
+"""facet counts
+
+Revision ID: a4d7e2c91f58
+Revises: 8c2f4e61b9d3
+Create Date: 2023-04-09 16:27:33.104582
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7e2c91f58'
+down_revision = '8c2f4e61b9d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('FacetCount',
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('genre', sa.String(length=120), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'state', 'genre')
+    )
+    for kind, table in (('venue', 'Venue'), ('artist', 'Artist')):
+        op.execute(f'''
+            INSERT INTO "FacetCount" (kind, state, genre, count)
+            SELECT '{kind}', coalesce(state, ''), '', count(*)
+            FROM "{table}" GROUP BY coalesce(state, '')
+        ''')
+        op.execute(f'''
+            INSERT INTO "FacetCount" (kind, state, genre, count)
+            SELECT '{kind}', coalesce(state, ''), genre, count(DISTINCT id)
+            FROM "{table}", unnest(genres) AS genre
+            GROUP BY coalesce(state, ''), genre
+        ''')
+
+
+def downgrade():
+    op.drop_table('FacetCount')
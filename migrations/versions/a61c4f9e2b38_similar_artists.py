@@ -0,0 +1,34 @@
+"""similar artists
+
+Revision ID: a61c4f9e2b38
+Revises: d83f0b6e4c17
+Create Date: 2023-05-20 10:17:36.904512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a61c4f9e2b38'
+down_revision = 'd83f0b6e4c17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled by `flask rebuild-recommendations` once the schema is current.
+    op.create_table('SimilarArtist',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('similar_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('artist_id', 'rank')
+    )
+    op.create_index('ix_similar_artist_similar', 'SimilarArtist',
+                    ['similar_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_similar_artist_similar', table_name='SimilarArtist')
+    op.drop_table('SimilarArtist')
@@ -0,0 +1,75 @@
+"""booking rollups
+
+Revision ID: b5e1d7c3a920
+Revises: f2c8a5d36e19
+Create Date: 2023-05-06 14:42:11.380257
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e1d7c3a920'
+down_revision = 'f2c8a5d36e19'
+branch_labels = None
+depends_on = None
+
+# Shows whose venue and artist both exist, as rollups.rebuild() counts them.
+SHOWS = '''
+    FROM "Show" s
+    JOIN "Venue" v ON v.id = s.venue_id
+    JOIN "Artist" a ON a.id = s.artist_id
+'''
+
+
+def upgrade():
+    op.create_table('VenueMonthShows',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('venue_id', 'month')
+    )
+    op.create_index('ix_venue_month_shows_month', 'VenueMonthShows',
+                    ['month', 'shows'], unique=False)
+    op.create_table('ArtistBookings',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('artist_id')
+    )
+    op.create_index('ix_artist_bookings_shows', 'ArtistBookings',
+                    ['shows', 'artist_id'], unique=False)
+    op.create_table('GenreDemand',
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('genre', sa.String(length=120), nullable=False),
+    sa.Column('shows', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('state', 'genre')
+    )
+
+    op.execute(f'''
+        INSERT INTO "VenueMonthShows" (venue_id, month, shows)
+        SELECT s.venue_id, date_trunc('month', s.start_time)::date, count(*)
+        {SHOWS}
+        GROUP BY 1, 2
+    ''')
+    op.execute(f'''
+        INSERT INTO "ArtistBookings" (artist_id, shows)
+        SELECT s.artist_id, count(*)
+        {SHOWS}
+        GROUP BY 1
+    ''')
+    op.execute(f'''
+        INSERT INTO "GenreDemand" (state, genre, shows)
+        SELECT coalesce(v.state, ''), g.genre, count(*)
+        {SHOWS}
+        JOIN LATERAL (SELECT DISTINCT unnest(a.genres) AS genre) g ON true
+        GROUP BY 1, 2
+    ''')
+
+
+def downgrade():
+    op.drop_table('GenreDemand')
+    op.drop_index('ix_artist_bookings_shows', table_name='ArtistBookings')
+    op.drop_table('ArtistBookings')
+    op.drop_index('ix_venue_month_shows_month', table_name='VenueMonthShows')
+    op.drop_table('VenueMonthShows')
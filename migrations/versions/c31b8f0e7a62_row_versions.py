@@ -0,0 +1,26 @@
+"""row versions
+
+Revision ID: c31b8f0e7a62
+Revises: a4d7e2c91f58
+Create Date: 2023-04-16 11:08:45.270119
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c31b8f0e7a62'
+down_revision = 'a4d7e2c91f58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+    op.add_column('Artist', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    op.drop_column('Artist', 'version')
+    op.drop_column('Venue', 'version')
@@ -0,0 +1,29 @@
+"""import progress
+
+Revision ID: c4d9a1e7f352
+Revises: 9e4b2a7c5d61
+Create Date: 2023-05-28 15:40:21.583017
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d9a1e7f352'
+down_revision = '9e4b2a7c5d61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ImportProgress',
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('path', sa.String(), nullable=False),
+    sa.Column('records', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'path')
+    )
+
+
+def downgrade():
+    op.drop_table('ImportProgress')
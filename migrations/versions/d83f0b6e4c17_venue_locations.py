@@ -0,0 +1,44 @@
+"""venue locations
+
+Revision ID: d83f0b6e4c17
+Revises: b5e1d7c3a920
+Create Date: 2023-05-13 11:05:48.617302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+import geo
+
+
+# revision identifiers, used by Alembic.
+revision = 'd83f0b6e4c17'
+down_revision = 'b5e1d7c3a920'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geocell', sa.BigInteger(), nullable=True))
+
+    # Existing venues only have a city and state: place them at its centroid.
+    connection = op.get_bind()
+    venues = connection.execute(sa.text('SELECT id, city, state FROM "Venue"')).all()
+    rows = [dict(geo.location(city, state), id=venue_id)
+            for venue_id, city, state in venues]
+    if rows:
+        connection.execute(sa.text('''
+            UPDATE "Venue" SET latitude = :latitude, longitude = :longitude,
+                geocell = :geocell
+            WHERE id = :id
+        '''), rows)
+    op.create_index('ix_venue_geocell', 'Venue', ['geocell'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_venue_geocell', table_name='Venue')
+    op.drop_column('Venue', 'geocell')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
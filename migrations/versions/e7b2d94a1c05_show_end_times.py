@@ -0,0 +1,36 @@
+"""show end times
+
+Revision ID: e7b2d94a1c05
+Revises: c31b8f0e7a62
+Create Date: 2023-04-22 16:41:07.582930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b2d94a1c05'
+down_revision = 'c31b8f0e7a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # Matches config.SHOW_DURATION_MINUTES.
+    op.execute('''UPDATE "Show" SET end_time = start_time + interval '120 minutes' ''')
+    op.alter_column('Show', 'end_time', nullable=False)
+
+    # No two shows at a venue may overlap. Existing double bookings have to
+    # be resolved before this runs.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('''
+        ALTER TABLE "Show" ADD CONSTRAINT ex_show_venue_period
+        EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)
+    ''')
+
+
+def downgrade():
+    op.drop_constraint('ex_show_venue_period', 'Show')
+    op.drop_column('Show', 'end_time')
@@ -0,0 +1,106 @@
+"""partition shows by start time
+
+Revision ID: f2c8a5d36e19
+Revises: e7b2d94a1c05
+Create Date: 2023-04-29 10:17:52.904416
+
+"""
+from datetime import datetime
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8a5d36e19'
+down_revision = 'e7b2d94a1c05'
+branch_labels = None
+depends_on = None
+
+# Matches config.SHOW_HOT_MONTHS and SHOW_PARTITION_MONTHS_AHEAD; later
+# months are added by `flask maintain-partitions`.
+HOT_MONTHS = 12
+MONTHS_AHEAD = 12
+
+INDEXES = [
+    ('ix_show_venue_start_time', ['venue_id', 'start_time']),
+    ('ix_show_artist_start_time', ['artist_id', 'start_time']),
+    ('ix_show_start_time', ['start_time', 'id']),
+]
+
+
+def month_start(value, offset=0):
+    months = value.year * 12 + value.month - 1 + offset
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def _set_aside():
+    op.execute('ALTER TABLE "Show" RENAME TO "Show_old"')
+    op.execute('ALTER INDEX "Show_pkey" RENAME TO "Show_old_pkey"')
+    for name, columns in INDEXES:
+        op.drop_index(name, table_name='Show_old')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY NONE')
+
+
+def _move_back():
+    op.execute('''
+        INSERT INTO "Show" (id, venue_id, artist_id, start_time, end_time)
+        SELECT id, venue_id, artist_id, start_time, end_time FROM "Show_old"
+    ''')
+    op.execute('DROP TABLE "Show_old"')
+    op.execute('ALTER SEQUENCE "Show_id_seq" OWNED BY "Show".id')
+    for name, columns in INDEXES:
+        op.create_index(name, 'Show', columns)
+
+
+def upgrade():
+    _set_aside()
+    op.execute('''
+        CREATE TABLE "Show" (
+            id integer NOT NULL DEFAULT nextval('"Show_id_seq"'::regclass),
+            venue_id integer NOT NULL REFERENCES "Venue" (id),
+            artist_id integer NOT NULL REFERENCES "Artist" (id),
+            start_time timestamp without time zone NOT NULL,
+            end_time timestamp without time zone NOT NULL,
+            PRIMARY KEY (id, start_time)
+        ) PARTITION BY RANGE (start_time)
+    ''')
+    current = month_start(datetime.now())
+    month = month_start(current, -HOT_MONTHS)
+    op.execute(f'''
+        CREATE TABLE "Show_archive" PARTITION OF "Show"
+        FOR VALUES FROM (MINVALUE) TO ('{month.isoformat()}')
+    ''')
+    while month <= month_start(current, MONTHS_AHEAD):
+        name = 'Show_{:%Y_%m}'.format(month)
+        op.execute(f'''
+            CREATE TABLE "{name}" PARTITION OF "Show"
+            FOR VALUES FROM ('{month.isoformat()}') TO ('{month_start(month, 1).isoformat()}')
+        ''')
+        # Exclusion constraints cannot span partitions, so every month gets
+        # its own. The archive has none: those shows are over.
+        op.execute(f'''
+            ALTER TABLE "{name}" ADD CONSTRAINT "ex_{name.lower()}_period"
+            EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)
+        ''')
+        month = month_start(month, 1)
+    op.execute('CREATE TABLE "Show_default" PARTITION OF "Show" DEFAULT')
+    _move_back()
+
+
+def downgrade():
+    _set_aside()
+    op.execute('''
+        CREATE TABLE "Show" (
+            id integer NOT NULL DEFAULT nextval('"Show_id_seq"'::regclass),
+            venue_id integer NOT NULL REFERENCES "Venue" (id),
+            artist_id integer NOT NULL REFERENCES "Artist" (id),
+            start_time timestamp without time zone NOT NULL,
+            end_time timestamp without time zone NOT NULL,
+            PRIMARY KEY (id)
+        )
+    ''')
+    _move_back()
+    op.execute('''
+        ALTER TABLE "Show" ADD CONSTRAINT ex_show_venue_period
+        EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)
+    ''')
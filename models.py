@@ -1,18 +1,36 @@
-from flask import Flask
+from datetime import timedelta
+
+from flask import Flask, current_app
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect
+
+import geo
+import pools
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 
 def createApp(app):
     app.config.from_object("config")
+    pools.configure(app.config)
     db.app = app
     db.init_app(app)
+    pools.createPools(app, db)
     migrate = Migrate(app, db)
     return db
 
 
+def _default_end_time(context):
+    """ Shows inserted without an end last SHOW_DURATION_MINUTES; on
+    Postgres a trigger does the same for inserts from outside the app."""
+    return context.get_current_parameters()['start_time'] + \
+        timedelta(minutes=current_app.config['SHOW_DURATION_MINUTES'])
+
+
+# On Postgres the table is partitioned by start_time, and its primary key is
+# (id, start_time): id is unique in practice only. See partitions.py.
 performances = db.Table('Show',
                         db.Column('id', db.Integer, primary_key=True,
                                   autoincrement=True),
@@ -20,28 +38,52 @@ performances = db.Table('Show',
                             'Venue.id'), nullable=False),
                         db.Column('artist_id', db.Integer, db.ForeignKey(
                             'Artist.id'),  nullable=False),
-                        db.Column('start_time', db.DateTime, nullable=False)
+                        db.Column('start_time', db.DateTime, nullable=False),
+                        db.Column('end_time', db.DateTime, nullable=False,
+                                  default=_default_end_time),
+                        db.Index('ix_show_venue_start_time',
+                                 'venue_id', 'start_time'),
+                        db.Index('ix_show_artist_start_time',
+                                 'artist_id', 'start_time'),
+                        db.Index('ix_show_start_time', 'start_time', 'id')
                         )
 
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    # NOT NULL: the listing pages by (state, city, name, id) keysets, and a
+    # row-value comparison with a NULL in it matches nothing.
+    name = db.Column(db.String, nullable=False)
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(db.ARRAY(db.String).with_variant(db.JSON, 'sqlite'))
     website = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # Integer geohash of the coordinates; see geo.py.
+    geocell = db.Column(db.BigInteger)
+    search_document = db.Column(db.Text, nullable=False, server_default='')
+    version = db.Column(db.Integer, nullable=False, server_default='1')
     shows = db.relationship(
         'Artist', secondary=performances, backref=db.backref('venue', lazy=True,
                                                              cascade='all, delete'))
 
+    __table_args__ = (
+        db.Index('ix_venue_area', 'state', 'city', 'name', 'id'),
+        db.Index('ix_venue_geocell', 'geocell'),
+        db.Index('ix_venue_genres', 'genres',
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+    # Bumped on every ORM update; API ETags are derived from it.
+    __mapper_args__ = {'version_id_col': version}
+
     def __repr__(self):
         return '<Venue{}>'.format(self.name)
 
@@ -50,7 +92,7 @@ class Artist(db.Model):
     __tablename__ = 'Artist'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    name = db.Column(db.String, nullable=False)
     website = db.Column(db.String(120))
     seeking_description = db.Column(db.String(500))
     seeking_venue = db.Column(db.Boolean)
@@ -59,7 +101,124 @@ class Artist(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String))
+    genres = db.Column(db.ARRAY(db.String).with_variant(db.JSON, 'sqlite'))
+    search_document = db.Column(db.Text, nullable=False, server_default='')
+    version = db.Column(db.Integer, nullable=False, server_default='1')
     shows = db.relationship(
         'Venue', secondary=performances, backref=db.backref('artist', lazy=True,
                                                             cascade='all, delete'))
+
+    __table_args__ = (
+        db.Index('ix_artist_name', 'name', 'id'),
+        db.Index('ix_artist_genres', 'genres',
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
+
+class FacetCount(db.Model):
+    """ Number of venues or artists per (state, genre). Rows with an empty
+    genre count every entity in the state once."""
+    __tablename__ = 'FacetCount'
+
+    kind = db.Column(db.String(20), primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    genre = db.Column(db.String(120), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Booking rollups, kept current by rollups.py as shows are added and venues
+# removed. The /reports pages read only these.
+
+class VenueMonthShows(db.Model):
+    """ Shows per venue per calendar month."""
+    __tablename__ = 'VenueMonthShows'
+
+    venue_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    shows = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_venue_month_shows_month', 'month', 'shows'),
+    )
+
+
+class ArtistBookings(db.Model):
+    """ Shows booked per artist."""
+    __tablename__ = 'ArtistBookings'
+
+    artist_id = db.Column(db.Integer, primary_key=True)
+    shows = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_artist_bookings_shows', 'shows', 'artist_id'),
+    )
+
+
+class GenreDemand(db.Model):
+    """ Shows per state by artists of each genre; a show counts once for
+    every genre of its artist."""
+    __tablename__ = 'GenreDemand'
+
+    state = db.Column(db.String(120), primary_key=True)
+    genre = db.Column(db.String(120), primary_key=True)
+    shows = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SimilarArtist(db.Model):
+    """ An artist's most similar artists, best first; kept current by
+    recommendations.py."""
+    __tablename__ = 'SimilarArtist'
+
+    artist_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    similar_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_similar_artist_similar', 'similar_id'),
+    )
+
+
+class ImportProgress(db.Model):
+    """ Records of a bulk import file consumed by committed batches, written
+    in each batch's transaction and removed once the file is loaded."""
+    __tablename__ = 'ImportProgress'
+
+    kind = db.Column(db.String(20), primary_key=True)
+    path = db.Column(db.String, primary_key=True)
+    records = db.Column(db.Integer, nullable=False)
+
+
+def search_document(name, city, state, genres):
+    parts = [name, city, state] + list(genres or [])
+    return ' '.join(p for p in parts if p).lower()
+
+
+def build_search_document(mapper, connection, target):
+    target.search_document = search_document(
+        target.name, target.city, target.state, target.genres)
+
+
+for model in (Venue, Artist):
+    event.listen(model, 'before_insert', build_search_document)
+    event.listen(model, 'before_update', build_search_document)
+
+
+def build_location(mapper, connection, target):
+    # A venue that moved city without new coordinates goes to the new
+    # city's centroid.
+    attrs = inspect(target).attrs
+    moved = attrs.city.history.has_changes() or attrs.state.history.has_changes()
+    placed = attrs.latitude.history.has_changes() or attrs.longitude.history.has_changes()
+    if moved and not placed:
+        target.latitude = target.longitude = None
+    location = geo.location(target.city, target.state,
+                            target.latitude, target.longitude)
+    target.latitude = location['latitude']
+    target.longitude = location['longitude']
+    target.geocell = location['geocell']
+
+
+event.listen(Venue, 'before_insert', build_location)
+event.listen(Venue, 'before_update', build_location)
@@ -0,0 +1,125 @@
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from models import db
+
+
+class Page(object):
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([v.isoformat() if isinstance(v, datetime) else v
+                          for v in values])
+    return direction + base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor, columns):
+    """ Returns (direction, values) or (None, None) for a missing or
+    malformed cursor."""
+    try:
+        direction, payload = cursor[0], cursor[1:]
+        values = json.loads(base64.urlsafe_b64decode(payload.encode()))
+        if direction not in 'np' or len(values) != len(columns):
+            raise ValueError(cursor)
+        return direction, [
+            datetime.fromisoformat(v) if column.type.python_type is datetime
+            else v for column, v in zip(columns, values)]
+    except (TypeError, ValueError, IndexError, NotImplementedError):
+        return None, None
+
+
+def paginate(query, columns, cursor=None, per_page=50):
+    """ Keyset pagination of `query` ordered by `columns`, the last of which
+    must be unique. The columns must be NOT NULL: a row-value comparison
+    with a NULL in it is NULL, which would skip rows or end the listing
+    early. The cost of a page does not depend on how deep it is."""
+    query, direction = page_query(query, columns, cursor, per_page)
+    return to_page(query.all(), columns, direction, per_page)
+
+
+def page_query(query, columns, cursor=None, per_page=50):
+    """ The query for paginate()'s page, and the direction it reads in;
+    to_page() turns its rows into the Page."""
+    direction, values = decode_cursor(cursor, columns) if cursor else (None, None)
+    key = tuple_(*columns)
+    if direction == 'p':
+        query = query.filter(key < tuple_(*values))\
+            .order_by(*[c.desc() for c in columns])
+    else:
+        if direction == 'n':
+            query = query.filter(key > tuple_(*values))
+        query = query.order_by(*columns)
+    return query.limit(per_page + 1), direction
+
+
+def to_page(items, columns, direction, per_page):
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if direction == 'p':
+        items.reverse()
+    if not items:
+        return Page(items)
+
+    next_cursor = prev_cursor = None
+    if has_more or direction == 'p':
+        next_cursor = encode_cursor('n', _key_of(items[-1], columns))
+    if direction == 'n' or (direction == 'p' and has_more):
+        prev_cursor = encode_cursor('p', _key_of(items[0], columns))
+    return Page(items, next_cursor, prev_cursor)
+
+
+def stream(query, columns, cursor=None, per_page=50, chunk_size=500):
+    """ Like paginate(), but the page is a generator over a server-side
+    cursor. The page's cursors are only final once the rows are consumed."""
+    direction, values = decode_cursor(cursor, columns) if cursor else (None, None)
+    if direction == 'p':
+        # Backwards pages come out reversed and have to be buffered anyway.
+        return paginate(query, columns, cursor, per_page)
+    if direction == 'n':
+        query = query.filter(tuple_(*columns) > tuple_(*values))
+    query = query.order_by(*columns).limit(per_page + 1)
+    page = Page(None)
+
+    def rows():
+        # The view's app context, and with it the session the query was
+        # built on, is torn down before the body is streamed. Run on the
+        # session of the streaming context so its teardown releases the
+        # connection.
+        last = None
+        rows = query.with_session(db.session()).yield_per(min(chunk_size, per_page + 1))
+        for count, item in enumerate(rows):
+            if count == per_page:
+                # The look-ahead row is not rendered; it only proves there
+                # is a next page. Keep iterating so the cursor is drained.
+                page.next_cursor = encode_cursor('n', _key_of(last, columns))
+                continue
+            if count == 0 and direction == 'n':
+                page.prev_cursor = encode_cursor('p', _key_of(item, columns))
+            last = item
+            yield item
+
+    page.items = rows()
+    return page
+
+
+def export(query, columns, chunk_size=1000):
+    """ Every row of `query` ordered by `columns`, in lists of at most
+    `chunk_size` read off a server-side cursor, so memory does not grow
+    with the table. Iterate it in the context that streams the response."""
+    result = db.session().execute(query.order_by(*columns).statement,
+                                  execution_options={'yield_per': chunk_size})
+    yield from result.partitions()
+
+
+def _key_of(item, columns):
+    return [getattr(item, column.key) for column in columns]
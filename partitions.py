@@ -0,0 +1,188 @@
+import re
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+from models import db
+
+# On Postgres "Show" is partitioned by range of start_time (see migration
+# f2c8a5d36e19): one partition per month, "Show_YYYY_MM", a "Show_archive"
+# partition holding everything before the oldest month, and "Show_default"
+# for rows beyond the last month created. Queries keep using the parent,
+# so reads spanning hot and archived shows are unchanged, while filters on
+# start_time prune the partitions they cannot match.
+#
+# Every partition has its own exclusion constraint against overlapping
+# bookings, and the show_check_boundary_overlap() trigger (migration
+# 3e8d5b1f6a27) covers pairs of shows in different partitions, which can
+# only meet across a month boundary.
+#
+# A primary key on a partitioned table must include the partition key, so
+# it is (id, start_time): ids come from one sequence and are unique in
+# practice, but nothing enforces it. Refer to a show by both columns, as
+# SHOW_LIST_ORDER and the keyset cursors do.
+
+PARENT = 'Show'
+ARCHIVE = 'Show_archive'
+DEFAULT = 'Show_default'
+MONTHLY = re.compile(r'^Show_(\d{4})_(\d{2})$')
+
+
+def month_start(value, offset=0):
+    months = value.year * 12 + value.month - 1 + offset
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(month):
+    return '{}_{:%Y_%m}'.format(PARENT, month)
+
+
+def _partitions(connection):
+    """ {name: bounds expression} for every partition of "Show"."""
+    rows = connection.execute(text('''
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :parent
+    '''), {'parent': PARENT})
+    return dict(rows.all())
+
+
+def _read_partitions():
+    with db.engine.connect() as connection:
+        return _partitions(connection)
+
+
+def _months(partitions):
+    months = []
+    for name in partitions:
+        match = MONTHLY.match(name)
+        if match:
+            months.append(datetime(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def _archive_bound(partitions):
+    match = re.search(r"TO \('([^']+)'\)", partitions[ARCHIVE])
+    return datetime.fromisoformat(match.group(1))
+
+
+def _exclude_overlaps(connection, name):
+    connection.execute(text(f'''
+        ALTER TABLE "{name}" ADD CONSTRAINT "ex_{name.lower()}_period"
+        EXCLUDE USING gist (venue_id WITH =, tsrange(start_time, end_time) WITH &&)
+    '''))
+
+
+def create_month(connection, month):
+    """ Adds the partition for `month`, first moving any of its rows that
+    landed in the default partition. Its constraints are in place before
+    the rows arrive: the exclusion constraint checks them as they are
+    inserted, and a CHECK matching the bounds lets ATTACH skip scanning
+    them."""
+    name = partition_name(month)
+    lower, upper = month, month_start(month, 1)
+    connection.execute(text(f'''
+        CREATE TABLE "{name}" (LIKE "{PARENT}" INCLUDING DEFAULTS)
+    '''))
+    _exclude_overlaps(connection, name)
+    connection.execute(text(f'''
+        ALTER TABLE "{name}" ADD CONSTRAINT "ck_{name.lower()}_bounds"
+        CHECK (start_time >= '{lower.isoformat()}' AND start_time < '{upper.isoformat()}')
+    '''))
+    connection.execute(text(f'''
+        WITH moved AS (
+            DELETE FROM "{DEFAULT}"
+            WHERE start_time >= :lower AND start_time < :upper
+            RETURNING *
+        )
+        INSERT INTO "{name}" SELECT * FROM moved
+    '''), {'lower': lower, 'upper': upper})
+    connection.execute(text(f'''
+        ALTER TABLE "{PARENT}" ATTACH PARTITION "{name}"
+        FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')
+    '''))
+
+
+ARCHIVE_BOUND = 'ck_show_archive_bound'
+
+
+def bound_archive(connection, upper):
+    """ Adds a CHECK to the archive matching the bound archive_month() will
+    re-attach it with, so that ATTACH need not scan it. Run it in a
+    transaction of its own: validating scans the archive, but only blocks
+    writes to it, not "Show"."""
+    connection.execute(text(f'ALTER TABLE "{ARCHIVE}" DROP CONSTRAINT IF EXISTS {ARCHIVE_BOUND}'))
+    connection.execute(text(f'''
+        ALTER TABLE "{ARCHIVE}" ADD CONSTRAINT {ARCHIVE_BOUND}
+        CHECK (start_time < '{upper.isoformat()}') NOT VALID
+    '''))
+    connection.execute(text(f'ALTER TABLE "{ARCHIVE}" VALIDATE CONSTRAINT {ARCHIVE_BOUND}'))
+
+
+def archive_month(connection, month):
+    """ Folds the partition for `month`, the oldest one, into the archive
+    partition and drops it. Call bound_archive() for the month first; the
+    lock on "Show" is then held for copying one month, not for a scan of
+    the whole archive."""
+    name = partition_name(month)
+    upper = month_start(month, 1)
+    connection.execute(text(f'ALTER TABLE "{PARENT}" DETACH PARTITION "{ARCHIVE}"'))
+    connection.execute(text(f'ALTER TABLE "{PARENT}" DETACH PARTITION "{name}"'))
+    connection.execute(text(f'''
+        INSERT INTO "{ARCHIVE}" (id, venue_id, artist_id, start_time, end_time)
+        SELECT id, venue_id, artist_id, start_time, end_time FROM "{name}"
+    '''))
+    connection.execute(text(f'DROP TABLE "{name}"'))
+    connection.execute(text(f'''
+        ALTER TABLE "{PARENT}" ATTACH PARTITION "{ARCHIVE}"
+        FOR VALUES FROM (MINVALUE) TO ('{upper.isoformat()}')
+    '''))
+    connection.execute(text(f'ALTER TABLE "{ARCHIVE}" DROP CONSTRAINT {ARCHIVE_BOUND}'))
+
+
+def move_archive(connection, tablespace):
+    connection.execute(text(f'ALTER TABLE "{ARCHIVE}" SET TABLESPACE "{tablespace}"'))
+    indexes = connection.execute(text(
+        'SELECT indexname FROM pg_indexes WHERE tablename = :table'), {'table': ARCHIVE})
+    for index, in indexes.all():
+        connection.execute(text(f'ALTER INDEX "{index}" SET TABLESPACE "{tablespace}"'))
+
+
+def maintain(now=None, echo=print):
+    """ Creates the monthly partitions up to SHOW_PARTITION_MONTHS_AHEAD
+    months ahead and archives the months that ended more than
+    SHOW_HOT_MONTHS months ago, one transaction each. Detaching and
+    attaching takes an exclusive lock on "Show", so readers wait for each
+    step rather than see a partial table."""
+    if db.engine.dialect.name != 'postgresql':
+        echo('Show is only partitioned on Postgres; nothing to do.')
+        return
+    config = current_app.config
+    current = month_start(now or datetime.now())
+    partitions = _read_partitions()
+    existing = set(_months(partitions))
+    for offset in range(config['SHOW_PARTITION_MONTHS_AHEAD'] + 1):
+        month = month_start(current, offset)
+        if month not in existing and month >= _archive_bound(partitions):
+            with db.engine.begin() as connection:
+                create_month(connection, month)
+            echo('Created {}'.format(partition_name(month)))
+
+    cutoff = month_start(current, -config['SHOW_HOT_MONTHS'])
+    for month in _months(_read_partitions()):
+        if month >= cutoff:
+            break
+        with db.engine.begin() as connection:
+            bound_archive(connection, month_start(month, 1))
+        with db.engine.begin() as connection:
+            archive_month(connection, month)
+        echo('Archived {}'.format(partition_name(month)))
+
+    tablespace = config['SHOW_ARCHIVE_TABLESPACE']
+    if tablespace:
+        with db.engine.begin() as connection:
+            move_archive(connection, tablespace)
+        echo('{} is in tablespace {}'.format(ARCHIVE, tablespace))
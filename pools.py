@@ -0,0 +1,103 @@
+import time
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+from metrics import POOL_CONNECTIONS, POOL_TIMEOUTS, POOL_WAIT_SECONDS
+
+# Driver arguments that keep each statement self-contained, as PgBouncer in
+# transaction mode requires: a transaction may run on a different server
+# connection than the last, so prepared statements must not be cached.
+# psycopg2 never prepares server-side and needs nothing.
+PGBOUNCER_CONNECT_ARGS = {
+    'psycopg': {'prepare_threshold': None},
+    'asyncpg': {'statement_cache_size': 0, 'prepared_statement_cache_size': 0},
+}
+
+
+class TimedQueuePool(QueuePool):
+    """ QueuePool that records how long each checkout waited."""
+
+    bind = 'primary'
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except TimeoutError:
+            POOL_TIMEOUTS.inc(self.bind)
+            raise
+        finally:
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - started, self.bind)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.bind = self.bind
+        return pool
+
+
+class TimedAsyncQueuePool(TimedQueuePool):
+    """ TimedQueuePool for the asyncio engines of aio.py."""
+
+    _is_asyncio = True
+    _queue_class = AsyncAdaptedQueuePool._queue_class
+    _dialect = AsyncAdaptedQueuePool._dialect
+
+
+def engine_options(url, config):
+    """ create_engine() arguments for `url` from the DB_POOL_* settings."""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # Flask-SQLAlchemy shares one connection for in-memory databases.
+        return {}
+    if config['DB_POOL'] == 'null':
+        options = {'poolclass': NullPool}
+    else:
+        options = {
+            'poolclass': TimedQueuePool,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+        }
+    options['pool_pre_ping'] = config['DB_POOL_PRE_PING']
+    if config['DB_PGBOUNCER'] and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = dict(PGBOUNCER_CONNECT_ARGS.get(url.get_driver_name(), {}))
+    return options
+
+
+def configure(config):
+    """ Applies engine_options() to the primary and every bind."""
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        config['SQLALCHEMY_DATABASE_URI'], config)
+    config['SQLALCHEMY_BINDS'] = {
+        key: dict(engine_options(url, config), url=url)
+        for key, url in config['SQLALCHEMY_BINDS'].items()}
+
+
+def _pool_states(engines):
+    for bind, engine in list(engines.items()):
+        pool = engine.pool
+        if isinstance(pool, QueuePool):
+            yield (bind, 'checked_out'), pool.checkedout()
+            yield (bind, 'idle'), pool.checkedin()
+            yield (bind, 'overflow'), max(pool.overflow(), 0)
+            yield (bind, 'size'), pool.size()
+
+
+def createPools(app, db):
+    """ Labels each engine's pool with its bind and reports pool states on
+    /metrics."""
+    with app.app_context():
+        engines = {key or 'primary': engine for key, engine in db.engines.items()}
+    for bind, engine in engines.items():
+        engine.pool.bind = bind
+    app.extensions['pools'] = engines
+    POOL_CONNECTIONS.collect = lambda: list(_pool_states(engines))
+
+
+def register(app, bind, engine):
+    """ Reports an engine created after startup on /metrics as `bind`."""
+    engine.pool.bind = bind
+    app.extensions['pools'][bind] = engine
@@ -0,0 +1,230 @@
+import logging
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, or_, select, tuple_
+
+import aio
+import facets
+import geo
+from models import db, Venue, Artist, performances
+from pagination import decode_cursor, encode_cursor
+
+log = logging.getLogger(__name__)
+
+# Queries shared by the HTML views and the JSON API.
+
+VENUE_LIST_ORDER = [Venue.state, Venue.city, Venue.name, Venue.id]
+ARTIST_LIST_ORDER = [Artist.name, Artist.id]
+SHOW_LIST_ORDER = [performances.c.start_time, performances.c.id]
+# Cells (about 1.2 x 0.6 km) nearest-venue searches without a radius start at.
+NEARBY_START_PRECISION = 6
+
+
+def venue_list_query(state=None, genre=None):
+    # A correlated count rather than a grouped join: it runs only for the
+    # rows of the page, and leaves the keyset order to ix_venue_area.
+    upcoming = select(func.count(performances.c.id))\
+        .where(performances.c.venue_id == Venue.id,
+               performances.c.start_time > datetime.now())\
+        .scalar_subquery()
+    query = db.session.query(Venue.id,
+                             Venue.name,
+                             Venue.city,
+                             Venue.state,
+                             Venue.version,
+                             upcoming.label('upcoming_shows'))
+    if state:
+        query = query.filter(Venue.state == state)
+    if genre:
+        query = query.filter(facets.genre_filter(Venue, genre))
+    return query
+
+
+def artist_list_query(state=None, genre=None):
+    query = db.session.query(Artist.id, Artist.name, Artist.version)
+    if state:
+        query = query.filter(Artist.state == state)
+    if genre:
+        query = query.filter(facets.genre_filter(Artist, genre))
+    return query
+
+
+def show_list_query():
+    return db.session.query(performances.c.id,
+                            performances.c.venue_id,
+                            Venue.name.label('venue_name'),
+                            Artist.name.label('artist_name'),
+                            performances.c.artist_id, performances.c.start_time,
+                            performances.c.end_time,
+                            Artist.image_link.label('artist_image_link'),
+                            Venue.version.label('venue_version'),
+                            Artist.version.label('artist_version')).join(Venue, performances.c.venue_id == Venue.id)\
+        .join(Artist, performances.c.artist_id == Artist.id)
+
+
+def _venue_shows(venue_id):
+    return db.session.query(performances.c.id,
+                            performances.c.artist_id,
+                            Artist.name.label('artist_name'),
+                            Artist.image_link.label('artist_image_link'),
+                            performances.c.start_time)\
+        .join(Artist, performances.c.artist_id == Artist.id)\
+        .filter(performances.c.venue_id == venue_id)
+
+
+def _artist_shows(artist_id):
+    return db.session.query(performances.c.id,
+                            performances.c.venue_id,
+                            Venue.name.label('venue_name'),
+                            Venue.image_link.label('venue_image_link'),
+                            performances.c.start_time)\
+        .join(Venue, performances.c.venue_id == Venue.id)\
+        .filter(performances.c.artist_id == artist_id)
+
+
+VENUE_DETAIL_COLUMNS = [Venue.id, Venue.name, Venue.genres, Venue.address,
+                        Venue.city, Venue.state, Venue.phone, Venue.website,
+                        Venue.facebook_link, Venue.seeking_talent,
+                        Venue.seeking_description, Venue.image_link]
+ARTIST_DETAIL_COLUMNS = [Artist.id, Artist.name, Artist.genres, Artist.city,
+                         Artist.state, Artist.phone, Artist.seeking_venue,
+                         Artist.image_link]
+
+
+def _show_queries(column, entity_id, shows, now, limit):
+    """ The (upcoming, past) show counts in one aggregate, the next `limit`
+    shows and the most recent `limit` past ones, all split at `now`."""
+    counts = db.session.query(
+        func.count(performances.c.id).filter(performances.c.start_time > now),
+        func.count(performances.c.id).filter(performances.c.start_time <= now))\
+        .filter(column == entity_id)
+    upcoming = shows.filter(performances.c.start_time > now)\
+        .order_by(*SHOW_LIST_ORDER).limit(limit)
+    return counts, upcoming, _past_query(shows, now, None, limit)
+
+
+def _past_query(shows, now, cursor, limit):
+    """ The `limit` most recent shows up to `now`, or older than the one
+    `cursor` points at, newest first, plus one to tell if there are more."""
+    query = shows.filter(performances.c.start_time <= now)
+    _, values = decode_cursor(cursor, SHOW_LIST_ORDER) if cursor else (None, None)
+    if values is not None:
+        query = query.filter(tuple_(*SHOW_LIST_ORDER) < tuple_(*values))
+    return query.order_by(*[column.desc() for column in SHOW_LIST_ORDER])\
+        .limit(limit + 1)
+
+
+def _past_page(rows, limit):
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor('n', [rows[-1].start_time, rows[-1].id])
+    return [dict(row._mapping) for row in rows], next_cursor
+
+
+def _details(row, counts, upcoming, past, limit):
+    data = dict(row._mapping)
+    data['upcoming_shows_count'], data['past_shows_count'] = tuple(counts)
+    data['upcoming_shows'] = [dict(show._mapping) for show in upcoming]
+    data['past_shows'], data['past_shows_cursor'] = _past_page(past, limit)
+    log.debug('Loaded details of %s', data['id'], extra={
+        'upcoming_shows': len(data['upcoming_shows']), 'past_shows': len(data['past_shows'])})
+    return data
+
+
+def _load_details(entity, column, entity_id, shows):
+    row = entity.first()
+    if row is None:
+        return None
+    # One snapshot, so the counts and both lists agree on what "now" is.
+    limit = current_app.config['SHOW_SECTION_LIMIT']
+    counts, upcoming, past = _show_queries(column, entity_id, shows,
+                                           datetime.now(), limit)
+    return _details(row, counts.one(), upcoming.all(), past.all(), limit)
+
+
+async def _load_details_async(entity, column, entity_id, shows):
+    limit = current_app.config['SHOW_SECTION_LIMIT']
+    rows, counts, upcoming, past = await aio.fetch_all(
+        entity, *_show_queries(column, entity_id, shows, datetime.now(), limit))
+    if not rows:
+        return None
+    return _details(rows[0], counts[0], upcoming, past, limit)
+
+
+def venue_details(venue_id):
+    """ The venue with its show counts, its next and its most recent
+    SHOW_SECTION_LIMIT shows, and a cursor for venue_past_shows()."""
+    return _load_details(db.session.query(*VENUE_DETAIL_COLUMNS).filter(Venue.id == venue_id),
+                         performances.c.venue_id, venue_id, _venue_shows(venue_id))
+
+
+async def venue_details_async(venue_id):
+    """ venue_details(), running its four queries concurrently."""
+    return await _load_details_async(
+        db.session.query(*VENUE_DETAIL_COLUMNS).filter(Venue.id == venue_id),
+        performances.c.venue_id, venue_id, _venue_shows(venue_id))
+
+
+def artist_details(artist_id):
+    """ Like venue_details(), for an artist."""
+    return _load_details(db.session.query(*ARTIST_DETAIL_COLUMNS).filter(Artist.id == artist_id),
+                         performances.c.artist_id, artist_id, _artist_shows(artist_id))
+
+
+async def artist_details_async(artist_id):
+    return await _load_details_async(
+        db.session.query(*ARTIST_DETAIL_COLUMNS).filter(Artist.id == artist_id),
+        performances.c.artist_id, artist_id, _artist_shows(artist_id))
+
+
+def _past_shows(model, entity_id, shows, cursor):
+    limit = current_app.config['SHOW_SECTION_LIMIT']
+    rows = _past_query(shows, datetime.now(), cursor, limit).all()
+    # Only an empty page needs a second look to tell a missing entity apart.
+    if not rows and db.session.get(model, entity_id) is None:
+        return None
+    log.debug('Loaded past shows of %s %s', model.__name__, entity_id,
+              extra={'past_shows': len(rows), 'cursor': cursor})
+    return _past_page(rows, limit)
+
+
+def venue_past_shows(venue_id, cursor=None):
+    """ A page of the venue's past shows, newest first: (shows, next_cursor),
+    or None if there is no such venue."""
+    return _past_shows(Venue, venue_id, _venue_shows(venue_id), cursor)
+
+
+def artist_past_shows(artist_id, cursor=None):
+    return _past_shows(Artist, artist_id, _artist_shows(artist_id), cursor)
+
+
+def _nearby_query(cells):
+    return db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+                            Venue.latitude, Venue.longitude)\
+        .filter(or_(*[Venue.geocell.between(low, high - 1) for low, high in cells]))
+
+
+def nearby_venues(latitude, longitude, radius=None, limit=20):
+    """ Up to `limit` venues nearest to a point, within `radius` km if given,
+    nearest first, each with its `distance` in km. Candidates are read from
+    the geocell ranges of the 3x3 cells around the point, the smallest cells
+    that must hold the answer: for a radius, the first cells reaching past
+    it; otherwise cells widened until the limit-th venue is within reach."""
+    if radius is not None:
+        precisions = [next(p for p in range(geo.PRECISION, -1, -1)
+                           if geo.reach(latitude, p) >= radius)]
+    else:
+        precisions = range(NEARBY_START_PRECISION, -1, -1)
+    for precision in precisions:
+        rows = _nearby_query(geo.covering(latitude, longitude, precision))
+        venues = sorted((dict(row._mapping, distance=geo.distance(
+            latitude, longitude, row.latitude, row.longitude)) for row in rows),
+            key=lambda venue: venue['distance'])
+        if radius is not None:
+            return [venue for venue in venues if venue['distance'] <= radius][:limit]
+        if len(venues) >= limit and \
+                venues[limit - 1]['distance'] <= geo.reach(latitude, precision):
+            break
+    return venues[:limit]
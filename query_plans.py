@@ -0,0 +1,135 @@
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import text
+
+import bookings
+import geo
+import queries
+import search
+from models import db, Venue, Artist, performances
+from pagination import encode_cursor, page_query
+
+# The statements below come from the builders the views run, so a change to
+# a view's query is checked against its index as it is, not as a copy.
+
+
+def _details(column, shows, entity_id=1):
+    # show_venue() / show_artist(): counts, next shows, recent past shows
+    return queries._show_queries(column, entity_id, shows(entity_id), datetime.now(),
+                                 current_app.config['SHOW_SECTION_LIMIT'])
+
+
+def _past_page(shows, entity_id=1):
+    # venue_past_shows() / artist_past_shows(): a page after the first
+    now = datetime.now()
+    return queries._past_query(shows(entity_id), now, encode_cursor('n', [now, 1]),
+                               current_app.config['SHOW_SECTION_LIMIT'])
+
+
+def _list_page(query, columns):
+    return page_query(query, columns, None, current_app.config['LIST_PAGE_SIZE'])[0]
+
+
+def _next_page(query, columns, values):
+    return page_query(query, columns, encode_cursor('n', values),
+                      current_app.config['LIST_PAGE_SIZE'])[0]
+
+
+VENUE_SHOWS = ('ix_show_venue_start_time',)
+ARTIST_SHOWS = ('ix_show_artist_start_time',)
+
+# (name, expected indexes, statement factory, postgres only)
+HOT_QUERIES = [
+    ('show_venue counts', VENUE_SHOWS,
+     lambda: _details(performances.c.venue_id, queries._venue_shows)[0], False),
+    ('show_venue upcoming', VENUE_SHOWS,
+     lambda: _details(performances.c.venue_id, queries._venue_shows)[1], False),
+    ('show_venue past', VENUE_SHOWS,
+     lambda: _details(performances.c.venue_id, queries._venue_shows)[2], False),
+    ('venue past shows page', VENUE_SHOWS,
+     lambda: _past_page(queries._venue_shows), False),
+    ('show_artist counts', ARTIST_SHOWS,
+     lambda: _details(performances.c.artist_id, queries._artist_shows)[0], False),
+    ('show_artist upcoming', ARTIST_SHOWS,
+     lambda: _details(performances.c.artist_id, queries._artist_shows)[1], False),
+    ('show_artist past', ARTIST_SHOWS,
+     lambda: _details(performances.c.artist_id, queries._artist_shows)[2], False),
+    ('artist past shows page', ARTIST_SHOWS,
+     lambda: _past_page(queries._artist_shows), False),
+    ('booking overlap', VENUE_SHOWS,
+     lambda: bookings._bookings_query([1], (datetime(2030, 1, 1), datetime(2030, 1, 2))),
+     False),
+    ('shows page', ('ix_show_start_time',),
+     lambda: _list_page(queries.show_list_query(), queries.SHOW_LIST_ORDER), False),
+    ('venues page', ('ix_venue_area',) + VENUE_SHOWS,
+     lambda: _list_page(queries.venue_list_query(), queries.VENUE_LIST_ORDER), False),
+    ('venues next page', ('ix_venue_area',) + VENUE_SHOWS,
+     lambda: _next_page(queries.venue_list_query(), queries.VENUE_LIST_ORDER,
+                        ['CA', 'San Francisco', 'The Musical Hop', 1]), False),
+    ('venues page by state', ('ix_venue_area',),
+     lambda: _list_page(queries.venue_list_query('CA'), queries.VENUE_LIST_ORDER), False),
+    ('artists page', ('ix_artist_name',),
+     lambda: _list_page(queries.artist_list_query(), queries.ARTIST_LIST_ORDER), False),
+    ('nearby venues', ('ix_venue_geocell',),
+     lambda: queries._nearby_query(geo.covering(37.77, -122.42, 5)), False),
+    ('search results page', VENUE_SHOWS,
+     lambda: search._trigram_page_query(Venue, [1, 2, 3]), False),
+    ('search venues', ('ix_venue_search_fts', 'ix_venue_search_trgm'),
+     lambda: search._fulltext_query(Venue, 'jazz', 20, 0)[0], True),
+    ('search artists', ('ix_artist_search_fts', 'ix_artist_search_trgm'),
+     lambda: search._fulltext_query(Artist, 'jazz', 20, 0)[0], True),
+    ('venues by genre', ('ix_venue_genres',),
+     lambda: queries.venue_list_query(genre='Jazz'), True),
+    ('artists by genre', ('ix_artist_genres',),
+     lambda: queries.artist_list_query(genre='Jazz'), True),
+]
+
+
+def explain(connection, statement):
+    statement = getattr(statement, 'statement', statement)
+    sql = str(statement.compile(dialect=connection.dialect,
+                                compile_kwargs={'literal_binds': True}))
+    if connection.dialect.name == 'postgresql':
+        # Tiny tables are cheaper to scan; ask whether the index can serve
+        # the query, not whether the planner wants it today.
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+        rows = connection.exec_driver_sql('EXPLAIN ' + sql).all()
+    else:
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql).all()
+    return '\n'.join(str(row[-1]) for row in rows)
+
+
+def index_names(connection, index):
+    """ `index` and, on Postgres, the indexes of its partitions: plans of
+    the partitioned "Show" name those rather than the parent index."""
+    if connection.dialect.name != 'postgresql':
+        return {index}
+    rows = connection.execute(text('''
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :index
+    '''), {'index': index})
+    return {index, *rows.scalars()}
+
+
+def uses(connection, plan, index):
+    return any(name in plan for name in index_names(connection, index))
+
+
+def check_plans():
+    """ Returns (name, indexes, plan, ok) for every hot query that applies
+    to the current database; ok when the plan uses all of its indexes."""
+    postgres = db.engine.dialect.name == 'postgresql'
+    results = []
+    with db.engine.connect() as connection:
+        for name, indexes, statement, postgres_only in HOT_QUERIES:
+            if postgres_only and not postgres:
+                continue
+            with connection.begin():
+                plan = explain(connection, statement())
+                ok = all(uses(connection, plan, index) for index in indexes)
+            results.append((name, indexes, plan, ok))
+    return results
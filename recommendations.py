@@ -0,0 +1,212 @@
+from collections import defaultdict
+
+import numpy as np
+from flask import current_app
+from scipy import sparse
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+import facets
+from models import db, Venue, Artist, performances, SimilarArtist
+
+# Two artists are similar when they share genres and, more so, venues:
+# their score is GENRE_WEIGHT * cosine(genres) + VENUE_WEIGHT *
+# cosine(venues), an artist's venues weighted by log(1 + its shows there).
+GENRE_WEIGHT = 0.4
+VENUE_WEIGHT = 0.6
+
+# Artists scored at once; a batch is a dense BATCH_SIZE x artists array.
+BATCH_SIZE = 256
+
+
+def _normalized(matrix):
+    """ `matrix` with every non-zero row scaled to unit length."""
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def _features(connection, artist_ids=None):
+    """ (ids, genres, venues): the ids of the artists, ascending, and their
+    normalized artist x genre and artist x venue matrices.
+
+    Without `artist_ids` every artist is loaded. With them, only those
+    artists and the ones sharing a genre or a venue with them are: any other
+    artist scores zero against `artist_ids`, so their scores stay exact."""
+    artists = select(Artist.id, Artist.genres).order_by(Artist.id)
+    pairs = select(performances.c.artist_id, performances.c.venue_id, func.count())\
+        .join(Venue, performances.c.venue_id == Venue.id)\
+        .join(Artist, performances.c.artist_id == Artist.id)\
+        .group_by(performances.c.artist_id, performances.c.venue_id)
+    if artist_ids is not None:
+        venue_ids = select(performances.c.venue_id)\
+            .where(performances.c.artist_id.in_(artist_ids))
+        neighbours = select(performances.c.artist_id)\
+            .where(performances.c.venue_id.in_(venue_ids))
+        pairs = pairs.where(performances.c.artist_id.in_(neighbours))
+        shared = {genre for genres in connection.execute(
+            select(Artist.genres).where(Artist.id.in_(artist_ids))).scalars()
+            for genre in genres or []}
+        artists = artists.where(or_(
+            Artist.id.in_(artist_ids), Artist.id.in_(neighbours),
+            *[facets.genre_filter(Artist, genre) for genre in sorted(shared)]))
+
+    artists = connection.execute(artists).all()
+    ids = np.array([row.id for row in artists], dtype=np.int64)
+    columns = {}
+    cells = [(i, columns.setdefault(genre, len(columns)))
+             for i, row in enumerate(artists) for genre in set(row.genres or [])]
+    cells = np.array(cells, dtype=np.int64).reshape(-1, 2)
+    genres = sparse.csr_matrix((np.ones(len(cells)), (cells[:, 0], cells[:, 1])),
+                               shape=(len(ids), len(columns)))
+
+    pairs = np.array([tuple(row) for row in connection.execute(pairs)],
+                     dtype=np.int64).reshape(-1, 3)
+    venue_ids, venue_columns = np.unique(pairs[:, 1], return_inverse=True)
+    venues = sparse.csr_matrix(
+        (np.log1p(pairs[:, 2]), (np.searchsorted(ids, pairs[:, 0]), venue_columns)),
+        shape=(len(ids), len(venue_ids)))
+    return ids, _normalized(genres), _normalized(venues)
+
+
+def _scores(genres, venues, rows):
+    """ Dense scores of the artists at `rows` against every artist, with
+    each artist's score against itself zeroed."""
+    scores = (GENRE_WEIGHT * (genres[rows] @ genres.T)
+              + VENUE_WEIGHT * (venues[rows] @ venues.T)).toarray()
+    scores[np.arange(len(rows)), rows] = 0
+    return scores
+
+
+def _ranked(items, limit):
+    """ The best `limit` (similar_id, score) pairs; ties go to the lower id."""
+    return sorted(items, key=lambda item: (-item[1], item[0]))[:limit]
+
+
+def _top(scores, ids, limit):
+    """ The best `limit` (similar_id, score) pairs of each row of `scores`."""
+    lists = []
+    for row in scores:
+        candidates = np.flatnonzero(row > 0)
+        if len(candidates) > limit:
+            kth = np.partition(row[candidates], -limit)[-limit]
+            candidates = candidates[row[candidates] >= kth]
+        lists.append(_ranked(zip(ids[candidates].tolist(),
+                                 row[candidates].tolist()), limit))
+    return lists
+
+
+def _rows(lists):
+    return [{'artist_id': artist_id, 'rank': rank, 'similar_id': similar_id,
+             'score': score}
+            for artist_id, similar in lists.items()
+            for rank, (similar_id, score) in enumerate(similar, 1)]
+
+
+def _store(connection, lists):
+    rows = _rows(lists)
+    if rows:
+        connection.execute(SimilarArtist.__table__.insert(), rows)
+
+
+def _replace(connection, lists):
+    """ Writes `lists` over the stored lists of their artists with upserts,
+    so a list written by a concurrent refresh() is overwritten rather than
+    failing the primary key."""
+    table = SimilarArtist.__table__
+    lengths = defaultdict(list)
+    for artist_id, similar in lists.items():
+        lengths[len(similar)].append(artist_id)
+    for length, artist_ids in lengths.items():
+        connection.execute(table.delete().where(table.c.artist_id.in_(artist_ids),
+                                                table.c.rank > length))
+    rows = _rows(lists)
+    if rows:
+        dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+        statement = dialect.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['artist_id', 'rank'],
+            set_={'similar_id': statement.excluded['similar_id'],
+                  'score': statement.excluded['score']})
+        connection.execute(statement, rows)
+
+
+def _lock(connection, artist_ids):
+    # Serializes refreshes of the same artists, in id order so two of them
+    # cannot deadlock; SQLite already allows a single writer.
+    if connection.dialect.name == 'postgresql':
+        for artist_id in sorted(artist_ids):
+            connection.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext('SimilarArtist'), :id)"),
+                {'id': artist_id})
+
+
+def rebuild():
+    """ Recomputes every artist's similar artists in one transaction."""
+    limit = current_app.config['SIMILAR_ARTISTS']
+    with db.engine.begin() as connection:
+        ids, genres, venues = _features(connection)
+        connection.execute(SimilarArtist.__table__.delete())
+        for start in range(0, len(ids), BATCH_SIZE):
+            rows = np.arange(start, min(start + BATCH_SIZE, len(ids)))
+            _store(connection, dict(zip(ids[rows].tolist(),
+                                        _top(_scores(genres, venues, rows), ids, limit))))
+
+
+def refresh(artist_ids):
+    """ Recomputes the similar artists of `artist_ids` after their shows or
+    genres changed, and of every artist whose scores against them may have
+    changed with that: those sharing a venue with them or already listing
+    them. Returns the ids of the artists whose lists changed.
+
+    Call it once the change has committed: it runs in a transaction of its
+    own, so a failure here never undoes the booking or edit behind it.
+
+    Artists sharing only a genre are not revisited, so after a genre change
+    an artist moves onto their lists at the next rebuild()."""
+    with db.engine.begin() as connection:
+        return _refresh(connection, set(artist_ids))
+
+
+def _refresh(connection, artist_ids):
+    limit = current_app.config['SIMILAR_ARTISTS']
+    venue_ids = select(performances.c.venue_id)\
+        .where(performances.c.artist_id.in_(artist_ids))
+    affected = artist_ids | set(connection.execute(
+        select(performances.c.artist_id).where(performances.c.venue_id.in_(venue_ids))
+        .union(select(SimilarArtist.artist_id)
+               .where(SimilarArtist.similar_id.in_(artist_ids)))).scalars())
+    _lock(connection, affected)
+    ids, genres, venues = _features(connection, affected)
+    rows = np.flatnonzero(np.isin(ids, list(affected)))
+    lists = {}
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = rows[start:start + BATCH_SIZE]
+        lists.update(zip(ids[batch].tolist(),
+                         _top(_scores(genres, venues, batch), ids, limit)))
+
+    stored = defaultdict(list)
+    for row in connection.execute(
+            select(SimilarArtist.artist_id, SimilarArtist.similar_id, SimilarArtist.score)
+            .where(SimilarArtist.artist_id.in_(affected))
+            .order_by(SimilarArtist.artist_id, SimilarArtist.rank)):
+        stored[row.artist_id].append((row.similar_id, row.score))
+    changed = {artist_id for artist_id in affected
+               if lists.get(artist_id, []) != stored[artist_id]}
+    _replace(connection, {artist_id: lists.get(artist_id, []) for artist_id in changed})
+    return changed
+
+
+def listed_by(artist_id):
+    """ Ids of the artists with `artist_id` among their similar artists."""
+    return db.session.scalars(select(SimilarArtist.artist_id)
+                              .where(SimilarArtist.similar_id == artist_id)).all()
+
+
+def similar_artists(artist_id):
+    """ The artist's similar artists, best first."""
+    return db.session.query(Artist.id, Artist.name, Artist.image_link,
+                            SimilarArtist.score)\
+        .join(Artist, SimilarArtist.similar_id == Artist.id)\
+        .filter(SimilarArtist.artist_id == artist_id)\
+        .order_by(SimilarArtist.rank).all()
@@ -0,0 +1,109 @@
+import itertools
+import threading
+import time
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.dml import UpdateBase
+
+from metrics import REPLICA_FALLBACKS
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# When the client last wrote. A plain cookie rather than the signed session,
+# so every worker reads it whatever its SECRET_KEY; forging it only moves the
+# client's own reads to the primary.
+WROTE_AT_COOKIE = 'fyyur_wrote_at'
+
+
+class Replicas(object):
+    """ Round-robin over the replica binds, skipping those that failed to
+    connect in the last `retry_seconds`."""
+
+    def __init__(self, keys, retry_seconds=30):
+        self.keys = list(keys)
+        self.retry_seconds = retry_seconds
+        self._next = itertools.cycle(self.keys)
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def pick(self):
+        now = time.monotonic()
+        with self._lock:
+            for _ in self.keys:
+                key = next(self._next)
+                if self._down_until.get(key, 0) <= now:
+                    return key
+        return None
+
+    def mark_down(self, key):
+        with self._lock:
+            self._down_until[key] = time.monotonic() + self.retry_seconds
+
+
+class RoutingSession(Session):
+    """ Reads go to the replica picked for the current request, if any.
+    Flushes, INSERT/UPDATE/DELETE and anything outside a request go to the
+    primary."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        key = g.get('_replica') if has_app_context() else None
+        if bind is None and key and not self._flushing \
+                and not isinstance(clause, UpdateBase):
+            engine = self._replica_engine(key)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+    def _replica_engine(self, key):
+        engine = self._db.engines[key]
+        if self.info.get('replica') != key:
+            # Check out the connection the request will read on; if the
+            # replica is down, read from the primary until it has had
+            # REPLICA_RETRY_SECONDS to recover.
+            try:
+                self.connection(bind_arguments={'bind': engine})
+            except DBAPIError:
+                current_app.extensions['replicas'].mark_down(key)
+                current_app.logger.warning('Replica %s is unavailable', key,
+                                           exc_info=True)
+                REPLICA_FALLBACKS.inc(key)
+                g._replica = None
+                return None
+            self.info['replica'] = key
+        return engine
+
+
+def _wrote_at():
+    try:
+        return float(request.cookies.get(WROTE_AT_COOKIE, 0))
+    except ValueError:
+        return 0
+
+
+def createReplicas(app):
+    """ Spreads safe requests over the SQLALCHEMY_BINDS named replica_*.
+    A client that wrote keeps reading from the primary for
+    REPLICA_STICKY_SECONDS, so it sees its own changes despite replica lag,
+    on whichever worker serves it."""
+    keys = sorted(key for key in app.config['SQLALCHEMY_BINDS']
+                  if key.startswith('replica_'))
+    if not keys:
+        return None
+    replicas = app.extensions['replicas'] = Replicas(
+        keys, app.config['REPLICA_RETRY_SECONDS'])
+    sticky = app.config['REPLICA_STICKY_SECONDS']
+
+    @app.before_request
+    def choose_replica():
+        if request.method in SAFE_METHODS and _wrote_at() + sticky <= time.time():
+            g._replica = replicas.pick()
+
+    @app.after_request
+    def remember_write(response):
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(WROTE_AT_COOKIE, '{:.3f}'.format(time.time()),
+                                max_age=sticky, httponly=True, samesite='Lax')
+        return response
+
+    return replicas
@@ -0,0 +1,165 @@
+from collections import Counter, defaultdict
+from datetime import date
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Venue, Artist, performances, VenueMonthShows, \
+    ArtistBookings, GenreDemand
+
+# Rollup table -> its key columns; every rollup counts shows.
+KEYS = {
+    VenueMonthShows: ('venue_id', 'month'),
+    ArtistBookings: ('artist_id',),
+    GenreDemand: ('state', 'genre'),
+}
+
+
+def month_of(start_time):
+    return date(start_time.year, start_time.month, 1)
+
+
+def contributions(venue_id, artist_id, start_time, state, genres):
+    """ The (rollup, key) pairs one show counts towards."""
+    keys = [(VenueMonthShows, (venue_id, month_of(start_time))),
+            (ArtistBookings, (artist_id,))]
+    keys += [(GenreDemand, (state or '', genre)) for genre in set(genres or [])]
+    return keys
+
+
+def apply_deltas(connection, deltas):
+    """ Adds `deltas`, a Counter of (rollup, key) -> change in shows, to the
+    rollup tables inside the caller's transaction."""
+    rows = defaultdict(list)
+    for (model, key), change in deltas.items():
+        if change:
+            rows[model].append(dict(zip(KEYS[model], key), shows=change))
+    dialect = postgresql if connection.dialect.name == 'postgresql' else sqlite
+    for model, model_rows in rows.items():
+        table = model.__table__
+        statement = dialect.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(KEYS[model]),
+            set_={'shows': table.c.shows + statement.excluded['shows']})
+        connection.execute(statement, model_rows)
+
+
+def record_shows(connection, rows, sign=1):
+    """ Counts show rows (dicts with venue_id, artist_id and start_time) in,
+    or with sign=-1 out of, the rollups."""
+    if not rows:
+        return
+    states = dict(connection.execute(
+        select(Venue.id, Venue.state)
+        .where(Venue.id.in_({row['venue_id'] for row in rows}))).all())
+    genres = dict(connection.execute(
+        select(Artist.id, Artist.genres)
+        .where(Artist.id.in_({row['artist_id'] for row in rows}))).all())
+    deltas = Counter()
+    for row in rows:
+        for key in contributions(row['venue_id'], row['artist_id'], row['start_time'],
+                                 states.get(row['venue_id']), genres.get(row['artist_id'])):
+            deltas[key] += sign
+    apply_deltas(connection, deltas)
+
+
+def remove_venue(connection, venue_id):
+    """ Takes the venue's shows out of the rollups; call before deleting
+    them and the venue."""
+    shows = connection.execute(
+        select(performances.c.venue_id, performances.c.artist_id,
+               performances.c.start_time)
+        .where(performances.c.venue_id == venue_id)).mappings().all()
+    record_shows(connection, shows, -1)
+
+
+def _old_value(target, key):
+    history = inspect(target).attrs[key].history
+    return history.deleted[0] if history.deleted else getattr(target, key)
+
+
+def _venue_moved(mapper, connection, target):
+    # A venue changing state moves its shows' genre demand along with it.
+    old_state = _old_value(target, 'state')
+    if old_state == target.state:
+        return
+    deltas = Counter()
+    rows = connection.execute(
+        select(Artist.genres, func.count())
+        .select_from(performances.join(Artist, performances.c.artist_id == Artist.id))
+        .where(performances.c.venue_id == target.id).group_by(Artist.id))
+    for genres, shows in rows:
+        for genre in set(genres or []):
+            deltas[GenreDemand, (old_state or '', genre)] -= shows
+            deltas[GenreDemand, (target.state or '', genre)] += shows
+    apply_deltas(connection, deltas)
+
+
+def _artist_regenred(mapper, connection, target):
+    old_genres = set(_old_value(target, 'genres') or [])
+    new_genres = set(target.genres or [])
+    if old_genres == new_genres:
+        return
+    deltas = Counter()
+    rows = connection.execute(
+        select(Venue.state, func.count())
+        .select_from(performances.join(Venue, performances.c.venue_id == Venue.id))
+        .where(performances.c.artist_id == target.id).group_by(Venue.state))
+    for state, shows in rows:
+        for genre in old_genres:
+            deltas[GenreDemand, (state or '', genre)] -= shows
+        for genre in new_genres:
+            deltas[GenreDemand, (state or '', genre)] += shows
+    apply_deltas(connection, deltas)
+
+
+event.listen(Venue, 'after_update', _venue_moved)
+event.listen(Artist, 'after_update', _artist_regenred)
+
+
+def rebuild():
+    """ Recomputes every rollup from the shows in one transaction."""
+    with db.engine.begin() as connection:
+        for model in KEYS:
+            connection.execute(model.__table__.delete())
+        deltas = Counter()
+        rows = connection.execution_options(yield_per=1000).execute(
+            select(performances.c.venue_id, performances.c.artist_id,
+                   performances.c.start_time, Venue.state, Artist.genres)
+            .select_from(performances
+                         .join(Venue, performances.c.venue_id == Venue.id)
+                         .join(Artist, performances.c.artist_id == Artist.id)))
+        for row in rows:
+            deltas.update(contributions(*row))
+        apply_deltas(connection, deltas)
+
+
+#  Reports
+#  ----------------------------------------------------------------
+
+def venue_months(month, limit):
+    """ The venues with the most shows in `month`."""
+    return db.session.query(VenueMonthShows.venue_id, Venue.name,
+                            VenueMonthShows.shows)\
+        .join(Venue, VenueMonthShows.venue_id == Venue.id)\
+        .filter(VenueMonthShows.month == month, VenueMonthShows.shows > 0)\
+        .order_by(VenueMonthShows.shows.desc(), VenueMonthShows.venue_id)\
+        .limit(limit).all()
+
+
+def top_artists(limit):
+    return db.session.query(ArtistBookings.artist_id, Artist.name,
+                            ArtistBookings.shows)\
+        .join(Artist, ArtistBookings.artist_id == Artist.id)\
+        .filter(ArtistBookings.shows > 0)\
+        .order_by(ArtistBookings.shows.desc(), ArtistBookings.artist_id)\
+        .limit(limit).all()
+
+
+def genre_demand(state=None):
+    query = db.session.query(GenreDemand.state, GenreDemand.genre, GenreDemand.shows)\
+        .filter(GenreDemand.shows > 0)
+    if state:
+        query = query.filter(GenreDemand.state == state)
+    return query.order_by(GenreDemand.shows.desc(), GenreDemand.state,
+                          GenreDemand.genre).all()
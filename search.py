@@ -0,0 +1,425 @@
+import bisect
+import heapq
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event, func, or_, select
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Venue, Artist, performances
+
+
+# ----------------------------------------------------------------------------#
+# Trigram index (SQLite / non-Postgres fallback).
+# ----------------------------------------------------------------------------#
+
+def trigrams(text):
+    text = '  ' + (text or '').lower() + ' '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex(object):
+    """ In-process inverted index from trigrams to entity ids."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """ Empties the index; it is reloaded on next use."""
+        self.documents = {}
+        self.postings = defaultdict(set)
+        self.loaded_at = None
+
+    def add(self, entity_id, document):
+        with self.lock:
+            self._remove(entity_id)
+            self.documents[entity_id] = document
+            for gram in trigrams(document):
+                self.postings[gram].add(entity_id)
+
+    def remove(self, entity_id):
+        with self.lock:
+            self._remove(entity_id)
+
+    def _remove(self, entity_id):
+        document = self.documents.pop(entity_id, None)
+        if document is None:
+            return
+        for gram in trigrams(document):
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(entity_id)
+                if not ids:
+                    del self.postings[gram]
+
+    def search(self, term):
+        term = term.lower().strip()
+        with self.lock:
+            if not term:
+                return list(self.documents)
+            grams = trigrams(term)
+            if len(term) < 3:
+                candidates = set(self.documents)
+            else:
+                # Only inner trigrams are guaranteed to appear in a substring match.
+                inner = {term[i:i + 3] for i in range(len(term) - 2)}
+                posting_lists = sorted((self.postings.get(g, set()) for g in inner),
+                                       key=len)
+                candidates = set(posting_lists[0])
+                for ids in posting_lists[1:]:
+                    candidates &= ids
+            documents = {entity_id: self.documents[entity_id] for entity_id in candidates}
+        scored = []
+        for entity_id, document in documents.items():
+            if term not in document:
+                continue
+            doc_grams = trigrams(document)
+            score = len(grams & doc_grams) / float(len(grams | doc_grams))
+            scored.append((-score, entity_id))
+        scored.sort()
+        return [entity_id for _, entity_id in scored]
+
+
+_indexes = {Venue: TrigramIndex(), Artist: TrigramIndex()}
+
+
+def _get_index(model):
+    """ The model's index, reloaded when empty or older than
+    SEARCH_INDEX_MAX_AGE seconds, which picks up other workers' writes."""
+    index = _indexes[model]
+    if index.loaded_at is None or time.monotonic() - index.loaded_at > \
+            current_app.config['SEARCH_INDEX_MAX_AGE']:
+        fresh = TrigramIndex()
+        for row in db.session.query(model.id, model.search_document):
+            fresh.add(row.id, row.search_document or '')
+        fresh.loaded_at = time.monotonic()
+        index = _indexes[model] = fresh
+    return index
+
+
+def clear_indexes(*models):
+    """ Drops this process's indexes of `models` (default all), for writes
+    in it that bypass the ORM such as bulk deletes."""
+    for model in models or _indexes:
+        _indexes[model].clear()
+
+
+# Changes flushed in a transaction are applied to the indexes only once it
+# commits, so a rolled back create or edit never shows up in results.
+
+def _pending(session):
+    return session.info.setdefault('search_pending', [])
+
+
+def _index_entity(mapper, connection, target):
+    _pending(object_session(target)).append(
+        (type(target), target.id, target.search_document or ''))
+
+
+def _unindex_entity(mapper, connection, target):
+    _pending(object_session(target)).append((type(target), target.id, None))
+
+
+def _apply_pending(session):
+    for model, entity_id, document in session.info.pop('search_pending', []):
+        index = _indexes[model]
+        if index.loaded_at is None:
+            continue
+        if document is None:
+            index.remove(entity_id)
+        else:
+            index.add(entity_id, document)
+
+
+def _discard_pending(session, *args):
+    session.info.pop('search_pending', None)
+
+
+def _reset_index(delete_context):
+    # Bulk deletes (e.g. delete_venue) bypass mapper events; rebuild lazily.
+    if delete_context.mapper.class_ in _indexes:
+        clear_indexes(delete_context.mapper.class_)
+
+
+for _model in _indexes:
+    event.listen(_model, 'after_insert', _index_entity)
+    event.listen(_model, 'after_update', _index_entity)
+    event.listen(_model, 'after_delete', _unindex_entity)
+event.listen(Session, 'after_commit', _apply_pending)
+event.listen(Session, 'after_rollback', _discard_pending)
+event.listen(Session, 'after_bulk_delete', _reset_index)
+
+
+# ----------------------------------------------------------------------------#
+# Prefix index (autocomplete).
+# ----------------------------------------------------------------------------#
+
+# Prefixes matching more entries than this keep their suggestions until the
+# next change, so one-letter prefixes do not rank thousands of entities.
+MEMO_THRESHOLD = 256
+MEMO_SIZE = 1024
+
+
+def prefix_keys(name, city, state):
+    """ The lowercased strings an entity is suggested for prefixes of: its
+    name from the start of each word, its city and its state."""
+    words = (name or '').lower().split()
+    keys = {' '.join(words[i:]) for i in range(len(words))}
+    keys.update(place.lower() for place in (city, state) if place)
+    return keys
+
+
+def _successor(prefix):
+    """ The first string after every string starting with `prefix`, or None
+    if there is none (it ends in the last code point only)."""
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class PrefixIndex(object):
+    """ In-process sorted array of (key, kind, id) entries, searched with
+    bisect. Suggestions are ranked by upcoming show count, then name.
+    Changes and lookups hold the lock, as a change updates both the
+    entities and the entries."""
+
+    def __init__(self, entities=()):
+        self.lock = threading.Lock()
+        # (kind, id) -> [name, city, state, upcoming shows]
+        self.entities = {(kind, entity_id): [name, city, state, upcoming]
+                         for kind, entity_id, name, city, state, upcoming in entities}
+        self.entries = sorted((key, kind, entity_id)
+                              for (kind, entity_id), entity in self.entities.items()
+                              for key in prefix_keys(*entity[:3]))
+        self.memo = {}
+        self.loaded_at = time.monotonic()
+
+    def add(self, kind, entity_id, name, city, state):
+        with self.lock:
+            old = self.entities.get((kind, entity_id))
+            self._remove(kind, entity_id)
+            self.entities[kind, entity_id] = [name, city, state, old[3] if old else 0]
+            for key in prefix_keys(name, city, state):
+                bisect.insort(self.entries, (key, kind, entity_id))
+            self.memo.clear()
+
+    def remove(self, kind, entity_id):
+        with self.lock:
+            self._remove(kind, entity_id)
+
+    def _remove(self, kind, entity_id):
+        old = self.entities.pop((kind, entity_id), None)
+        if old is None:
+            return
+        for key in prefix_keys(*old[:3]):
+            i = bisect.bisect_left(self.entries, (key, kind, entity_id))
+            if i < len(self.entries) and self.entries[i] == (key, kind, entity_id):
+                del self.entries[i]
+        self.memo.clear()
+
+    def booked(self, kind, entity_id):
+        with self.lock:
+            entity = self.entities.get((kind, entity_id))
+            if entity is not None:
+                entity[3] += 1
+                self.memo.clear()
+
+    def suggest(self, prefix, limit, kind=None):
+        """ The `limit` best (kind, id, name, city, state, upcoming shows)
+        whose name, city or state starts with `prefix`."""
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+        memo_key = (prefix, limit, kind)
+        successor = _successor(prefix)
+        with self.lock:
+            if memo_key in self.memo:
+                return self.memo[memo_key]
+            low = bisect.bisect_left(self.entries, (prefix,))
+            high = len(self.entries) if successor is None else \
+                bisect.bisect_left(self.entries, (successor,), low)
+            matched = {(entry_kind, entity_id)
+                       for _, entry_kind, entity_id in self.entries[low:high]
+                       if kind is None or entry_kind == kind}
+            entities = self.entities
+            best = heapq.nsmallest(limit, matched, key=lambda entity: (
+                -entities[entity][3], entities[entity][0].lower(), entity))
+            suggestions = [entity + tuple(entities[entity]) for entity in best]
+            if high - low > MEMO_THRESHOLD:
+                if len(self.memo) >= MEMO_SIZE:
+                    self.memo.clear()
+                self.memo[memo_key] = suggestions
+        return suggestions
+
+
+_kinds = {Venue: 'venue', Artist: 'artist'}
+_autocomplete = None
+
+
+def _load_autocomplete():
+    now = datetime.now()
+    entities = []
+    for model, kind in _kinds.items():
+        statement = select(model.id, model.name, model.city, model.state,
+                           _upcoming_count(now))\
+            .outerjoin(performances, _show_columns[model] == model.id)\
+            .group_by(model.id, model.name, model.city, model.state)
+        entities += [(kind, *row) for row in db.session.execute(statement)]
+    return PrefixIndex(entities)
+
+
+def _get_autocomplete():
+    global _autocomplete
+    index = _autocomplete
+    if index is None or time.monotonic() - index.loaded_at > \
+            current_app.config['AUTOCOMPLETE_MAX_AGE']:
+        index = _autocomplete = _load_autocomplete()
+    return index
+
+
+def autocomplete(prefix, limit, kind=None):
+    """ Venues and/or artists whose name (from any word), city or state
+    starts with `prefix`, most upcoming shows first."""
+    return _get_autocomplete().suggest(prefix, limit, kind)
+
+
+def autocomplete_booked(venue_id, artist_id, start_time):
+    """ Counts a newly committed show towards its venue and artist."""
+    if _autocomplete is not None and start_time > datetime.now():
+        _autocomplete.booked('venue', venue_id)
+        _autocomplete.booked('artist', artist_id)
+
+
+# As with the trigram index, flushed changes are queued and applied only
+# once their transaction commits.
+
+def _autocomplete_pending(session):
+    return session.info.setdefault('autocomplete_pending', [])
+
+
+def _autocomplete_add(mapper, connection, target):
+    _autocomplete_pending(object_session(target)).append(
+        (_kinds[type(target)], target.id, (target.name, target.city, target.state)))
+
+
+def _autocomplete_remove(mapper, connection, target):
+    _autocomplete_pending(object_session(target)).append(
+        (_kinds[type(target)], target.id, None))
+
+
+def _apply_autocomplete(session):
+    pending = session.info.pop('autocomplete_pending', [])
+    index = _autocomplete
+    if index is None:
+        return
+    for kind, entity_id, fields in pending:
+        if fields is None:
+            index.remove(kind, entity_id)
+        else:
+            index.add(kind, entity_id, *fields)
+
+
+def _discard_autocomplete(session, *args):
+    session.info.pop('autocomplete_pending', None)
+
+
+def _reset_autocomplete(delete_context):
+    # Bulk deletes also take show counts with them; reload on next use.
+    global _autocomplete
+    if delete_context.mapper.class_ in _kinds:
+        _autocomplete = None
+
+
+for _model in _kinds:
+    event.listen(_model, 'after_insert', _autocomplete_add)
+    event.listen(_model, 'after_update', _autocomplete_add)
+    event.listen(_model, 'after_delete', _autocomplete_remove)
+event.listen(Session, 'after_commit', _apply_autocomplete)
+event.listen(Session, 'after_rollback', _discard_autocomplete)
+event.listen(Session, 'after_bulk_delete', _reset_autocomplete)
+
+
+# ----------------------------------------------------------------------------#
+# Search.
+# ----------------------------------------------------------------------------#
+
+_show_columns = {
+    Venue: performances.c.venue_id,
+    Artist: performances.c.artist_id,
+}
+
+
+def _upcoming_count(now):
+    return func.count(performances.c.id).filter(
+        performances.c.start_time > now).label('num_upcoming_shows')
+
+
+def _is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def _fulltext_query(model, term, limit, offset):
+    """ (statement, match): a page of ranked matches with their upcoming
+    show counts, and the match condition for counting them all."""
+    document = model.search_document
+    vector = func.to_tsvector('simple', document)
+    query = func.plainto_tsquery('simple', term)
+    rank = func.ts_rank(vector, query) + func.similarity(document, term.lower())
+    match = or_(vector.op('@@')(query), document.icontains(term, autoescape=True))
+    matched = select(model.id, model.name, rank.label('rank'),
+                     func.count().over().label('total'))\
+        .where(match)\
+        .order_by(rank.desc(), model.id)\
+        .limit(limit).offset(offset).subquery()
+    # Upcoming shows are counted only for the page of matched ids.
+    statement = select(matched.c.id, matched.c.name, matched.c.total,
+                       _upcoming_count(datetime.now()))\
+        .outerjoin(performances, _show_columns[model] == matched.c.id)\
+        .group_by(matched.c.id, matched.c.name, matched.c.total, matched.c.rank)\
+        .order_by(matched.c.rank.desc(), matched.c.id)
+    return statement, match
+
+
+def _fulltext_search(model, term, limit, offset):
+    statement, match = _fulltext_query(model, term, limit, offset)
+    rows = db.session.execute(statement).all()
+    if rows:
+        return rows[0].total, rows
+    if offset:
+        # Past the last page the window count has no row to ride on.
+        return db.session.scalar(
+            select(func.count()).select_from(model).where(match)), rows
+    return 0, rows
+
+
+def _trigram_page_query(model, page_ids):
+    return select(model.id, model.name, _upcoming_count(datetime.now()))\
+        .outerjoin(performances, _show_columns[model] == model.id)\
+        .where(model.id.in_(page_ids))\
+        .group_by(model.id, model.name)
+
+
+def _trigram_search(model, term, limit, offset):
+    ids = _get_index(model).search(term)
+    page_ids = ids[offset:offset + limit]
+    if not page_ids:
+        return len(ids), []
+    rows = {row.id: row for row in
+            db.session.execute(_trigram_page_query(model, page_ids))}
+    return len(ids), [rows[entity_id] for entity_id in page_ids
+                      if entity_id in rows]
+
+
+def search(model, term, page=1, per_page=20):
+    """ Returns (total, rows) for one page of ranked matches; rows carry
+    id, name and num_upcoming_shows."""
+    offset = (page - 1) * per_page
+    if _is_postgres():
+        return _fulltext_search(model, term, per_page, offset)
+    return _trigram_search(model, term, per_page, offset)
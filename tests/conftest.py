@@ -0,0 +1,47 @@
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+# The app reads its configuration on import, so point it at a scratch
+# SQLite database before anything imports it.
+_directory = tempfile.mkdtemp(prefix='fyyur-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_directory, 'fyyur.db')
+os.environ['LOG_FILE'] = os.path.join(_directory, 'error.log')
+os.environ['ASYNC_VIEWS'] = '0'
+
+VENUES = 20
+ARTISTS = 40
+SHOWS = 400
+
+
+@pytest.fixture(scope='session')
+def app():
+    """ The app on a database seeded like the benchmarks, at a smaller
+    scale: the same --seed always gives the same rows."""
+    from app import app
+    from benchmarks import seed
+    from enums import Genre
+    from models import db, Venue, Artist, performances, search_document
+    import recommendations
+
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    rng = random.Random(0)
+    genres = [genre.value for genre in Genre]
+    anchor = datetime.now().replace(minute=0, second=0, microsecond=0)
+    with app.app_context():
+        db.create_all()
+        seed.load('venues', Venue, seed.venues(rng, VENUES, genres, search_document), 1000)
+        seed.load('artists', Artist, seed.artists(rng, ARTISTS, genres, search_document), 1000)
+        seed.load('shows', performances, seed.shows(
+            rng, SHOWS, (1, VENUES), (1, ARTISTS), anchor,
+            timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])), 1000)
+        recommendations.rebuild()
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
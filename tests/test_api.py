@@ -0,0 +1,64 @@
+from datetime import datetime
+
+from sqlalchemy import func
+
+from models import db, Venue, Artist, performances
+
+
+def walk(client, path):
+    """ Every row of a paginated API list, following next_cursor."""
+    rows, cursor = [], None
+    while True:
+        page = client.get(path, query_string={'cursor': cursor} if cursor else {}).get_json()
+        rows.extend(page['data'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return rows
+
+
+def test_venue_pages_cover_every_venue_in_order(app, client):
+    rows = walk(client, '/api/v1/venues')
+    with app.app_context():
+        assert len(rows) == db.session.query(Venue).count()
+    keys = [(row['state'], row['city'], row['name'], row['id']) for row in rows]
+    assert keys == sorted(keys)
+
+
+def test_artist_and_show_pages_cover_every_row(app, client):
+    artists = walk(client, '/api/v1/artists')
+    shows = walk(client, '/api/v1/shows')
+    with app.app_context():
+        assert len({row['id'] for row in artists}) == db.session.query(Artist).count()
+        assert len({row['id'] for row in shows}) == \
+            db.session.query(func.count(performances.c.id)).scalar()
+
+
+def test_previous_page_returns_the_first(client):
+    first = client.get('/api/v1/shows').get_json()
+    second = client.get('/api/v1/shows', query_string={'cursor': first['next_cursor']}).get_json()
+    back = client.get('/api/v1/shows', query_string={'cursor': second['prev_cursor']}).get_json()
+    assert [row['id'] for row in back['data']] == [row['id'] for row in first['data']]
+
+
+def test_export_streams_every_show(app, client):
+    response = client.get('/api/v1/shows/export')
+    with app.app_context():
+        total = db.session.query(func.count(performances.c.id)).scalar()
+    assert len(response.get_data(as_text=True).splitlines()) == total
+
+
+def test_venue_details_split_shows_at_now(app, client):
+    venue = client.get('/api/v1/venues/1').get_json()
+    now = datetime.now()
+    with app.app_context():
+        upcoming = db.session.query(func.count(performances.c.id)).filter(
+            performances.c.venue_id == 1, performances.c.start_time > now).scalar()
+    assert venue['upcoming_shows_count'] == upcoming
+    assert all(show['start_time'] > now.isoformat() for show in venue['upcoming_shows'])
+    assert all(show['start_time'] <= now.isoformat() for show in venue['past_shows'])
+
+
+def test_unchanged_details_are_not_modified(client):
+    response = client.get('/api/v1/artists/1')
+    again = client.get('/api/v1/artists/1', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('asgiref')
+pytest.importorskip('greenlet')
+pytest.importorskip('aiosqlite')
+
+import aio
+import queries
+
+
+@pytest.fixture
+def async_views(app, monkeypatch):
+    """ The app serving the ASYNC_VIEWS=1 views, with an empty cache."""
+    import app as app_module
+    monkeypatch.setitem(app.view_functions, 'venues', app_module.venues_async)
+    monkeypatch.setitem(app.view_functions, 'show_venue', app_module.show_venue_async)
+    monkeypatch.setitem(app.view_functions, 'show_artist', app_module.show_artist_async)
+    app_module.cache.clear()
+    yield app
+    app_module.cache.clear()
+
+
+def test_check_requirements(app):
+    aio.check_requirements(app)
+
+
+def test_check_requirements_names_missing_driver(app, monkeypatch):
+    monkeypatch.setitem(aio.ASYNC_DRIVERS, 'sqlite', 'fyyur_missing_driver')
+    with pytest.raises(RuntimeError, match='fyyur_missing_driver'):
+        aio.check_requirements(app)
+
+
+@pytest.mark.parametrize('details, entity_id', [
+    ('venue_details', 1), ('venue_details', 2), ('artist_details', 1)])
+def test_async_details_match_sync(app, details, entity_id):
+    with app.test_request_context():
+        expected = getattr(queries, details)(entity_id)
+        actual = asyncio.run(getattr(queries, details + '_async')(entity_id))
+    assert actual == expected
+
+
+@pytest.mark.parametrize('path', [
+    '/venues', '/venues?genre=Jazz', '/venues?state=CA', '/venues/1', '/artists/1'])
+def test_async_views(async_views, path):
+    response = async_views.test_client().get(path)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('path', ['/venues/999999', '/artists/999999'])
+def test_async_views_not_found(async_views, path):
+    assert async_views.test_client().get(path).status_code == 404
+
+
+@pytest.mark.parametrize('path', ['/venues', '/venues?genre=Jazz', '/venues/1'])
+def test_async_pages_match_sync(app, path, monkeypatch):
+    import app as app_module
+    app_module.cache.clear()
+    sync = app.test_client().get(path).get_data(as_text=True)
+    monkeypatch.setitem(app.view_functions, 'venues', app_module.venues_async)
+    monkeypatch.setitem(app.view_functions, 'show_venue', app_module.show_venue_async)
+    app_module.cache.clear()
+    assert app.test_client().get(path).get_data(as_text=True) == sync
+
+
+def test_async_queries_reuse_pooled_connections(async_views):
+    import metrics
+    import pools
+    client = async_views.test_client()
+    client.get('/venues')
+    client.get('/venues/1')
+    pool = aio._engines[None].sync_engine.pool
+    assert isinstance(pool, pools.TimedAsyncQueuePool)
+    assert pool.checkedout() == 0 and 0 < pool.checkedin() <= pool.size()
+    assert 'async_primary' in metrics.render()
@@ -0,0 +1,111 @@
+import pytest
+from sqlalchemy import func
+
+import recommendations
+import rollups
+from models import db, Venue, performances, VenueMonthShows, ArtistBookings, GenreDemand, \
+    SimilarArtist
+
+
+def show_count(app, **filters):
+    with app.app_context():
+        query = db.session.query(func.count(performances.c.id))
+        for column, value in filters.items():
+            query = query.filter(getattr(performances.c, column) == value)
+        return query.scalar()
+
+
+def rollup_rows(app):
+    # Counts that dropped to zero stay behind as rows; the reports skip them.
+    with app.app_context():
+        return {model: sorted(tuple(row) for row in db.session.query(
+            *model.__table__.columns).filter(model.shows != 0))
+            for model in (VenueMonthShows, ArtistBookings, GenreDemand)}
+
+
+def similar_rows(app):
+    with app.app_context():
+        return db.session.query(SimilarArtist.artist_id, SimilarArtist.rank,
+                                SimilarArtist.similar_id, SimilarArtist.score)\
+            .order_by(SimilarArtist.artist_id, SimilarArtist.rank).all()
+
+
+def test_create_show_rejects_an_overlap(app, client):
+    show = {'venue_id': '1', 'artist_id': '1', 'start_time': '2031-03-01 20:00:00'}
+    before = show_count(app, venue_id=1)
+    response = client.post('/shows/create', data=show)
+    assert b'successfully listed' in response.data
+    response = client.post('/shows/create', data=dict(show, artist_id='2'))
+    assert b'already booked' in response.data
+    assert show_count(app, venue_id=1) == before + 1
+
+
+def test_batch_is_all_or_nothing(app, client):
+    residency = {'venue_id': 2, 'artist_id': 3, 'start_time': '2031-04-01 20:00:00',
+                 'frequency': 'weekly', 'occurrences': 4}
+    response = client.post('/shows/create/batch', json=residency)
+    assert response.status_code == 201 and response.get_json() == {'created': 4}
+
+    clashing = {'shows': [
+        {'venue_id': 2, 'artist_id': 4, 'start_time': '2031-05-01 20:00:00'},
+        {'venue_id': 2, 'artist_id': 4, 'start_time': '2031-04-08 20:00:00'},
+    ]}
+    before = show_count(app, venue_id=2)
+    response = client.post('/shows/create/batch', json=clashing)
+    assert response.status_code == 422
+    assert len(response.get_json()['rejects']) == 1
+    assert show_count(app, venue_id=2) == before
+
+
+def test_create_and_delete_venue(app, client):
+    profile = {'name': 'Test Venue', 'city': 'San Francisco', 'state': 'CA',
+               'address': '1 Test Way', 'phone': '415-555-0100', 'genres': ['Jazz'],
+               'facebook_link': 'https://www.facebook.com/test', 'image_link': '',
+               'website_link': '', 'seeking_description': ''}
+    response = client.post('/venues/create', data=profile)
+    assert b'successfully listed' in response.data
+    with app.app_context():
+        venue_id = db.session.query(func.max(Venue.id)).scalar()
+    client.post('/shows/create', data={'venue_id': str(venue_id), 'artist_id': '5',
+                                       'start_time': '2031-06-01 20:00:00'})
+    assert client.get('/venues/{}'.format(venue_id)).status_code == 200
+
+    response = client.delete('/venues/{}'.format(venue_id))
+    assert response.status_code == 302
+    assert client.get('/venues/{}'.format(venue_id)).status_code == 404
+    assert show_count(app, venue_id=venue_id) == 0
+
+
+def test_rollups_match_a_rebuild_after_writes(app, client):
+    client.post('/shows/create', data={'venue_id': '4', 'artist_id': '6',
+                                       'start_time': '2031-07-01 20:00:00'})
+    kept = rollup_rows(app)
+    with app.app_context():
+        rollups.rebuild()
+    assert rollup_rows(app) == kept
+
+
+def test_similar_artists_match_a_rebuild_after_a_booking(app, client):
+    with app.app_context():
+        recommendations.rebuild()
+    # The refresh runs once the response is closed, as the server does
+    # after sending it.
+    client.post('/shows/create', data={'venue_id': '7', 'artist_id': '8',
+                                       'start_time': '2031-08-01 20:00:00'}).close()
+    kept = similar_rows(app)
+    with app.app_context():
+        recommendations.rebuild()
+    rebuilt = similar_rows(app)
+    assert [row[:3] for row in kept] == [row[:3] for row in rebuilt]
+    assert [row.score for row in kept] == pytest.approx([row.score for row in rebuilt])
+
+
+def test_booking_stands_when_the_refresh_fails(app, client, monkeypatch):
+    def fail(artist_ids):
+        raise RuntimeError('refresh failed')
+    monkeypatch.setattr(recommendations, 'refresh', fail)
+    before = show_count(app, venue_id=9)
+    with client.post('/shows/create', data={'venue_id': '9', 'artist_id': '10',
+                                            'start_time': '2031-09-01 20:00:00'}) as response:
+        assert b'successfully listed' in response.data
+    assert show_count(app, venue_id=9) == before + 1
@@ -0,0 +1,58 @@
+from sqlalchemy import event, update
+
+from models import db, Venue
+
+STALE = 'was changed by someone else'
+
+
+def venue_form(venue, **changes):
+    data = {'name': venue.name, 'city': venue.city, 'state': venue.state,
+            'address': venue.address, 'phone': venue.phone,
+            'genres': venue.genres, 'facebook_link': 'https://facebook.com/fyyur',
+            'version': str(venue.version)}
+    data.update(changes)
+    return data
+
+
+def load_venue(app, venue_id):
+    with app.app_context():
+        venue = db.session.get(Venue, venue_id)
+        db.session.expunge(venue)
+        return venue
+
+
+def test_edit_venue_bumps_version(app, client):
+    venue = load_venue(app, 1)
+    response = client.post('/venues/1/edit', data=venue_form(venue, name='Renamed'),
+                           follow_redirects=True)
+    assert response.status_code == 200
+    assert b'successfully updated' in response.data
+    edited = load_venue(app, 1)
+    assert (edited.name, edited.version) == ('Renamed', venue.version + 1)
+
+
+def test_edit_from_an_outdated_form_is_refused(app, client):
+    venue = load_venue(app, 2)
+    client.post('/venues/2/edit', data=venue_form(venue, name='First'))
+    response = client.post('/venues/2/edit', data=venue_form(venue, name='Second'),
+                           follow_redirects=True)
+    assert STALE.encode() in response.data
+    assert load_venue(app, 2).name == 'First'
+
+
+def test_edit_overlapping_in_flight_is_refused(app, client):
+    venue = load_venue(app, 3)
+
+    def concurrent_edit(session, *args):
+        # Another worker commits between this request's read and its UPDATE.
+        with db.engine.begin() as connection:
+            connection.execute(update(Venue).where(Venue.id == 3)
+                               .values(name='Theirs', version=Venue.version + 1))
+
+    with app.app_context():
+        event.listen(db.session, 'before_flush', concurrent_edit, once=True)
+        response = client.post('/venues/3/edit', data=venue_form(venue, name='Mine'),
+                               follow_redirects=True)
+    assert response.status_code == 200
+    assert STALE.encode() in response.data
+    assert load_venue(app, 3).name == 'Theirs'
@@ -0,0 +1,89 @@
+import json
+import logging
+import os
+import time
+
+import pytest
+
+import queries
+from logs import DroppingQueueHandler, RateLimitFilter, SamplingFilter
+
+
+def read_entries(path, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.path.exists(path):
+            with open(path) as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            if entries:
+                return entries
+        time.sleep(0.05)
+    return []
+
+
+def test_app_records_are_written_as_json(app):
+    app.logger.warning('Logging test', extra={'case': 'json'})
+    entries = [entry for entry in read_entries(app.config['LOG_FILE'])
+               if entry.get('case') == 'json']
+    assert entries and entries[0]['message'] == 'Logging test'
+    assert entries[0]['logger'] == app.logger.name
+
+
+def test_root_logger_is_left_alone(app):
+    root = logging.getLogger()
+    assert not any(isinstance(handler, DroppingQueueHandler) for handler in root.handlers)
+    assert any(isinstance(handler, DroppingQueueHandler)
+               for handler in logging.getLogger('queries').handlers)
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.fixture
+def queries_log():
+    """ The debug records of the queries logger that pass its filters."""
+    logger = logging.getLogger('queries')
+    level = logger.level
+    handler = Records()
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    yield logger, handler.records
+    logger.setLevel(level)
+    logger.removeHandler(handler)
+
+
+def logger_filter(logger, kind):
+    return next(f for f in logger.filters if isinstance(f, kind))
+
+
+def test_query_records_are_sampled(app, queries_log, monkeypatch):
+    logger, records = queries_log
+    sampling = logger_filter(logger, SamplingFilter)
+    monkeypatch.setattr(logger_filter(logger, RateLimitFilter), 'per_second', 10 ** 6)
+    with app.app_context():
+        monkeypatch.setattr(sampling, 'rate', 1)
+        queries.venue_details(1)
+        queries.artist_past_shows(1)
+        assert [record.levelno for record in records] == [logging.DEBUG] * 2
+        assert records[0].upcoming_shows >= 0 and records[1].past_shows >= 0
+        monkeypatch.setattr(sampling, 'rate', 0)
+        queries.venue_details(1)
+    assert len(records) == 2
+
+
+def test_rate_limit_only_drops_records_below_warning(app, queries_log, monkeypatch):
+    logger, records = queries_log
+    monkeypatch.setattr(logger_filter(logger, SamplingFilter), 'rate', 1)
+    limit = logger_filter(logger, RateLimitFilter)
+    monkeypatch.setattr(limit, 'per_second', 0)
+    monkeypatch.setattr(limit, 'tokens', 0)
+    with app.app_context():
+        queries.venue_details(1)
+    logger.error('Query failed')
+    assert [record.levelno for record in records] == [logging.ERROR]
@@ -0,0 +1,14 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+
+def test_failed_statements_leave_no_start_time(app):
+    with app.app_context():
+        with db.engine.connect() as connection:
+            with pytest.raises(OperationalError):
+                connection.execute(text('SELECT * FROM no_such_table'))
+            connection.execute(text('SELECT 1'))
+            assert connection.connection.info.get('query_started') == []
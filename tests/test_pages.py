@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+from benchmarks.run import Context, ROUTES
+from conftest import ARTISTS, VENUES
+
+READS = [(name, method, build) for name, method, build, writes in ROUTES if not writes]
+
+
+@pytest.mark.parametrize('name,method,build', READS, ids=[read[0] for read in READS])
+def test_benchmark_reads(client, name, method, build):
+    context = Context(random.Random(name), list(range(1, VENUES + 1)),
+                      list(range(1, ARTISTS + 1)))
+    path, data = build(context)
+    response = client.open(path, method=method, data=data)
+    assert response.status_code == 200, response.data[:500]
+
+
+@pytest.mark.parametrize('path', [
+    '/venues/999999', '/artists/999999', '/api/v1/venues/999999', '/api/v1/artists/999999',
+    '/venues/999999/past-shows', '/artists/999999/past-shows',
+    '/api/v1/venues/999999/past_shows', '/api/v1/artists/999999/past_shows'])
+def test_missing_entities_are_404(client, path):
+    assert client.get(path).status_code == 404
+
+
+def test_search_finds_by_name(app, client):
+    from models import Venue
+    with app.app_context():
+        name = Venue.query.order_by(Venue.id).first().name
+    response = client.post('/venues/search', data={'search_term': name.lower()})
+    assert response.status_code == 200
+    assert name.encode() in response.data
+
+
+def test_autocomplete(client):
+    response = client.get('/autocomplete?q=san&type=venue')
+    assert response.status_code == 200
+    suggestions = response.get_json()['data']
+    assert suggestions and all(s['type'] == 'venue' for s in suggestions)
+    assert all('san' in ' '.join([s['name'], s['city'], s['state']]).lower()
+               for s in suggestions)
+    assert client.get('/autocomplete?q=san&type=nope').status_code == 400
+
+    # The last code point has no successor to bound the prefix range.
+    assert client.get('/autocomplete?q=%F4%8F%BF%BF').status_code == 200
+
+
+def test_autocomplete_sees_only_committed_changes(app, client):
+    from models import db, Venue
+
+    def suggested(prefix):
+        response = client.get('/autocomplete', query_string={'q': prefix})
+        return [s['name'] for s in response.get_json()['data']]
+
+    suggested('z')
+    with app.app_context():
+        venue = db.session.get(Venue, 3)
+        name = venue.name
+        venue.name = 'Zzyzx Rolled Back'
+        db.session.flush()
+        db.session.rollback()
+        assert suggested('zzyzx') == []
+        venue = db.session.get(Venue, 3)
+        venue.name = 'Zzyzx Committed'
+        db.session.flush()
+        assert suggested('zzyzx') == []
+        db.session.commit()
+        assert suggested('zzyzx') == ['Zzyzx Committed']
+        venue = db.session.get(Venue, 3)
+        venue.name = name
+        db.session.commit()
@@ -0,0 +1,19 @@
+from sqlalchemy import select
+
+import query_plans
+from models import db, Venue
+
+
+def test_hot_queries_use_their_indexes(app):
+    with app.app_context():
+        results = query_plans.check_plans()
+    assert results
+    failed = ['{} ({}):\n{}'.format(name, ', '.join(indexes), plan)
+              for name, indexes, plan, ok in results if not ok]
+    assert not failed, '\n'.join(failed)
+
+
+def test_a_plan_without_the_index_fails(app):
+    with app.app_context(), db.engine.connect() as connection:
+        plan = query_plans.explain(connection, select(Venue.id).where(Venue.phone == 'x'))
+        assert not query_plans.uses(connection, plan, 'ix_venue_area')
@@ -0,0 +1,37 @@
+import os
+
+from flask import Flask, g
+
+from replicas import WROTE_AT_COOKIE, createReplicas
+
+
+def worker():
+    """ A minimal app with one replica and a key of its own, like a worker
+    process started without SECRET_KEY."""
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY=os.urandom(32), REPLICA_STICKY_SECONDS=10,
+                      REPLICA_RETRY_SECONDS=30,
+                      SQLALCHEMY_BINDS={'replica_0': 'sqlite://'})
+    createReplicas(app)
+    app.add_url_rule('/read', 'read', lambda: g.get('_replica') or 'primary')
+    app.add_url_rule('/write', 'write', lambda: 'ok', methods=['POST'])
+    return app
+
+
+def test_reads_go_to_a_replica():
+    assert worker().test_client().get('/read').text == 'replica_0'
+
+
+def test_reads_after_a_write_stay_on_the_primary_on_any_worker():
+    first, second = worker().test_client(), worker().test_client()
+    first.post('/write')
+    cookie = first.get_cookie(WROTE_AT_COOKIE)
+    assert first.get('/read').text == 'primary'
+    second.set_cookie(WROTE_AT_COOKIE, cookie.value)
+    assert second.get('/read').text == 'primary'
+
+
+def test_a_garbled_cookie_reads_from_a_replica():
+    client = worker().test_client()
+    client.set_cookie(WROTE_AT_COOKIE, 'soon')
+    assert client.get('/read').text == 'replica_0'
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import bookings
+from models import db, performances
+
+START = datetime(2032, 1, 10, 20)
+
+
+def row(venue_id, start, hours=2):
+    return {'venue_id': venue_id, 'artist_id': 1, 'start_time': start,
+            'end_time': start + timedelta(hours=hours)}
+
+
+def test_schedule_finds_the_neighbouring_clash():
+    schedule = bookings.Schedule([(START, START + timedelta(hours=2)),
+                                  (START + timedelta(hours=4), START + timedelta(hours=6))])
+    assert schedule.conflict(START + timedelta(hours=1), START + timedelta(hours=3)) == \
+        (START, START + timedelta(hours=2))
+    assert schedule.conflict(START + timedelta(hours=2), START + timedelta(hours=4)) is None
+    schedule.remove(START, START + timedelta(hours=2))
+    assert schedule.conflict(START, START + timedelta(hours=1)) is None
+
+
+def test_rolled_back_reservations_are_released(app):
+    with app.app_context():
+        valid, rejects = bookings.check_bookings([row(7, START)])
+        assert valid and not rejects
+        db.session.rollback()
+        valid, rejects = bookings.check_bookings([row(7, START)])
+        assert valid and not rejects
+        db.session.close()
+        # Closing without a commit releases them too.
+        valid, rejects = bookings.check_bookings([row(7, START)])
+        assert valid and not rejects
+        db.session.rollback()
+
+
+def test_committed_reservations_are_kept(app):
+    with app.app_context():
+        valid, _ = bookings.check_bookings([row(8, START)])
+        db.session.execute(performances.insert(), valid)
+        db.session.commit()
+        try:
+            valid, rejects = bookings.check_bookings([row(8, START + timedelta(hours=1))])
+            assert not valid and len(rejects) == 1
+            db.session.rollback()
+        finally:
+            # Leave the shared database, and the venue's cached schedule,
+            # as the other tests expect them.
+            db.session.execute(performances.delete().where(
+                performances.c.venue_id == 8, performances.c.start_time == START))
+            db.session.commit()
+            bookings._schedules.pop(8, None)
+
+
+def test_end_time_defaults_to_the_show_length(app):
+    with app.app_context():
+        db.session.execute(performances.insert().values(
+            venue_id=9, artist_id=1, start_time=START))
+        end_time = db.session.query(performances.c.end_time).filter(
+            performances.c.venue_id == 9, performances.c.start_time == START).scalar()
+        db.session.rollback()
+    assert end_time == START + timedelta(minutes=app.config['SHOW_DURATION_MINUTES'])